@@ -3,6 +3,8 @@ import os
 from netmalies.settings import BASE_DIR
 
 EXAMPLE_ROOT = os.path.join(BASE_DIR, 'examples', 'scenario_4')
+# Root of the MSNM sensor code, to read its output stores (msnm.modules.store)
+MSNM_ROOT = os.path.dirname(BASE_DIR)
 MONITORING_ROOT = os.path.join('data', 'monitoring', 'output')
 GRAPH_SIZE = 100
 SYNC_SECONDS = 60
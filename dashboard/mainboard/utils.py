@@ -1,11 +1,17 @@
 import os
 import re
+import sys
 
 import numpy as np
 import pandas as pd
 import yaml
 
-from mainboard.config import EXAMPLE_ROOT, MONITORING_ROOT, SYNC_SECONDS
+from mainboard.config import EXAMPLE_ROOT, MONITORING_ROOT, MSNM_ROOT, SYNC_SECONDS
+
+if MSNM_ROOT not in sys.path:
+    sys.path.append(MSNM_ROOT)
+
+from msnm.modules.store.store import ObservationStore
 
 
 def update_context_data_network(context_data):
@@ -46,42 +52,26 @@ def update_context_data_network(context_data):
     return context_data
 
 
-def get_monitoring(sid, files):
-    # Contains the ts of each file encountered in the file system
-    d_range = []
-
-    # Data matrix from all monitoring files and statistics values involved
-    mon_data = np.empty((len(files), 4))
-
-    # Finding missing files
-    file_counter = 0
-    for i in files:
-        ts_file = i[7:][0:-4]
-        d_range.append(ts_file)
-
-        # Getting values
-        with open(os.path.join(EXAMPLE_ROOT, sid, MONITORING_ROOT, i)) as f:
-            control_limits = f.readline()
-            q_d_values = f.readline()
-
-        # Getting control limits values
-        control_limits = control_limits[1:]  # Removing '#' character
-        UCLq = control_limits.split(',')[0].split(':')[1]
-        UCLd = control_limits.split(',')[1].split(':')[1]
-        UCLd = UCLd.replace('\n', '')
+def get_monitoring(sid, size):
+    # Statistics (Q, D, UCLq, UCLd) saved by the sensor in its output store, one row per monitoring interval
+    path = os.path.join(EXAMPLE_ROOT, sid, MONITORING_ROOT)
+    d_range, mon_data = [], np.empty((0, 4))
 
-        # Getting Q and D values
-        Qst = q_d_values.split(',')[0]
-        Dst = q_d_values.split(',')[1]
-        Dst = Dst.replace('\n', '')
+    if os.path.exists(os.path.join(path, 'output.json')):
+        store = ObservationStore(path, 'output')
 
-        # All together
-        mon_data[file_counter, :] = np.array([Qst, Dst, UCLq, UCLd])
+        # Only the segments of the last days with enough rows are read
+        for day in reversed(store.days()):
+            d_range, mon_data = store.read(ts_from=day)
+            if len(d_range) >= size:
+                break
 
-        file_counter = file_counter + 1
+        # Last rows, the most recent first
+        d_range = d_range[::-1][:size]
+        mon_data = np.array(mon_data[::-1][:size])
 
     # Dataframe data
-    data = {'ts': d_range, 'files': files}
+    data = {'ts': d_range}
 
     # Create dataframe
     df = pd.DataFrame(data)
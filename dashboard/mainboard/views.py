@@ -8,7 +8,7 @@ from django.urls import reverse_lazy
 from django.views import View
 from django.views.generic import TemplateView, FormView
 
-from mainboard.config import EXAMPLE_ROOT, GRAPH_SIZE, MONITORING_ROOT, SYNC_SECONDS
+from mainboard.config import EXAMPLE_ROOT, GRAPH_SIZE, SYNC_SECONDS
 from mainboard.utils import get_monitoring, update_context_data_network
 import pandas as pd
 
@@ -51,14 +51,7 @@ class GraphView(LoginRequiredMixin, View):
             return HttpResponseBadRequest()
 
         sid = kwargs['sid']
-        files_path = os.path.join(EXAMPLE_ROOT, sid, MONITORING_ROOT)
-        files = os.listdir(files_path)
-        files.sort(reverse=True)
-        if GRAPH_SIZE < len(files):
-            recent_files = files[0:GRAPH_SIZE]
-        else:
-            recent_files = files
-        df_mon, mon_data = get_monitoring(sid, recent_files)
+        df_mon, mon_data = get_monitoring(sid, GRAPH_SIZE)
         df_mon['ts'] = pd.to_datetime(df_mon['ts'], format='%Y%m%d%H%M')
         df_mon['ts'] = df_mon['ts'].astype(str)
 
@@ -213,9 +213,9 @@ class MSNMTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
                 statistics_values = statistics_values.reshape((1,statistics_values.size))
                 np.savetxt(parsed_remote_source_file, statistics_values, valuesFormat, delimiter=",", header=str(name_statistics), comments="#")
                 
-                # Add the *.dat output from parser to the dict of generated files
+                # Add the statistics to the dict of generated files, so they are not loaded again from the *.dat
                 # The key is the packet reception time stamp not the ts of received as packet field.
-                self._remotes[sid]._files_generated[ts_rec] = parsed_remote_source_file
+                self._remotes[sid]._files_generated[ts_rec] = statistics_values.ravel()
                 
                 logging.info("Ending saving packet from sensor %s (%s)", sid,client_addres[0])
             else:
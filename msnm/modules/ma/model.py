@@ -16,8 +16,14 @@ from msnm.utils import datautils as tools
 from msnm.modules.ma.mspc import MSPC
 from msnm.exceptions.msnm_exception import MSNMError, ModelError, PCAError,\
     MSPCError
+from numpy.linalg import LinAlgError
+from scipy.linalg import blas
 import numpy as np
 import logging
+import sys
+import os
+import json
+import shutil
 
 class Model:
     """
@@ -40,6 +46,11 @@ class Model:
         PCA instance
     _lv : int
         Number of LVs (Latent Variables) used in calibration (by default is 3)
+    _solver : str
+        SVD solver of the PCA model in static calibrations (see PCA.runSVD):
+           'economy': economy-size SVD (default)
+           'arpack': truncated SVD (Lanczos/ARPACK)
+           'randomized': randomized SVD
     _alpha : float
         Confident interval to compute the control limits
     _phase : int
@@ -52,6 +63,20 @@ class Model:
         UCL limit for Q-statistic
     _UCLd: float
         UCL limit for D-statistic        
+    _P: numpy.ndarray
+        [MxA] Loadings of the calibrated model (cached for scoring)
+    _invCT: numpy.ndarray
+        [AxA] Inverse covariance matrix of the calibration scores (cached for scoring)
+    _isd: numpy.ndarray
+        [1xM] Inverse of ``_sd`` (cached for scoring)
+    _PPt: numpy.ndarray
+        [MxM] Product P*P' of the loadings (cached for diagnosis)
+    _streamN: int
+        Number of observations added to the current batch of the streaming calibration
+    _streamSum: numpy.ndarray
+        [M] Sum of the observations of the current batch
+    _streamXX: numpy.ndarray
+        [MxM] Cross-product of the observations of the current batch (upper triangle)
         
     See Also
     --------
@@ -62,11 +87,15 @@ class Model:
     sys
     
     """
+    
+    # Version of the binary snapshots of the model (see save_snapshot)
+    SNAPSHOT_VERSION = 1
    
     def __init__(self):
         self._data = np.zeros([])
         self._dataxcs = np.zeros([])
         self._dataXX = np.zeros([])
+        self._dataXXbuf = None # Buffer of the EWMA cross-product updates
         self._batch = {}
         self._av = np.zeros([])
         self._sd = np.zeros([])
@@ -76,9 +105,19 @@ class Model:
         # TODO it could be a Model in general PCA(Model):    
         self._pca = PCA()
         self._lv = 3 # Latent variables, pcs in PCA
+        self._solver = 'economy' # SVD solver
         self._alpha = 0.01 
         self._phase = 2 # UCLD phase II
         self._mspc = MSPC()
+        # Scoring cache, computed at calibration time
+        self._P = None
+        self._invCT = None
+        self._isd = None
+        self._PPt = None
+        # Streaming calibration accumulators
+        self._streamN = 0
+        self._streamSum = None
+        self._streamXX = None
         
     def calibrate(self, data, **kwargs):
         """       
@@ -99,6 +138,8 @@ class Model:
             Choose the phase to compute UCLd:           
                1: Phase I 
                2: Phase II (default)
+        solver (optional): str
+            SVD solver of the PCA model (see ``_solver``)
                
         Raises
         ------
@@ -147,6 +188,8 @@ class Model:
                 self._lv = kwargs['lv']
             if 'phase' in kwargs:
                 self._phase = kwargs['phase']
+            if 'solver' in kwargs:
+                self._solver = kwargs['solver']
               
             # Set data
             self._data = data
@@ -157,18 +200,21 @@ class Model:
             # Compute PCA
             self._pca.setData(self._dataxcs)
             self._pca.setPCs(self._lv)
-            self._pca.runPCA()
+            self._pca.runPCA(solver=self._solver)
                      
             # Compute UCLs
-            self._mspc.computeUCLQ(self._pca.getResidual(), self._alpha)             
+            self._compute_uclq()
             logging.debug("UCLq obtained: %s",self._mspc.getUCLQ())
             self._mspc.computeUCLD(self._lv, data.shape[0], self._alpha, self._phase)
             logging.debug("UCLd obtained: %s",self._mspc.getUCLD())
+            
+            # Matrices for scoring new observations
+            self._update_cache()
         
         except PCAError as epca:
-            raise ModelError(self,epca.msg,method_name)
+            raise ModelError(self,epca.get_msg(),method_name)
         except MSPCError as emspc:
-            raise ModelError(self,emspc.msg,method_name)
+            raise ModelError(self,emspc.get_msg(),method_name)
         except MSNMError as emsnm:
             raise emsnm
         
@@ -252,27 +298,472 @@ class Model:
             # Data preprocessing
             self._dataxcs, self._av, self._sd, self._N = tools.preprocess2Di(data, self._prep, self._lambda, self._av, self._sd, self._N, weights)
             
-            # EWMA cross-product
-            self._dataXX = self._lambda * self._dataXX + np.dot(self._dataxcs.T, self._dataxcs)
+            # EWMA cross-product, updated in place
+            self._update_crossproduct(self._dataxcs)
              
             # Compute PCA
             self._pca.setData(self._dataxcs)
             self._pca.setPCs(self._lv)
             self._pca.runPCA(method='eig', xxcrossdata=self._dataXX)
                      
-            # Compute UCLs
+            # Compute UCLs (UCLq from the residuals of the batch, see MSPC.computeUCLQ)
             self._mspc.computeUCLQ(self._pca.getResidual(), self._alpha)
             logging.debug("UCLq obtained: %s",self._mspc.getUCLQ())            
             self._mspc.computeUCLD(self._lv, data.shape[0], self._alpha, self._phase)
             logging.debug("UCLd obtained: %s",self._mspc.getUCLD())
+            
+            # Matrices for scoring new observations
+            self._update_cache()
         
         except PCAError as epca:
-            raise ModelError(self,epca.msg,method_name)
+            raise ModelError(self,epca.get_msg(),method_name)
         except MSPCError as emspc:
-            raise ModelError(self,emspc.msg,method_name)
+            raise ModelError(self,emspc.get_msg(),method_name)
         except MSNMError as emsnm:
             raise emsnm
 
+    def calibrate_streaming(self, x, **kwargs):
+        """
+        Streaming version of ``calibrate_dynamically()``. The observations are added one by one to the
+        sums of the current batch (rank-1 updates of its cross-product), and the EWMA model is refreshed
+        once the batch is complete. The result is the same model obtained by ``calibrate_dynamically()``
+        with the whole batch, but the observations of the batch are not kept: memory does not depend on
+        the batch size.
+        
+        Parameters
+        ----------        
+        x: numpy.ndarray
+            [M] or [NxM] observations to add
+        B: int
+            Number of observations of a batch, at least 2
+        prep (optional): int
+            Choose the preprocessing method (see ``calibrate_dynamically()``)
+        lv (optional): int
+            Number of LVs (Latent Variables) used in calibration (by default is 3)        
+        phase (optional): int
+            Choose the phase to compute UCLd (see ``calibrate_dynamically()``)
+        lamda (optional): float
+            Forgetting factor [0,1]
+        
+        Return
+        ------
+        refreshed: bool
+            True if the model was refreshed with a complete batch
+               
+        Raises
+        ------
+        ModelError
+            
+        Example
+        -------
+        >>> model = Model()
+        >>> model.calibrate(x,prep=2, lv=3, phase=2)
+        >>> for obs in observations:
+        >>>     if model.calibrate_streaming(obs, B=10, lamda=0.9):
+        >>>         print "UCLq --> %f" % model.get_mspc().getUCLQ()
+        """
+        
+        method_name = "calibrate_streaming()"
+        
+        # Check the data type as ndarray
+        if not isinstance(x, np.ndarray):
+            raise ModelError(self,"Data is not an ndarray", method_name)
+        if kwargs.get('B', 0) < 2:
+            raise ModelError(self,"The batch must have at least 2 observations", method_name)
+        
+        x = np.asarray(x, dtype=float).reshape((-1,x.shape[-1]))
+        M = x.shape[1]
+        
+        # Check optional parameters
+        if 'prep' in kwargs:
+            self._prep = kwargs['prep']            
+        if 'lv' in kwargs:
+            self._lv = kwargs['lv']
+        if 'phase' in kwargs:
+            self._phase = kwargs['phase']
+        if 'lamda' in kwargs:
+            self._lambda = kwargs['lamda']
+        
+        if self._streamSum is None or self._streamSum.shape[0] != M:
+            self._streamN = 0
+            self._streamSum = np.zeros(M)
+            # Fortran order, so BLAS updates it in place
+            self._streamXX = np.zeros((M,M), order='F')
+        
+        refreshed = False
+        
+        for row in x:
+            # Rank-1 updates of the sums of the batch
+            self._streamN += 1
+            self._streamSum += row
+            blas.dsyr(1.0, row, a=self._streamXX, overwrite_a=1)
+            
+            if self._streamN == kwargs['B']:
+                self._refresh_streaming()
+                refreshed = True
+        
+        return refreshed
+    
+    def _refresh_streaming(self):
+        """
+        Refreshes the EWMA model with the sums of the current batch, as ``calibrate_dynamically()`` does with
+        the observations of the batch, and resets them. The preprocessing parameters, the cross-product of the
+        preprocessed batch, the covariance of its scores and its residuals are obtained from the sums.
+        
+        The loadings and eigenvalues of ``_pca`` are updated (see ``PCA.setEigen()``), but not its scores or
+        residuals, since the observations of the batch are not kept. For the same reason, ``_data`` and
+        ``_dataxcs`` are still those of the last calibration with a data matrix.
+        
+        Raises
+        ------
+        ModelError
+        """
+        
+        method_name = "_refresh_streaming()"
+        
+        B = self._streamN
+        S1 = self._streamSum
+        # Complete cross-product from its upper triangle
+        S2 = np.triu(self._streamXX) + np.triu(self._streamXX,1).T
+        M = S1.shape[0]
+        
+        logging.info("Refreshing the streaming calibration for %s obs and lambda=%s",B,self._lambda)
+        
+        try:
+            # EWMA preprocessing (see datautils.preprocess2Di)
+            acc = self._av*self._N
+            acc2 = (self._sd**2)*np.max([self._N-1,0])
+            N = self._lambda*self._N + B
+            
+            if self._prep == 1 or self._prep == 2:
+                acc = self._lambda*acc + S1
+                average = np.ravel(acc/N)
+            else:
+                average = np.zeros(M)
+            
+            if self._prep == 2 or self._prep == 3:
+                # sum of squares of the observations centered with the current average
+                acc2 = self._lambda*acc2 + (np.diag(S2) - 2*average*S1 + B*average**2)
+                scale = np.ravel(np.sqrt(np.maximum(acc2,0)/(N-1)))
+                
+                # scale is all of zeros?
+                if np.nonzero(scale)[0].shape[0] == 0:
+                    mS = 2
+                else:
+                    mS = np.min(scale[np.nonzero(scale)])
+                scale[np.nonzero(scale == 0)] = mS/2
+            else:
+                scale = np.ones(M)
+            
+            # Cross-product of the preprocessed batch: D^-1 * (S2 - av*S1' - S1*av' + B*av*av') * D^-1
+            isd = 1.0 / scale
+            G = S2 - np.outer(average,S1) - np.outer(S1,average) + B*np.outer(average,average)
+            G *= isd[:,np.newaxis]
+            G *= isd[np.newaxis,:]
+            
+            self._av = average.reshape((1,M))
+            self._sd = scale.reshape((1,M))
+            self._N = N
+            
+            # EWMA cross-product, updated in place
+            if self._dataXX.shape != (M,M):
+                self._dataXX = np.zeros((M,M))
+            self._dataXX *= self._lambda
+            self._dataXX += G
+            
+            # Loadings from the EWMA cross-product
+            s, P = PCA.runEig(self._dataXX, self._lv)
+            
+            # Covariance of the scores of the batch: (T'T - B*tm'*tm)/(B-1)
+            tm = np.dot((S1/B - average)*isd, P)
+            t_cov = (np.dot(P.T,np.dot(G,P)) - B*np.outer(tm,tm)) / (B-1)
+            
+            # Covariance of the residuals of the batch: E'E/(B-1) = (I-PP')*G*(I-PP')/(B-1)
+            Q = np.eye(M) - np.dot(P,P.T)
+            C = np.dot(Q,np.dot(G,Q))
+            C /= (B-1)
+            
+            # Compute UCLs (UCLq from the traces of the powers of C, without its eigendecomposition)
+            self._mspc.computeUCLQTheta(np.trace(C), np.sum(C*C), np.sum(np.dot(C,C)*C), self._alpha)
+            logging.debug("UCLq obtained: %s",self._mspc.getUCLQ())            
+            self._mspc.computeUCLD(self._lv, B, self._alpha, self._phase)
+            logging.debug("UCLd obtained: %s",self._mspc.getUCLD())
+            
+            # PCA model and matrices for scoring new observations
+            self._pca.setEigen(s, P)
+            self._P = P
+            self._invCT = self._mspc.invertScoresCov(t_cov)
+            self._isd = isd.reshape((1,M))
+            self._PPt = np.dot(P,P.T)
+        
+        except LinAlgError:
+            raise ModelError(self,str(sys.exc_info()[1]),method_name)
+        except MSPCError as emspc:
+            raise ModelError(self,emspc.get_msg(),method_name)
+        finally:
+            # Next batch
+            self._streamN = 0
+            self._streamSum[:] = 0
+            self._streamXX[:] = 0
+        
+    def _compute_uclq(self):
+        """
+        UCL for Q-statistic of a static calibration. The eigenvalues of the residual covariance matrix are the
+        eigenvalues of the covariance matrix of ``_dataxcs`` not retained by the PCA model, which are taken from
+        the PCA spectrum, and its trace is the remaining of the total sum of squares. The residuals matrix is
+        only decomposed when the PCA solver computed a truncated spectrum.
+        
+        Raises
+        ------
+        MSPCError
+        """
+        N = self._dataxcs.shape[0]
+        eigenvalues = self._pca.getEigenvalues() / (N-1.0)
+        
+        if eigenvalues.size > self._lv:
+            theta1 = np.sum(self._dataxcs**2) / (N-1.0) - np.sum(eigenvalues[:self._lv])
+            self._mspc.computeUCLQEig(eigenvalues[self._lv:], self._alpha, theta1)
+        else:
+            self._mspc.computeUCLQ(self._pca.getResidual(), self._alpha)
+        
+    def _update_crossproduct(self, xcs):
+        """
+        EWMA update of the cross-product ``_dataXX`` with a batch of preprocessed observations ``xcs``:
+        XX_t = lambda * XX_(t-1) + xcs' * xcs. The matrix is updated in place, and the product of the
+        batch is computed into a buffer allocated once, so no [MxM] matrix is allocated per batch.
+        
+        Parameters
+        ----------
+        xcs: numpy.ndarray
+            [BxM] preprocessed observations
+        """
+        M = xcs.shape[1]
+        
+        if self._dataXX.shape != (M,M):
+            self._dataXX = np.zeros((M,M))
+        if self._dataXXbuf is None or self._dataXXbuf.shape != (M,M):
+            self._dataXXbuf = np.empty((M,M))
+        
+        np.dot(xcs.T, xcs, out=self._dataXXbuf)
+        self._dataXX *= self._lambda
+        self._dataXX += self._dataXXbuf
+        
+    def _update_cache(self):
+        """
+        Computes the matrices needed to score new observations, which do not change until the next
+        calibration: the loadings, the inverse covariance of the calibration scores, the inverse
+        of the scale and the product P*P' used by oMEDA. It is called at the end of ``calibrate()`` 
+        and ``calibrate_dynamically()``.
+        """
+        self._P = np.ascontiguousarray(self._pca.getLoadings())
+        self._invCT = self._mspc.computeInvScoresCov(self._pca.getScores())
+        self._isd = 1.0 / self._sd
+        self._PPt = np.dot(self._P,self._P.T)
+        
+    def preprocess(self, test):
+        """
+        Preprocessing of new observations ``test`` with the average and scale of the calibrated model, 
+        as ``datautils.preprocess2Dapp()`` does, through the cached inverse of the scale
+        
+        Parameters
+        ----------
+        test: numpy.ndarray
+            [NxM] observations
+            
+        Return
+        ------
+        testcs: numpy.ndarray
+            [NxM] preprocessed observations
+        """
+        testcs = test - self._av
+        testcs *= self._isd
+        
+        return testcs
+    
+    def is_calibrated(self):
+        """
+        Checks if the model is complete to score new observations, i.e., it was calibrated or
+        loaded from a snapshot
+        """
+        return self._P is not None
+
+    def save_snapshot(self, path, ts, calibration_data=False):
+        """
+        Saves a binary snapshot of the model in the directory ``path``: one ``.npy`` file per array and a
+        ``manifest.json`` with the rest of parameters. Only what is needed to score new observations
+        is saved (average, scale, loadings, inverse covariance of the scores and control limits), unless
+        ``calibration_data`` is True, and the state of the EWMA dynamic calibration, if any (the 
+        cross-product ``_dataXX`` and the sums of the current streaming batch). The snapshot is written in a temporary directory which is renamed
+        at the end, so an incomplete snapshot is never found in ``path``.
+        
+        Parameters
+        ----------
+        path: str
+            Snapshot directory
+        ts: str
+            Model saving timestamp
+        calibration_data: bool
+            Saves the calibration data too
+            
+        Raises
+        ------
+        ModelError
+            When the model is not calibrated or the snapshot can not be written
+            
+        Example
+        -------
+        >>> model.calibrate(x,prep=2, lv=3, phase=2)
+        >>> model.save_snapshot('data/calibration/model_201806011200','201806011200')
+        """
+        
+        method_name = "save_snapshot()"
+        
+        if not self.is_calibrated():
+            raise ModelError(self,"The model is not calibrated", method_name)
+        
+        arrays = {'av': self._av, 'sd': self._sd, 'P': self._P, 'invCT': self._invCT}
+        if calibration_data:
+            arrays['data'] = self._data
+        
+        # EWMA dynamic calibration state
+        if self._dataXX.ndim == 2:
+            arrays['XX'] = self._dataXX
+        if self._streamSum is not None:
+            arrays['streamSum'] = self._streamSum
+            arrays['streamXX'] = self._streamXX
+        
+        manifest = {'version': Model.SNAPSHOT_VERSION,
+                    'ts': ts,
+                    'variables': self._P.shape[0],
+                    'lv': self._lv,
+                    'prep': self._prep,
+                    'phase': self._phase,
+                    'alpha': self._alpha,
+                    'solver': self._solver,
+                    'lambda': self._lambda,
+                    'N': self._N,
+                    'streamN': self._streamN,
+                    'UCLq': float(self._mspc.getUCLQ()),
+                    'UCLd': float(self._mspc.getUCLD()),
+                    'arrays': {}}
+        
+        tmp_path = path.rstrip('/') + '.tmp'
+        
+        try:
+            if os.path.exists(tmp_path):
+                shutil.rmtree(tmp_path)
+            os.makedirs(tmp_path)
+            
+            for name, value in arrays.items():
+                value = np.asarray(value, dtype=np.float64)
+                np.save(os.path.join(tmp_path, name + '.npy'), value)
+                manifest['arrays'][name] = {'file': name + '.npy', 'shape': list(value.shape)}
+            
+            with open(os.path.join(tmp_path, 'manifest.json'), 'w') as f:
+                json.dump(manifest, f, indent=4, sort_keys=True)
+            
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            os.rename(tmp_path, path)
+            
+        except (IOError, OSError):
+            raise ModelError(self,sys.exc_info()[1], method_name)
+        
+        logging.debug("Model snapshot saved in %s",path)
+    
+    def load_snapshot(self, path, mmap_mode='r', variables=None):
+        """
+        Loads a snapshot saved by ``save_snapshot()``. The arrays are memory-mapped (see ``numpy.load``), 
+        and the rest of matrices used to score new observations are computed from them. The EWMA dynamic
+        calibration state is read into memory, since it is updated in place, so the dynamic calibration
+        goes on from the snapshot.
+        
+        Parameters
+        ----------
+        path: str
+            Snapshot directory
+        mmap_mode: str
+            Memory-map mode of the arrays (None to read them into memory)
+        variables: int
+            Number of variables of the observations to monitor. If given, the snapshot must be of a
+            model of that number of variables; otherwise it is not loaded.
+            
+        Return
+        ------
+        ts: str
+            Timestamp of the snapshot
+            
+        Raises
+        ------
+        ModelError
+            When the snapshot can not be read or its number of variables does not match
+            
+        Example
+        -------
+        >>> model = Model()
+        >>> model.load_snapshot('data/calibration/model_201806011200')
+        >>> print "UCLq --> %f" % model.get_mspc().getUCLQ()
+        """
+        
+        method_name = "load_snapshot()"
+        
+        try:
+            with open(os.path.join(path, 'manifest.json'), 'r') as f:
+                manifest = json.load(f)
+            
+            if manifest['version'] != Model.SNAPSHOT_VERSION:
+                raise ModelError(self,"Unsupported snapshot version: %s" % manifest['version'], method_name)
+            
+            # Variables of the model: rows of the loadings for the snapshots saved without their number
+            snapshot_variables = manifest.get('variables', manifest['arrays']['P']['shape'][0])
+            if variables is not None and snapshot_variables != variables:
+                raise ModelError(self,"The snapshot is a model of %s variables, but %s variables are monitored" % (snapshot_variables, variables), method_name)
+            
+            arrays = {}
+            for name, info in manifest['arrays'].items():
+                if name in ('XX', 'streamSum', 'streamXX'):
+                    arrays[name] = np.load(os.path.join(path, info['file']))
+                else:
+                    arrays[name] = np.load(os.path.join(path, info['file']), mmap_mode=mmap_mode)
+            
+            self._lv = manifest['lv']
+            self._prep = manifest['prep']
+            self._phase = manifest['phase']
+            self._alpha = manifest['alpha']
+            self._solver = manifest['solver']
+            self._lambda = manifest['lambda']
+            self._N = manifest['N']
+            self._mspc._UCLQ = manifest['UCLq']
+            self._mspc._UCLD = manifest['UCLd']
+            
+            self._av = arrays['av']
+            self._sd = arrays['sd']
+            self._P = arrays['P']
+            self._invCT = arrays['invCT']
+            if self._invCT.ndim == 0:
+                self._invCT = float(self._invCT)
+            self._isd = 1.0 / self._sd
+            self._PPt = np.dot(self._P,self._P.T)
+            
+            if 'data' in arrays:
+                self._data = arrays['data']
+            
+            # EWMA dynamic calibration state
+            if 'XX' in arrays:
+                self._dataXX = arrays['XX']
+                self._dataXXbuf = None
+            if 'streamSum' in arrays:
+                self._streamN = manifest['streamN']
+                self._streamSum = arrays['streamSum']
+                # Fortran order for the rank-1 updates (see calibrate_streaming)
+                self._streamXX = np.asfortranarray(arrays['streamXX'])
+            
+        except (IOError, OSError, ValueError, KeyError):
+            raise ModelError(self,sys.exc_info()[1], method_name)
+        
+        logging.debug("Model snapshot loaded from %s",path)
+        
+        return manifest['ts']
     
     # Getter, setter and del methods
     def get_data(self):
@@ -295,6 +786,10 @@ class Model:
         return self._lv
 
 
+    def get_solver(self):
+        return self._solver
+
+
     def get_alpha(self):
         return self._alpha
 
@@ -306,6 +801,15 @@ class Model:
     def get_mspc(self):
         return self._mspc
 
+    def get_loadings(self):
+        return self._P
+
+    def get_inv_scores_cov(self):
+        return self._invCT
+
+    def get_loadings_product(self):
+        return self._PPt
+
     def set_data(self, value):
         self._data = value
 
@@ -326,6 +830,10 @@ class Model:
         self._lv = value
 
 
+    def set_solver(self, value):
+        self._solver = value
+
+
     def set_alpha(self, value):
         self._alpha = value
 
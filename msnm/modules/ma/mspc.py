@@ -15,7 +15,7 @@ import numpy as np
 from scipy.stats import f as fisher
 from scipy.stats import beta
 from scipy.stats import norm
-from numpy.linalg.linalg import LinAlgError
+from numpy.linalg import LinAlgError
 from msnm.exceptions.msnm_exception import MSPCError
 import sys
 import logging
@@ -131,17 +131,12 @@ class MSPC:
             # Check is the statistic is and ndarray of [1x1] dimensions and get the float value
             if isinstance(self._Qst, np.ndarray):
                 self._Qst = self._Qst[0,0]
-            
-            # TODO: Sometimes after computations numpy takes UCLq as complex with 0j imaginary part
-            if isinstance(self._Qst, complex):
-                logging.warn("Qst has a complex value of %s. Getting just the real part.",self._Qst)
-                self._Qst = self._Qst.real
                 
         except Exception:
             raise MSPCError(self,sys.exc_info()[0], method_name) 
         
         
-    def computeDst(self, testcs, P, T):        
+    def computeDst(self, testcs, P, T, invCT=None):        
         """       
         Computes D-statistic and set ``self._Dst`` class attribute
         
@@ -155,6 +150,8 @@ class MSPC:
         T: numpy.ndarray 
             [MxA] Matrix to perform the projection from the original to the latent subspace. 
             For PCA (testcs = T*P'), this is the matrix of scores
+        invCT (optional): numpy.ndarray
+            [AxA] Inverse covariance matrix of ``T``, when it is already computed (see ``computeInvScoresCov()``)
             
         Raises
         ------
@@ -212,19 +209,8 @@ class MSPC:
             t = np.dot(testcs,P)        
             
             #inverse of the model calibration scores (T)
-            #Note: inv() method just allows at least 2D arrays 
-            t_cov = np.cov(T,rowvar=False)
-            
-            try:
-                invCT = np.linalg.inv(t_cov)
-            except LinAlgError:
-                invCT = 1 / t_cov            
-            
-    #         if all(t_cov.shape):# True the shape tuple is empty
-    #             # When T has only one variable -> cov(T) computes the variance
-    #             invCT = 1 / t_cov
-    #         else:    
-    #             invCT = np.linalg.inv(t_cov)            
+            if invCT is None:
+                invCT = self.computeInvScoresCov(T)
                 
             dotAux = np.dot(t,invCT)
            
@@ -234,15 +220,120 @@ class MSPC:
             # Check is the statistic is and ndarray of [1x1] dimensions and get the float value
             if isinstance(self._Dst, np.ndarray):
                 self._Dst = self._Dst[0,0]
+        
+        except Exception:
+            raise MSPCError(self,sys.exc_info()[0], method_name)
+        
+    def computeStatistics(self, testcs, P, T, invCT=None):
+        """
+        Computes the Q and D statistics of a block of observations at once. Unlike ``computeQst()`` and
+        ``computeDst()``, the statistics are returned (one per observation) and the class attributes are
+        not modified, so it can be used concurrently with the monitoring of new observations.
+        
+        Parameters
+        ----------        
+        testcs: numpy.ndarray
+            [NxM] preprocessed billinear data set with the observations to be monitored.
+        P: numpy.ndarray 
+            [MxA] Matrix to perform the projection from the original to the latent subspace. 
+            For PCA (testcs = T*P'), this is the matrix of loadings
+        T: numpy.ndarray 
+            [NxA] Matrix of scores of the calibration data. 
+        invCT (optional): numpy.ndarray
+            [AxA] Inverse covariance matrix of ``T``, when it is already computed (see ``computeInvScoresCov()``)
+            
+        Return
+        ------
+        Qst: numpy.ndarray
+            [N] Q-statistic of each observation
+        Dst: numpy.ndarray
+            [N] D-statistic of each observation
             
-            # TODO: Sometimes after computations numpy takes UCLq as complex with 0j imaginary part
-            if isinstance(self._Dst, complex):
-                logging.warn("Dst has a complex value of %s. Getting just the real part.",self._Dst)
-                self._Dst = self._Dst.real
+        Raises
+        ------
+        MSPCError
+            When something is going wrong during the mathematical operations
+            
+        Example
+        -------
+        >>> # See computeQst() and computeDst() for the computation of testcs, P and T
+        >>> mspcInstance = mspc.MSPC()
+        >>> Qst, Dst = mspcInstance.computeStatistics(testcs,P,T)
+        
+        """
+        
+        method_name = "computeStatistics()"
+        
+        try:
+            # new scores of all the observations, shared by both statistics
+            t = np.dot(testcs,P)
+            
+            # Model residuals from the observations in testcs
+            e = testcs - np.dot(t,P.T)
+            
+            # Sum of squares of each row
+            Qst = np.einsum('ij,ij->i',e,e)
+            
+            # inverse of the covariance of the model calibration scores (T)
+            if invCT is None:
+                invCT = self.computeInvScoresCov(T)
+            Dst = np.einsum('ij,ij->i',np.dot(t,invCT),t)
         
         except Exception:
             raise MSPCError(self,sys.exc_info()[0], method_name)
         
+        return Qst, Dst
+    
+    @staticmethod
+    def computeInvScoresCov(T):
+        """
+        Inverse of the covariance matrix of the calibration scores ``T``
+        
+        Parameters
+        ----------
+        T: numpy.ndarray 
+            [NxA] Matrix of scores of the calibration data.
+            
+        Return
+        ------
+        invCT: numpy.ndarray
+            [AxA] inverse covariance matrix (the inverse of the variance when A is 1)
+        
+        """
+        
+        #Note: inv() method just allows at least 2D arrays 
+        t_cov = np.cov(T,rowvar=False)
+        
+        return MSPC.invertScoresCov(t_cov)
+    
+    @staticmethod
+    def invertScoresCov(t_cov):
+        """
+        Inverse of the covariance matrix of the calibration scores
+        
+        Parameters
+        ----------
+        t_cov: numpy.ndarray 
+            [AxA] covariance matrix of the scores (or their variance when A is 1)
+            
+        Return
+        ------
+        invCT: numpy.ndarray
+            [AxA] inverse covariance matrix (the inverse of the variance when A is 1)
+        
+        """
+        
+        if np.ndim(t_cov) == 2 and t_cov.shape == (1,1):
+            t_cov = t_cov[0,0]
+        
+        try:
+            invCT = np.linalg.inv(t_cov)
+        except LinAlgError:
+            # When T has only one variable -> cov(T) computes the variance
+            invCT = 1 / t_cov
+        
+        return invCT
+        
     def computeoMEDA(self, testcs, dummy, P):
         """Computes oMEDA diagnostic for finding anomalous variables. Set the ``self._oMEDA`` as a result
         
@@ -341,6 +432,69 @@ class MSPC:
         
         
         
+    def computeoMEDABatch(self, testcs, dummy, PPt):
+        """Computes oMEDA for several groups of observations at once (see ``computeoMEDA()``). The oMEDA 
+        vectors are returned, and neither the class attributes nor ``dummy`` are modified.
+        
+        Each row of ``dummy`` selects a group of observations (e.g., a single anomalous interval, or a set of
+        intervals with positive weights against a baseline with negative ones). Since the projection of the
+        observations is only needed through the dummy sums, the [NxM] projected data is never built:
+        the dummy sums are projected with the [MxM] matrix P*P' cached by the model.
+        
+        Parameters
+        ----------        
+        testcs: numpy.ndarray
+            [NxM] preprocessed billinear data set with the observations to be diagnosed.
+        dummy: numpy.ndarray
+            [DxN] dummy matrix: one dummy variable per row, containing weights for the observations to 
+            compare, and 0 for the rest of observations.
+        PPt: numpy.ndarray 
+            [MxM] Product P*P' of the matrix of loadings
+            
+        Return
+        ------
+        oMEDA: numpy.ndarray
+            [MxD] one oMEDA vector per column, in the order of the rows of ``dummy``
+            
+        Raises
+        ------
+        MSPCError
+            When something is going wrong during the mathematical operations
+            
+        Example
+        -------
+        >>> # See computeoMEDA() for the computation of testcs and P
+        >>> # oMEDA of each one of the first 3 observations
+        >>> dummy = np.zeros((3,testcs.shape[0]))
+        >>> dummy[[0,1,2],[0,1,2]] = 1
+        >>> mspcInstance = mspc.MSPC()
+        >>> oMEDAvectors = mspcInstance.computeoMEDABatch(testcs,dummy,np.dot(P,P.T))
+        
+        """
+        
+        method_name = "computeoMEDABatch()"
+        
+        try:
+            dummy = np.atleast_2d(np.asarray(dummy, dtype=float))
+            
+            # To normalice each dummy vector [-1, 1]
+            pos = np.max(np.where(dummy > 0, dummy, 0), axis=1, keepdims=True)
+            neg = np.min(np.where(dummy < 0, dummy, 0), axis=1, keepdims=True)
+            pos[pos == 0] = 1
+            neg[neg == 0] = -1
+            dummy = np.where(dummy > 0, dummy / pos, np.where(dummy < 0, -dummy / neg, 0))
+            
+            # Dummy sums of the observations and of their projections
+            sumTotal = np.dot(dummy, testcs)
+            sumA = np.dot(sumTotal, PPt)
+            
+            oMEDA = ((2*sumTotal - sumA)*np.abs(sumA)) / np.sqrt(np.sum(dummy**2, axis=1, keepdims=True))
+        
+        except Exception:
+            raise MSPCError(self,sys.exc_info()[0], method_name)
+        
+        return oMEDA.T
+        
     def computeUCLD(self,npc,nob,p_value,phase):
         """
         UCL (Upper Control Limit) for D-statistic
@@ -423,11 +577,6 @@ class MSPC:
             if isinstance(lim, np.ndarray):
                 lim = lim[0,0]
             
-            # TODO: Sometimes after computations numpy takes UCLq as complex with 0j imaginary part
-            if isinstance(lim, complex):
-                logging.warn("UCLd has a complex value of %s. Getting just the real part.",lim)
-                lim = lim.real
-            
             self._UCLD = lim
         
         except Exception:
@@ -501,19 +650,117 @@ class MSPC:
                 
             # Rows of E matrix
             N = res.shape[0]
-            
-            # rank of E
-            pcs_left = np.linalg.matrix_rank(res);
-    
-            #
-            lambda_eig = np.linalg.eigvals((1.0/(N-1))*np.dot(res.T,res))
-            # Get the DESC order according to the ABS value of eigenvalues
-            lambda_eig = lambda_eig[np.abs(lambda_eig).argsort()[::-1]]        
     
-            theta1 = np.sum(lambda_eig[:pcs_left])
-            theta2 = np.sum(lambda_eig[:pcs_left]**2)
-            theta3 = np.sum(lambda_eig[:pcs_left]**3)
+            # Eigenvalues of the symmetric residual covariance (1/(N-1))*E'*E. The non-zero ones are
+            # the same of E*E', so the smallest of both cross-products is decomposed
+            if res.shape[0] < res.shape[1]:
+                lambda_eig = np.linalg.eigvalsh(np.dot(res,res.T))
+            else:
+                lambda_eig = np.linalg.eigvalsh(np.dot(res.T,res))
+            lambda_eig = lambda_eig / (N-1)
+            
+            # theta1 from the trace of the residual covariance
+            theta1 = np.sum(res**2) / (N-1)
+            
+        except Exception:
+            raise MSPCError(self,sys.exc_info()[0], method_name)
+        
+        self.computeUCLQEig(lambda_eig, p_value, theta1)
+        
+    def computeUCLQEig(self,lambda_eig,p_value,theta1=None):
+        """
+        UCL (Upper Control Limit) for Q-statistic, from the eigenvalues of the residual covariance matrix 
+        (Jackson-Mudholkar). For PCA, these are the eigenvalues of the covariance matrix of the data
+        discarded by the model, so the limit is obtained from the spectrum computed in the PCA, without 
+        any other decomposition (see ``computeUCLQ()`` for the limit from the residuals matrix).
+        
+        .. [Ref] Control Procedures for Residuals Associated With Principal Component Analysis
+            http://www.tandfonline.com/doi/abs/10.1080/00401706.1979.10489779
+        
+        Parameters
+        ----------
+        lambda_eig: numpy.ndarray 
+            Eigenvalues of the residual covariance matrix. The null ones can be omitted
+        p_value: float 
+            p-value of the test, in (0,1]       
+        theta1 (optional): float
+            Trace of the residual covariance matrix (the sum of ``lambda_eig`` by default)
+            
+        Raises
+        ------
+        MSPCError
+            When something is going wrong during the mathematical operations
+            
+        Examples
+        --------
+        >>> # See computeUCLQ() for the computation of xcs, T and P with 1 PC
+        >>> # Eigenvalues of the covariance matrix of xcs, in descending order
+        >>> lambda_eig = np.linalg.svd(xcs, compute_uv=False)**2 / (xcs.shape[0]-1)
+        >>> mspcInstance.computeUCLQEig(lambda_eig[1:], 0.01)
+        
+        >>> print "UCLq --> %f" % mspcInstance.getUCLQ()
+        
+        """
+        
+        method_name = "computeUCLQEig()"
+        
+        try:
+            
+            # Numerically null eigenvalues (out of the rank of the residuals) are discarded
+            lambda_eig = np.asarray(lambda_eig, dtype=float)
+            if lambda_eig.size:
+                lambda_eig = lambda_eig[lambda_eig > np.max(np.abs(lambda_eig)) * lambda_eig.size * np.finfo(float).eps]
     
+            if theta1 is None:
+                theta1 = np.sum(lambda_eig)
+            theta2 = np.sum(lambda_eig**2)
+            theta3 = np.sum(lambda_eig**3)
+        
+        except Exception:
+            raise MSPCError(self,sys.exc_info()[0], method_name)
+        
+        self.computeUCLQTheta(theta1, theta2, theta3, p_value)
+        
+    def computeUCLQTheta(self,theta1,theta2,theta3,p_value):
+        """
+        UCL (Upper Control Limit) for Q-statistic from the sums of the powers of the eigenvalues of the 
+        residual covariance matrix C (Jackson-Mudholkar): theta_i = trace(C^i). They are obtained from C
+        without its eigendecomposition: theta1 = trace(C), theta2 = sum(C*C) and theta3 = sum(dot(C,C)*C), 
+        since C is symmetric (see ``computeUCLQEig()`` for the limit from the eigenvalues).
+        
+        .. [Ref] Control Procedures for Residuals Associated With Principal Component Analysis
+            http://www.tandfonline.com/doi/abs/10.1080/00401706.1979.10489779
+        
+        Parameters
+        ----------
+        theta1: float
+            Trace of the residual covariance matrix
+        theta2: float
+            Trace of its square
+        theta3: float
+            Trace of its cube
+        p_value: float 
+            p-value of the test, in (0,1]       
+            
+        Raises
+        ------
+        MSPCError
+            When something is going wrong during the mathematical operations
+            
+        Examples
+        --------
+        >>> # Residual covariance matrix of the calibration data xcs, with the residuals E of the PCA
+        >>> C = np.dot(E.T,E) / (xcs.shape[0]-1)
+        >>> mspcInstance.computeUCLQTheta(np.trace(C), np.sum(C*C), np.sum(np.dot(C,C)*C), 0.01)
+        
+        >>> print "UCLq --> %f" % mspcInstance.getUCLQ()
+        
+        """
+        
+        method_name = "computeUCLQTheta()"
+        
+        try:
+            
             h0 = 1-((2*theta1*theta3)/(3*theta2**2))
     
             z = norm.ppf(1-p_value)
@@ -523,11 +770,6 @@ class MSPC:
             # Check is the limit is and ndarray of [1x1] dimensions and get the float value
             if isinstance(UCLq, np.ndarray):
                 UCLq = UCLq[0,0]
-                
-            # TODO: Sometimes after computations numpy takes UCLq as complex with 0j imaginary part
-            if isinstance(UCLq, complex):
-                logging.warn("UCLq has a complex value of %s. Getting just the real part.",UCLq)
-                UCLq = UCLq.real
                             
             self._UCLQ = UCLq
         
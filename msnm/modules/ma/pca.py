@@ -14,7 +14,9 @@
 import numpy.linalg as linalg
 import numpy as np
 import sys
-from numpy.linalg.linalg import LinAlgError
+from scipy.linalg import eigh
+from scipy.sparse.linalg import svds, ArpackError
+from numpy.linalg import LinAlgError
 from msnm.exceptions.msnm_exception import PCAError
 
 class PCA:
@@ -38,7 +40,8 @@ class PCA:
     _model: numpy.ndarray
         X [NxM] matrix from X = T*P'
     _eigengvaluesMatrix: numpy.ndarray
-        [AxA] diagonal matrix of eigenvalues
+        Eigenvalues of the cross-product X'*X (squared singular values of X), in descending order.
+        Truncated SVD solvers only compute the first ``_pcs`` ones
          
     See Also
     --------
@@ -66,7 +69,13 @@ class PCA:
         method: str 
             Choose the inner method to process PCA:
                'svd': SVD 
-               'eig': through getting the eigenvectors and eigenvalues from the X'*X
+               'eig': through getting the eigenvectors and eigenvalues from the X'*X. Since X'*X is 
+                      symmetric, a symmetric eigensolver computes just the first PCs.
+        solver (optional): str
+            When 'svd' method is selected, the SVD solver (see ``runSVD()``):
+               'economy': economy-size SVD (default)
+               'arpack': truncated SVD of the first PCs (Lanczos/ARPACK)
+               'randomized': randomized SVD of the first PCs
         xxcrossdata (optional): numpy.ndarray
             When 'eig' method is selected, the cross-product X'*X comes from this input parameter. Otherwise, X'*X will be computed inside.
         
@@ -109,12 +118,14 @@ class PCA:
             if method == 'svd':
             
                 # Run SVD from the data matrix
-                u, s, v = self.runSVD(self._data)
+                u, s, v = self.runSVD(self._data, self._pcs, kwargs.get('solver', 'economy'))
                             
                 # Compute T and P matrix. 
                 # NOTE that P matrix is V' when this is computed from numpy library
-                t = np.dot(u, s)            
+                t = u * s
                 p = v.T
+                # Eigenvalues of X'*X
+                s = s**2
             
             elif method == 'eig':
                 if 'xxcrossdata' not in kwargs:
@@ -125,15 +136,12 @@ class PCA:
                     
                 # s, eigenvalues
                 # p, eigenvectors
-                s,p = linalg.eig(XX)
+                s,p = self.runEig(XX, self._pcs)
                 
-                # Sort the eigenvectors their corresponding eigenvalue
-                ind = np.argsort(s)[::-1]# get the indexes in descending order
-                p = p[:,ind]# get the complete P matrix
-                # get the complete score matrix
+                # get the score matrix
                 t = np.dot(self._data, p)
             
-        except LinAlgError:
+        except (LinAlgError, ArpackError, ValueError):
                 raise PCAError(self,sys.exc_info()[1], method_name)                                    
         
         self._scoresMatrix = t[:, :self._pcs]
@@ -206,7 +214,7 @@ class PCA:
         
         # Compute T and P matrix. 
         # NOTE that P matrix is V' when this is computed from numpy library
-        t = np.dot(u, s)
+        t = u * s
         p = v.T
         
         scoresMatrix = t[:, :pcs]
@@ -217,27 +225,46 @@ class PCA:
         return scoresMatrix, loadingsMatrix, model, residualsMatrix
         
     @classmethod
-    def runSVD(self, data):
-        """SVD (Singular Value Decomposition).                
+    def runSVD(self, data, pcs=None, solver='economy'):
+        """SVD (Singular Value Decomposition).
+        
+        Only the economy-size SVD is computed: neither the complete [NxN] ``u`` matrix
+        nor a dense matrix of singular values are built. The truncated solvers just compute 
+        the first ``pcs`` singular vectors, which is enough for the PCA model.
+        
+        The signs of the singular vectors are fixed (the largest component of each
+        row of ``v`` is positive), so all the solvers return the same vectors.
         
         Parameters
         ----------
         data: numpy.ndarray 
             [NxM] preprocessed billinear data set
+        pcs (optional): int
+            number of PCs (Principal Components) for the truncated solvers
+        solver (optional): str
+            SVD solver:
+               'economy': economy-size SVD (default)
+               'arpack': truncated SVD through the Lanczos method (ARPACK). The economy-size
+                         SVD is used when ``pcs`` is not lower than the rank of ``data``
+               'randomized': randomized SVD
             
         Return
         ------
         u: numpy.ndarray
-            [NxN] unitary matrix
+            [NxK] left singular vectors, K = min(N,M) or ``pcs`` for truncated solvers
         s: numpy.ndarray
-            [NxM] diagonal matrix containing the eigenvalues of ``data``
+            [K] singular values of ``data``, in descending order
         v: numpy.ndarray
-            [MxN] unitary matrix
+            [KxM] right singular vectors
             
         Raises
         ------
         LingAlgError
             When SVD method does not converge
+        ArpackError
+            When ARPACK does not converge
+        ValueError
+            When the solver is unknown
             
         Example
         -------
@@ -253,18 +280,122 @@ class PCA:
         
         >>> pcaModel = pca.PCA()
         >>> U,S,V = pcaModel.runSVD(xcs)                                             
+        >>> U,S,V = pcaModel.runSVD(xcs, 3, 'arpack')                                             
         """
         
-        # Run SVD from the data matrix
-        u, s, v = linalg.svd(data)
-
-        # Transform S from array to matrix with the corresponding dimensions
-        # in U and V
-        sdiag = np.diag(s)
-        s = np.zeros((u.shape[1], v.shape[0]))
-        s[:sdiag.shape[0], :sdiag.shape[1]] = sdiag        
+        if solver == 'arpack' and pcs and pcs < min(data.shape) - 1:
+            u, s, v = svds(data, k=pcs)
+            # ARPACK returns the singular values in ascending order
+            ind = np.argsort(s)[::-1]
+            u, s, v = u[:, ind], s[ind], v[ind, :]
+        elif solver == 'randomized' and pcs and pcs < min(data.shape):
+            u, s, v = self.runRandomizedSVD(data, pcs)
+        elif solver in ('economy', 'arpack', 'randomized'):
+            u, s, v = linalg.svd(data, full_matrices=False)
+        else:
+            raise ValueError("Unknown SVD solver: %s" % solver)
+        
+        # Deterministic signs of the singular vectors
+        signs = np.sign(v[np.arange(v.shape[0]), np.argmax(np.abs(v), axis=1)])
+        signs[signs == 0] = 1
+        
+        return u * signs, s, v * signs[:, np.newaxis]
+    
+    @staticmethod
+    def runEig(XX, pcs):
+        """Eigendecomposition of the symmetric cross-product X'*X, just for the largest ``pcs`` eigenvalues.
+        
+        Parameters
+        ----------
+        XX: numpy.ndarray 
+            [MxM] cross-product X'*X
+        pcs: int
+            number of PCs (Principal Components)
+            
+        Return
+        ------
+        s: numpy.ndarray
+            [A] largest eigenvalues of ``XX``, in descending order
+        p: numpy.ndarray
+            [MxA] corresponding eigenvectors (loadings)
+            
+        Raises
+        ------
+        LingAlgError
+            When the eigensolver does not converge
+        """
+        
+        # Just the largest ones, in ascending order (real values, since XX is symmetric)
+        M = XX.shape[0]
+        s,p = eigh(XX, subset_by_index=[max(M - pcs, 0), M - 1])
+        
+        # Sort the eigenvectors their corresponding eigenvalue in descending order
+        return s[::-1], p[:,::-1]
+    
+    @staticmethod
+    def runRandomizedSVD(data, pcs, oversamples=10, iterations=4, seed=0):
+        """Randomized SVD of the first ``pcs`` singular vectors.
+        
+        .. [Ref] Finding structure with randomness: Probabilistic algorithms for constructing approximate matrix decompositions
+            https://arxiv.org/abs/0909.4061
+        
+        Parameters
+        ----------
+        data: numpy.ndarray 
+            [NxM] preprocessed billinear data set
+        pcs: int
+            number of PCs (Principal Components)
+        oversamples (optional): int
+            additional random vectors to improve the accuracy
+        iterations (optional): int
+            power iterations to improve the accuracy when the singular values decay slowly
+        seed (optional): int
+            seed of the random vectors, so the results are reproducible
+            
+        Return
+        ------
+        u: numpy.ndarray
+            [NxA] left singular vectors
+        s: numpy.ndarray
+            [A] singular values of ``data``, in descending order
+        v: numpy.ndarray
+            [AxM] right singular vectors
+        """
+        
+        k = min(pcs + oversamples, min(data.shape))
+        omega = np.random.RandomState(seed).normal(size=(data.shape[1], k))
         
-        return u, s, v
+        # Orthonormal basis of the range of data
+        q, _ = linalg.qr(np.dot(data, omega))
+        for i in range(iterations):
+            q, _ = linalg.qr(np.dot(data.T, q))
+            q, _ = linalg.qr(np.dot(data, q))
+        
+        # SVD of the small [kxM] projection
+        ub, s, v = linalg.svd(np.dot(q.T, data), full_matrices=False)
+        u = np.dot(q, ub)
+        
+        return u[:, :pcs], s[:pcs], v[:pcs, :]
+        
+    def setEigen(self, s, p):
+        """Sets the PCA model obtained out of this instance from the eigendecomposition of a cross-product X'*X 
+        (see ``runEig()``), e.g., in the streaming calibration of the model. Since the observations of X are not
+        available, the data, scores, model and residuals matrices are reset.
+        
+        Parameters
+        ----------
+        s: numpy.ndarray
+            [A] largest eigenvalues of X'*X, in descending order
+        p: numpy.ndarray
+            [MxA] corresponding eigenvectors (loadings)
+        """
+        self._pcs = p.shape[1]
+        self._loadingsMatrix = p
+        self._eigengvaluesMatrix = s
+        self._data = 0
+        self._scoresMatrix = 0
+        self._model = 0
+        self._residualsMatrix = 0
         
     ### Setter and Getter methods
     def setData(self, data):
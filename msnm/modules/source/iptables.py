@@ -17,13 +17,19 @@ from msnm.modules.config.configure import Configure
 from msnm.exceptions.msnm_exception import DataSourceError
 from msnm.modules.source.source import Source
 import sys
-import os
+import time
 import logging
-import shutil
+import numpy as np
 from msnm.modules.thread.thread import MSNMThread
 from msnm.utils import dateutils
 import traceback
 
+# Bit of each TCP flag, in the nfdump order (UAPRSF)
+TCP_FLAGS_BITS = {"URG": 32, "ACK": 16, "PSH": 8, "RST": 4, "SYN": 2, "FIN": 1}
+
+# TCP flags formatted as nfdump does (e.g., '.AP.S.'), by the sum of their bits
+TCP_FLAGS_TABLE = ["".join([f if bits & (32 >> i) else "." for i, f in enumerate("UAPRSF")]) for bits in range(64)]
+
 class IPTables(Source):
     """
 
@@ -36,6 +42,9 @@ class IPTables(Source):
     msnm.source
     """
 
+    # Columns of the CSV parsed files
+    COLUMNS = 'DATE,SRC,DST,SMAC,DMAC,TMAC,SPT,DPT,PROTO,TCP_FLAGS,EVENT'
+
     # Protocol constants
     TCP = "TCP"
     UDP = "UDP"
@@ -49,6 +58,31 @@ class IPTables(Source):
     SYN_TCP_FLAG = "SYN"
     FIN_TCP_FLAG = "FIN"
 
+    # Single pass search of the timestamp, MAC (optional), IPs, protocol and ports of a log line.
+    # The MAC and the IPs are matched inside lookaheads, as atomic groups, so lines without ports
+    # fail without backtracking through all the previous fields.
+    LOG_LINE = re.compile(r"\b(?P<date>\w+\s+\d+\s\d+:\d+:\d+)"
+                          r"(?:(?=(?P<to_mac>.*?MAC=(?P<mac>\S*)(?=\s)))(?P=to_mac))?"
+                          r"(?=(?P<to_ips>.+SRC=(?P<src>[\d.]+)\s+DST=(?P<dst>[\d.]+)))(?P=to_ips)"
+                          r".*?PROTO=(?P<proto>\S*)(?=\s)"
+                          r".*?SPT=(?P<spt>\S*)(?=\s)\s+DPT=(?P<dpt>\d+)")
+
+    # TCP flags found in a log line (see get_tcp_flags())
+    TCP_FLAGS = re.compile(URG_TCP_FLAG + "(?=\s)|" + "|".join([ACK_TCP_FLAG, PSH_TCP_FLAG, RST_TCP_FLAG, SYN_TCP_FLAG, FIN_TCP_FLAG]))
+
+    # Buffer size of the CSV parsed files
+    CSV_BUFFER_SIZE = 1024 * 1024
+
+    # Months of the syslog timestamps
+    MONTHS = {'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+              'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
+
+    def __init__(self):
+        super(IPTables,self).__init__()
+
+        # Formatted syslog timestamps, by timestamp and format
+        self._syslog_dates = {}
+
     def parse(self, file_to_parse, file_parsed, **kwargs):
         '''
         CSV parsing of a iptables log file portion as the input param ``file_to_parse``. The parsed CSV files is saved as the ``file_parsed`` param.
@@ -69,125 +103,110 @@ class IPTables(Source):
 
         method_name = "parse()"
 
-        dateFormat = self.config.get_config()['GeneralParams']['dateFormat']
-        # super(IPTables, self).parse(file_to_parse)
+        try:
+
+            # Note: with is in charge of to open and close the file
+            with open(file_to_parse) as my_file:
+                parsed_lines = self.parse_lines(my_file)
+
+            # Save in csv as input of the PARSER
+            self.save_csv(parsed_lines, file_parsed)
+
+        except DataSourceError as dse:
+            raise dse
+        except Exception:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            traceback.print_exception(exc_type, exc_value, exc_traceback ,limit=5, file=sys.stdout)
+            raise DataSourceError(self, sys.exc_info()[0], method_name)
+
+    def parse_lines(self, log_lines):
+        '''
+        CSV parsing of iptables log lines, in memory. The lines are parsed following the nfdump format tool.
 
-        TS_IP = re.compile(r"(\w+\s+\d+\s\d+:\d+:\d+).+SRC=([\d.]+)\s+DST=([\d.]+)")  # search for ts and IPs
-        PORTS = re.compile("SPT=(.*?(?=\s))\s+DPT=(\d+)")  # search for ports
-        PROTO = re.compile("PROTO=(.*?(?=\s))")  # search PROTO= string followed by any character and any number or repetitions until the first white space
-        MAC = re.compile("MAC=(.*?(?=\s))")  # search MAC= string followed by any character and any number or repetitions until the first white space
+        Parameters
+        ----------
+        log_lines: iterable
+            Iptables log lines to parse
+
+        Return
+        ------
+        parsed_lines: list
+            CSV lines (without the header of columns) as input of the flow parser
+
+        Raises
+        ------
+        DataSourceError
+
+        '''
+
+        return [",".join(fields) for fields in self.parse_fields(log_lines)]
+
+    def parse_fields(self, log_lines):
+        '''
+        Parsing of iptables log lines into the fields of the CSV columns (see COLUMNS), in memory. The fields
+        are not joined as CSV lines, so they can be fed directly to the flow parser (see parse_observation()).
+
+        Parameters
+        ----------
+        log_lines: iterable
+            Iptables log lines to parse
+
+        Return
+        ------
+        parsed_fields: list
+            One tuple of fields (str) per parsed line, in the order of COLUMNS
+
+        Raises
+        ------
+        DataSourceError
+
+        '''
+
+        method_name = "parse_fields()"
+
+        dateFormat = self.config.get_config()['GeneralParams']['dateFormat']
 
         try:
 
-            # contains all parsed csv lines
-            parsed_lines = []
+            # contains all parsed rows
+            parsed_fields = []
 
-            # csv parsed file columns
-            columns='DATE,SRC,DST,SMAC,DMAC,TMAC,SPT,DPT,PROTO,TCP_FLAGS,EVENT'
+            # Registered firewall events
+            event_id = 1
 
-            # Note: with is in charge of to open and close the file
-            with open(file_to_parse) as my_file:
+            for line in log_lines:
 
-                #df = pd.DataFrame(columns=columns, dtype=int)
-
-                # Registered firewall events
-                event_id = 1
-
-                for line in my_file:
-
-                    try:
-
-                        # Search for IPs
-                        ts_ip_port_match = TS_IP.search(line)
-
-                        # Get timestamp
-                        date = ts_ip_port_match.group(1)
-
-                        # Format the date of the log
-                        # date = datetime.strptime(date, '%b %d %H:%M:%S')
-                        date = parser.parse(date)  # It manages all date format. Solves the issue found when using 'Aug  3 18:20:19'
-                        date = date.replace(year=datetime.now().year)
-                        date = date.strftime(dateFormat)
-
-                        # Time stamp and Ips and ports
-                        # Get the fields from *.log according to the groups in the regexp
-                        src_addr = ts_ip_port_match.group(2)
-                        dst_addr = ts_ip_port_match.group(3)
-
-                        # Search for ports
-                        ports_match = PORTS.search(line)
-                        src_port = ports_match.group(1)
-                        dst_port = ports_match.group(2)
-
-                        # Search for MAC
-                        mac_match = MAC.search(line)
-
-                        # Check if MAC field exists
-                        if mac_match:
-                            # Get MAC
-                            mac = mac_match.group(1)
-                            dst_mac, src_mac, type_mac = self.get_params_from_mac(mac)
-                        else:
-                            dst_mac = ""
-                            src_mac = ""
-                            type_mac = ""
-
-                        # Search for the protocol
-                        protocol_match = PROTO.search(line)
-                        protocol = protocol_match.group(1)
-
-                        if protocol == self.TCP:
-                            # Call super method format_tcp_flags()
-                            tcp_flags = self.format_tcp_flags(self.get_tcp_flags(line), format_type='netflow')
-                        else:
-                            tcp_flags = ""
-
-                    except AttributeError:
-                        logging.warn("Attribute error: the iptables event cannot be parsed. Skipping line: %s",line)
-                        continue
-
-                    # Add new row to the dataframe
-                    #df.loc[len(df)] = [date, src_addr, dst_addr, src_mac, dst_mac, type_mac, src_port, dst_port, protocol, tcp_flags, str(event_id)]
-
-                    # Add new row to the list
-                    parsed_lines.append(date + "," + src_addr + "," + dst_addr + "," + src_mac + "," + dst_mac + "," + type_mac + ","
-                                        + src_port + "," + dst_port + "," + protocol + "," + tcp_flags + "," + str(event_id))
-                    # Registered firewal events (one per line)
-                    event_id = event_id + 1
-
-            #df2 = df.set_index('DATE')
-
-            # If there are optional parameters
-            #TODO: activate if needed --> NOTE, this block works with DATAFRAMES!
-#             if len(kwargs):
-#                 # Get the corresponding lines of iptables.log from the first to the end timestamp in netflo file
-#                 if 'netflow_dumps_path' in kwargs:
-#                     # Get the synchronized lines
-#                     df2 = self.get_synchronized_file_from_netflow_dump(df2, kwargs['netflow_dumps_path'])
-#                 else:
-#                     # Get the corresponding lines of iptables.log from a custom ts and sampling_rate minutes before.
-#                     if 'ts_master_source' in kwargs:
-#                         ts_master_source = kwargs['ts_master_source']
-#                     else:
-#                         # Current date by default
-#                         ts_master_source = datetime.now().strftime(dateFormat)
-#
-#                     # Check the optional parameter sampling rate to get a temporal slice of lines of the log file
-#                     if 'sampling_rate' in kwargs:
-#                         sampling_rate = kwargs['sampling_rate']
-#                     else:
-#                         # 1 minute by default
-#                         sampling_rate = 1
-#                     # Get the synchronized lines
-#                     df2 = self.get_synchronized_file(df2, ts_master_source, sampling_rate)
+                # Search for the timestamp, MAC, IPs, protocol and ports at once
+                match = self.LOG_LINE.search(line)
 
-            # Save in csv as input of the PARSER
-            #df2.to_csv(file_parsed, encoding='utf-8', header=False)
+                if match is None:
+                    logging.warn("Attribute error: the iptables event cannot be parsed. Skipping line: %s",line)
+                    continue
 
-            # Save in csv as input of the PARSER
-            with open(file_parsed,'w') as fl:
-                fl.write(columns + "\n")
-                fl.write("\n".join(parsed_lines))
+                date, mac, src_addr, dst_addr, protocol, src_port, dst_port = match.group('date', 'mac', 'src', 'dst', 'proto', 'spt', 'dpt')
+
+                # Format the date of the log
+                date = self.format_syslog_date(date, dateFormat)
+
+                # Check if MAC field exists
+                if mac is not None:
+                    dst_mac, src_mac, type_mac = self.get_params_from_mac(mac)
+                else:
+                    dst_mac = ""
+                    src_mac = ""
+                    type_mac = ""
+
+                if protocol == self.TCP:
+                    # TCP flags formatted as nfdump does
+                    tcp_flags = TCP_FLAGS_TABLE[sum(set(TCP_FLAGS_BITS[flag] for flag in self.TCP_FLAGS.findall(line)))]
+                else:
+                    tcp_flags = ""
+
+                # Add new row to the list
+                parsed_fields.append((date, src_addr, dst_addr, src_mac, dst_mac, type_mac,
+                                      src_port, dst_port, protocol, tcp_flags, str(event_id)))
+                # Registered firewal events (one per line)
+                event_id = event_id + 1
 
         except DataSourceError as dse:
             raise dse
@@ -196,10 +215,78 @@ class IPTables(Source):
             traceback.print_exception(exc_type, exc_value, exc_traceback ,limit=5, file=sys.stdout)
             raise DataSourceError(self, sys.exc_info()[0], method_name)
 
-        #return df2
+        return parsed_fields
+
+    def save_csv(self, parsed_lines, file_parsed):
+        '''
+        Saving parsed CSV lines, after the header of columns, through a buffered writer.
+
+        Parameters
+        ----------
+        parsed_lines: iterable
+            CSV lines (see parse_lines())
+        file_parsed: str
+            Path to the CSV output parsed file
+
+        '''
+
+        with open(file_parsed, 'w', buffering=self.CSV_BUFFER_SIZE) as fl:
+            fl.write(self.COLUMNS)
+            for line in parsed_lines:
+                fl.write("\n")
+                fl.write(line)
+
+    def format_syslog_date(self, date, dateFormat):
+        """
+        Formatting a syslog timestamp (without year) of the current year. The formatted timestamps are
+        cached, since the events of the same second share their timestamps.
+
+        Parameters
+        ----------
+        date: str
+            Syslog timestamp e.g., 'Aug  3 18:20:19'
+        dateFormat: str
+            Output format (see datetime.strftime)
+
+        Return
+        ------
+        formatted_date: str
+            Formatted timestamp
+
+        Example
+        -------
+        >>> print(format_syslog_date('Aug  3 18:20:19', '%Y-%m-%d %H:%M:%S'))
+        >>> # it should returns '2017-08-03 18:20:19' in 2017
+
+        """
+
+        try:
+            return self._syslog_dates[(date, dateFormat)]
+        except KeyError:
+            pass
+
+        year = datetime.now().year
+        fields = date.split()
+
+        try:
+            hour, minute, second = fields[2].split(':')
+            formatted_date = datetime(year, self.MONTHS[fields[0]], int(fields[1]), int(hour), int(minute), int(second))
+        except (KeyError, IndexError, ValueError):
+            # It manages all date format
+            formatted_date = parser.parse(date).replace(year=year)
+
+        formatted_date = formatted_date.strftime(dateFormat)
+
+        if len(self._syslog_dates) > 100000:
+            self._syslog_dates.clear()
+        self._syslog_dates[(date, dateFormat)] = formatted_date
+
+        return formatted_date
 
     def start(self):
         #overriden from Source
+        # Flow parser, built once for all the monitoring intervals
+        self.load_parser()
         self._iptablesThread = IPTablesThread(self)
         self._iptablesThread.setName("IPTablesThread")
         self._iptablesThread.start()
@@ -333,9 +420,15 @@ class IPTablesThread(MSNMThread):
         iptables_log_raw_folder = self.rootDataPath + self.config.get_config()['DataSources'][self._iptables_instance._type][self._iptables_instance.__class__.__name__]['raw']
         iptables_log_processed_folder = self.rootDataPath + self.config.get_config()['DataSources'][self._iptables_instance._type][self._iptables_instance.__class__.__name__]['processed']
         iptables_log_parsed_folder = self.rootDataPath + self.config.get_config()['DataSources'][self._iptables_instance._type][self._iptables_instance.__class__.__name__]['parsed']
-        iptables_flow_parser_config_file = self.config.get_config()['DataSources'][self._iptables_instance._type][self._iptables_instance.__class__.__name__]['parserConfig']; # Parser configuration file for iptables
+        # Are the intermediate files (log lines, csv and parser output) archived?
+        archive = self.config.get_config()['DataSources'][self._iptables_instance._type][self._iptables_instance.__class__.__name__].get('archive', False)
+        # Parser configuration for iptables
+        parser_contents = self.config.get_config()['DataSources'][self._iptables_instance._type][self._iptables_instance.__class__.__name__]['parserContents']
         timer = self.config.get_config()['GeneralParams']['dataSourcesScheduling']
 
+        # End of the current interval
+        t_end = time.time()
+
         try:
 
             # Doing until stop request
@@ -343,39 +436,52 @@ class IPTablesThread(MSNMThread):
 
                 logging.info("Running iptables thread ...")
 
+                # The intervals are consecutive: each one starts when the previous one ends
+                t_end = t_end + timer
+
                 logging.debug("Getting lines from file %s during %s seconds.",iptables_log, timer)
                 # Get the iptables logs
-                log_lines = self._iptables_instance.get_file_to_parse_time(iptables_log, timer)
+                log_lines = self._iptables_instance.get_file_to_parse_until(iptables_log, t_end, self._stopped_event)
 
                 # Time stamp
                 #ts = dateutils.get_timestamp()
                 # FIXED: every datasource has a common ts: the current monitoring interval timestamp
                 ts = self.config.get_config()['GeneralParams']['ts_monitoring_interval']
 
-                # Path for the backup
-                iptables_raw_log_file = iptables_log_raw_folder + "iptables_" + ts + ".log"
-                self._iptables_instance.save_file(log_lines, iptables_raw_log_file)
+                if archive:
+                    # Path for the backup
+                    iptables_raw_log_file = iptables_log_raw_folder + "iptables_" + ts + ".log"
+                    self._iptables_instance.save_file(log_lines, iptables_raw_log_file)
+
+                if archive or parser_contents['structured']:
+                    # Parse the fields of the *.csv columns
+                    parsed_fields = self._iptables_instance.parse_fields(log_lines)
+
+                if archive:
+                    iptables_log_processed_file = iptables_log_processed_folder + "iptables_" + ts + ".csv"
+                    self._iptables_instance.save_csv([",".join(fields) for fields in parsed_fields], iptables_log_processed_file)
 
-                # Parse it in *.csv format
-                logging.debug("Parsing file %s",iptables_raw_log_file)
-                iptables_log_processed_file = iptables_log_processed_folder + "iptables_" + ts + ".csv"
-                self._iptables_instance.parse(iptables_raw_log_file, iptables_log_processed_file)
+                # Flow parser, in memory: the fields go straight to the feature counters for structured
+                # parser configurations (no *.csv lines in between), and the logs otherwise
+                if parser_contents['structured']:
+                    records = parsed_fields
+                else:
+                    records = [line.rstrip('\n') for line in log_lines]
 
-                # Copy CSV file to parsed folder to be parsed by the flow parsed
-                iptables_log_parsed_file = iptables_log_parsed_folder + "iptables_" + ts + ".csv"
-                logging.debug("Copying file %s to %s ",iptables_log_processed_file, iptables_log_parsed_file)
-                shutil.copyfile(iptables_log_processed_file, iptables_log_parsed_file)
+                logging.debug("Running flow parser for %s records.",len(records))
+                obs = self._iptables_instance.parse_observation(records, fields=parser_contents['structured'])
 
-                # Flow parser
-                logging.debug("Running flow parser for %s file config.",iptables_flow_parser_config_file)
-                self._iptables_instance.launch_flow_parser(iptables_flow_parser_config_file)
+                if obs is None:
+                    # No iptables events during the interval
+                    obs = np.zeros(len(parser_contents[Source.S_VARIABLES]))
 
-                # Add the *.dat output from parser to the dict of generated files
-                self._iptables_instance._files_generated[ts] = iptables_log_parsed_folder + "output-iptables_" + ts + ".dat"
+                if archive:
+                    # Save the observation as the parser output
+                    iptables_log_parsed_file = iptables_log_parsed_folder + "output-iptables_" + ts + ".dat"
+                    np.savetxt(iptables_log_parsed_file, obs.reshape((1,obs.size)), fmt='%d', delimiter=",")
 
-                # Remove CSV file once it is parsed successfully
-                logging.debug("Deleting file %s",iptables_log_parsed_file)
-                os.remove(iptables_log_parsed_file)
+                # Add the observation to the dict of generated files
+                self._iptables_instance._files_generated[ts] = obs
 
 
         except DataSourceError as edse:
@@ -27,19 +27,122 @@ import numpy as np
 from msnm.modules.com.packet import DataPacket, Packet
 from msnm.modules.com.networking import TCPClient, TCPClientThread
 import pandas as pd
+import threading
+import queue
+from collections import deque
+from msnm.modules.store.store import ObservationStore, STORES
+from msnm.modules.ma.mspc import MSPC
 
 class SourceManager(Source):
 
     def __init__(self, sensor):
         self._sensor = sensor
         self._sources = {} # Contains all data sources ('Source name', source_instance)
-        self._batch = {}
         self._packet_sent = 0
-        self._current_batch_obs = 0
+        self._diagnosis_rule = None # Control limit rule to diagnose an observation
+        self._diagnosis_thread = None # Worker doing the diagnosis of the observations
+        self._stores = {} # Columnar stores of the observations, statistics and diagnosis vectors
+        self._stores_lock = threading.Lock()
 
     def set_data_sources(self,sources):
         self._sources = sources
 
+    def get_store(self, name):
+        """
+        Gets one of the columnar stores of the sensor (see ObservationStore), which is opened 
+        the first time in its path of the sensor configuration:
+
+            - 'obs': complete observations, in the ``observation`` path
+            - 'output': Q and D statistics and their control limits, in the ``output`` path
+            - 'diagnosis': diagnosis vectors, in the ``diagnosis`` path
+
+        Parameters
+        ----------
+        name: str
+            Store name
+
+        Return
+        ------
+        store: ObservationStore
+        """
+
+        with self._stores_lock:
+            if name not in self._stores:
+                config = Configure()
+                rootDataPath = config.get_config()['GeneralParams']['rootPath']
+
+                # Path of the store in the sensor configuration
+                store_path = rootDataPath + config.get_config()['Sensor'][dict((i[0],i[1]) for i in STORES)[name]]
+
+                if name == 'output':
+                    columns = ['Q','D','UCLq','UCLd']
+                else:
+                    columns = datautils.getAllVarNames()
+
+                self._stores[name] = ObservationStore(store_path, name, columns)
+
+            return self._stores[name]
+
+    def start_diagnosis(self):
+        """
+        Starts the worker thread in charge of the diagnosis of the observations out of control
+        (see ``launch_diagnosis()``). The control limit rule and the size of its queue are taken
+        from the ``diagnosisRule`` section of the sensor configuration.
+        """
+
+        config = Configure()
+        rule_params = config.get_config()['Sensor'].get('diagnosisRule') or {}
+
+        self._diagnosis_rule = ControlLimitRule(statistics=rule_params.get('statistics',['Q','D']),
+                                                k=rule_params.get('k',1), n=rule_params.get('n',1))
+        self._diagnosis_thread = DiagnosisThread(self.get_store('diagnosis'), rule_params.get('queueSize',10))
+        self._diagnosis_thread.setName("DiagnosisThread")
+        self._diagnosis_thread.start()
+
+    def stop_diagnosis(self):
+        """
+        Stops the diagnosis worker thread
+        """
+        if self._diagnosis_thread is not None:
+            self._diagnosis_thread.stop()
+
+    def launch_diagnosis(self, ts, test, Qst, Dst):
+        """
+        Once the monitoring of an observation is done, checks the control limit rule and, only if
+        it fires, queues the observation to be diagnosed by the worker thread. The observations in
+        control are not diagnosed.
+
+        Parameters
+        ----------
+        ts: str
+            Timestamp of the observation
+        test: numpy.ndarray
+            [1xM] observation
+        Qst: float
+            Q statistic of the observation
+        Dst: float
+            D statistic of the observation
+
+        Return
+        ------
+        queued: bool
+            True if the observation is queued for its diagnosis
+        """
+
+        if self._diagnosis_thread is None:
+            self.start_diagnosis()
+
+        model = self._sensor.get_model()
+        mspc = model.get_mspc()
+
+        if not self._diagnosis_rule.check(Qst, Dst, mspc.getUCLQ(), mspc.getUCLD()):
+            logging.debug("Observation at %s in control: no diagnosis.",ts)
+            return False
+
+        # The model may be refreshed while the observation waits in the queue, so the worker gets
+        # the observation preprocessed and the P*P' of the model that monitored it
+        return self._diagnosis_thread.add(ts, model.preprocess(test), model.get_loadings_product())
+
     def get_number_source_variables(self, source, source_name):
         # TODO: get this parameter from the flow parser sources configuration
         config = Configure()
@@ -67,18 +170,13 @@ class SourceManager(Source):
 
         # Configuration
         config = Configure()
-        # Get root path for creating data files
-        rootDataPath = config.get_config()['GeneralParams']['rootPath']
 
-        obs_generated_path = rootDataPath + config.get_config()['Sensor']['observation'] # path to save the complete observation joining all data sources
         batch_obs = config.get_config()['Sensor']['dynamiCalibration']['B'] # number of observation in a batch for EWMA calibration
         lambda_param = config.get_config()['Sensor']['dynamiCalibration']['lambda'] # fogetting parameter for EWMA calibration
         dyn_cal_enabled = config.get_config()['Sensor']['dynamiCalibration']['enabled'] # is the dynamic calibration activated?
-        output_generated_path = rootDataPath + config.get_config()['Sensor']['output'] # path to save the Q and T statistics obtained from the previous observation
         missingDataMethods = config.get_config()['Sensor']['missingData']['missingDataMethods'] # Missing data available methods
         missingDataSelectedMethod = config.get_config()['Sensor']['missingData']['selected'] # Get the selected missing data method
         missingDataModule = config.get_config()['Sensor']['missingData']['missingDataModule'] # Missing data available methods
-        valuesFormat = config.get_config()['GeneralParams']['valuesFormat'] # how the variables of the complete observation are saved
 
         logging.debug("Launch monitoring for %s ",ts)
 
@@ -90,13 +188,17 @@ class SourceManager(Source):
                 # Get the number of variables of source i
                 i_variables = self.get_number_source_variables(self._sources[i],i)
                 logging.debug("Source %s has %s variables.",i,i_variables)
-                # Get the source output parsed file for the current
+                # Get the source output parsed file (or observation) for the current
                 i_parsed_file = self._sources[i]._files_generated[ts]
                 logging.debug("File generated of source %s at %s: %s",i,ts,i_parsed_file)
 
-                if i_parsed_file:
+                if i_parsed_file is not None:
+                    # Observation parsed in memory
+                    if isinstance(i_parsed_file, np.ndarray):
+                        i_test = i_parsed_file
+
                     # Load the file
-                    if self._sources[i]._type == Source.TYPE_L:
+                    elif self._sources[i]._type == Source.TYPE_L:
 
                         # static mode?
                         # TODO: next version
@@ -143,67 +245,39 @@ class SourceManager(Source):
                 # Calling the corresponding method
                 test = missingDataMethod(obs=test,model=self._sensor._model)
 
-            obs_generate_file = obs_generated_path + "obs_" + ts + ".dat"
-            np.savetxt(obs_generate_file, test, fmt=valuesFormat,delimiter=",", header=str(datautils.getAllVarNames()),comments="#")
+            # Save the observation
+            self.get_store('obs').append(ts, test)
 
             logging.debug("Observation generated of %s variables at %s.",test.size,ts)
 
             # if the dynamic calibration enabled?
             if dyn_cal_enabled:
 
-                # Increments the number of observation
-                self._current_batch_obs = self._current_batch_obs + 1
+                # The observation updates the sums of the current batch, and the model
+                # is refreshed once the batch is complete
+                logging.debug("obs %s added to the dynamic calibration batch.",ts)
+                self._sensor.do_streaming_calibration(test,B=batch_obs,phase=2,lv=3,lamda=lambda_param)
 
-                logging.debug("obs %s added to the batch as number %s.",ts,self._current_batch_obs)
-
-                # Add the observation
-                self._batch[ts] = {}
-                self._batch[ts]['file'] = obs_generate_file
-                self._batch[ts]['data'] = test
-
-                # Once we reached the number of batch observations, we can do the dynamic calibration
-                if self._current_batch_obs == batch_obs:
-                    # data for calibration
-                    x = np.array([])
-                    x = x.reshape((0,test.size))
-
-                    # Build the [NxM] data for the calibration
-                    #print(self._batch.keys())
-                    for i in list(self._batch.keys()):
-                        logging.debug("batch at %s -> %s", i, self._batch[i]['data'].shape)
-                        x = np.vstack((x,self._batch[i]['data']))
-
-                    #print(x)
-                    #print(type(x))
-
-                    # Build the model
-                    self._sensor.set_data(x)
-                    self._sensor.do_dynamic_calibration(phase=2,lv=3,lamda=lambda_param)
-
-                    # Reset the counter
-                    self._current_batch_obs = 0
-
-                    # Removing all batch observations
-                    self._batch.clear()
-
-            # Do monitoring
-            Qst, Dst = self._sensor.do_monitoring(test)
+            # Do monitoring: the statistics are computed without the MSPC instance shared by the sensor
+            Q, D = self._sensor.score(test)
+            Qst, Dst = Q[0], D[0]
 
         except SensorError as ese:
             raise MSNMError(self, ese.get_msg() ,method_name)
         except MSNMError as emsnme:
             raise emsnme
 
-        logging.debug("MONITORING --> UCLd: %s | Dst: %s",self._sensor.get_model().get_mspc().getUCLD(),self._sensor.get_mspc().getDst())
-        logging.debug("MONITORING --> UCLq: %s | Qst: %s",self._sensor.get_model().get_mspc().getUCLQ(),self._sensor.get_mspc().getQst())
+        # Qst and Dst are those returned by score() for this observation. The control limits are read
+        # once from the MSPC instance of the model, so the log and the output store get the same values
+        model_mspc = self._sensor.get_model().get_mspc()
+        UCLq, UCLd = model_mspc.getUCLQ(), model_mspc.getUCLD()
+
+        logging.debug("MONITORING --> UCLd: %s | Dst: %s",UCLd,Dst)
+        logging.debug("MONITORING --> UCLq: %s | Qst: %s",UCLq,Qst)
 
-        # Save the generated statistics
-        output_generated_file = output_generated_path + "output_" + ts + ".dat"
-        header = "msnm: UCLq:" + str(self._sensor.get_model().get_mspc().getUCLQ()) + ", UCLd:" + str(self._sensor.get_model().get_mspc().getUCLD())
-        list_array = [self._sensor.get_mspc().getQst(),self._sensor.get_mspc().getDst()]
-        statistics = np.array(list_array)
-        statistics = statistics.reshape((1,statistics.size))
-        np.savetxt(output_generated_file, statistics, fmt=valuesFormat, delimiter=",", newline=', ', header=header, comments=ts + ' ')
+        # Save the generated statistics and their control limits
+        statistics = [Qst, Dst, UCLq, UCLd]
+        self.get_store('output').append(ts, statistics)
 
 
         # Gets the remote sensor addressed to send the packet
@@ -219,8 +293,8 @@ class SourceManager(Source):
             dataPacket.fill_header({'id': self._packet_sent, 'sid':config.get_config()['Sensor']['sid'],
                                     'ts': config.get_config()['GeneralParams']['ts_monitoring_interval'],
                                     'type': Packet.TYPE_D})
-            dataPacket.fill_body({'Q': self._sensor.get_mspc().getQst(),
-                                  'D': self._sensor.get_mspc().getDst()})
+            dataPacket.fill_body({'Q': Qst,
+                                  'D': Dst})
 
             logging.debug("Remote sources to send the packet #%s: %s",self._packet_sent,remote_addresses)
 
@@ -239,6 +313,9 @@ class SourceManagerMasterThread(MSNMThread):
         super(SourceManagerMasterThread,self).__init__()
         self._sourceManager_instance = sourceManager_instance
 
+    def on_stop(self):
+        self._sourceManager_instance.stop_diagnosis()
+
     def run(self):
 
         logging.info("Running Source Master Manager ...")
@@ -251,6 +328,9 @@ class SourceManagerMasterThread(MSNMThread):
         timeout = config.get_config()['GeneralParams']['dataSourcesNotReadyWaitingTime']
 
         try:
+            # Worker for the diagnosis of the observations out of control
+            self._sourceManager_instance.start_diagnosis()
+
             # Monitoring interval counter
             c_interval = 1
 
@@ -339,8 +419,6 @@ class IntervalMonitoringSourceManagerThread(MSNMThread):
         rootDataPath = config.get_config()['GeneralParams']['rootPath']
 
         timer = config.get_config()['GeneralParams']['dataSourcesPolling']
-        diagnosis_backup_path = rootDataPath + config.get_config()['Sensor']['diagnosis'] # path to save diagnosis vector output
-        valuesFormat = config.get_config()['GeneralParams']['valuesFormat'] # how the variables of the complete observation are saved
 
 
         try:
@@ -403,18 +481,8 @@ class IntervalMonitoringSourceManagerThread(MSNMThread):
                             # Do monitoring
                             test, Qst, Dst = self._sourceManager_instance.launch_monitoring(self._ts)
 
-                            # Set up which observations are compared
-                            dummy = np.zeros((1,test.shape[0]))
-                            # We evaluate the observation 1
-                            dummy[0,0] = 1
-
-                            # Do diagnosis
-                            diagnosis_vec = self._sourceManager_instance._sensor.do_diagnosis(test, dummy)
-
-                            # Save the diagnosis
-                            diagnosis_backup_file = diagnosis_backup_path + "diagnosis_" + self._ts + ".dat"
-                            #datautils.save2json(diagnosis_vec.tolist(), diagnosis_backup_file)
-                            np.savetxt(diagnosis_backup_file, diagnosis_vec, fmt=valuesFormat,delimiter=",", header=str(datautils.getAllVarNames()),comments="#")
+                            # Diagnosis of the observation, only if it is out of control (done by the diagnosis thread)
+                            self._sourceManager_instance.launch_diagnosis(self._ts, test, Qst, Dst)
 
 
                             if not remote_addresses:
@@ -435,3 +503,165 @@ class IntervalMonitoringSourceManagerThread(MSNMThread):
             exc_type, exc_value, exc_traceback = sys.exc_info()
             traceback.print_exception(exc_type, exc_value, exc_traceback ,limit=5, file=sys.stdout)
             raise DataSourceError(self, detail, method_name)
+
+
+class ControlLimitRule(object):
+    """
+
+    *ControlLimitRule*. Decides when an observation is out of control and has to be diagnosed. An observation
+    exceeds the control limits when any of the selected statistics is above its control limit (e.g., Q > UCLq).
+    The rule fires for an observation that exceeds the control limits when at least ``k`` of the last ``n``
+    observations (including it) exceed them too.
+
+    Attributes
+    ----------
+    _statistics: list
+        Statistics compared with their control limits: 'Q', 'D' or both
+    _k: int
+        Minimum number of exceedances in the window of observations
+    _history: collections.deque
+        Exceedances of the last ``n`` observations
+    _lock: threading.Lock
+        Lock of the history, shared by the monitoring intervals
+
+    Example
+    -------
+    >>> # 2 of 3 consecutive observations with Q > UCLq
+    >>> rule = ControlLimitRule(statistics=['Q'], k=2, n=3)
+    >>> rule.check(12.0, 1.0, 10.0, 5.0)
+    False
+    >>> rule.check(3.0, 1.0, 10.0, 5.0)
+    False
+    >>> rule.check(15.0, 1.0, 10.0, 5.0)
+    True
+
+    """
+
+    def __init__(self, statistics=['Q','D'], k=1, n=1):
+
+        method_name = "__init__()"
+
+        if isinstance(statistics, str):
+            statistics = [statistics]
+
+        if not statistics or not set(statistics) <= set(['Q','D']):
+            raise DataSourceError(self, "Unknown statistics for the diagnosis rule: %s" % statistics, method_name)
+
+        if k < 1 or n < k:
+            raise DataSourceError(self, "Wrong diagnosis rule: %s of %s observations" % (k,n), method_name)
+
+        self._statistics = list(statistics)
+        self._k = k
+        self._history = deque(maxlen=n)
+        self._lock = threading.Lock()
+
+    def check(self, Qst, Dst, UCLq, UCLd):
+        """
+        Adds an observation to the window of the rule, and checks if it has to be diagnosed
+
+        Parameters
+        ----------
+        Qst: float
+            Q statistic of the observation
+        Dst: float
+            D statistic of the observation
+        UCLq: float
+            Upper control limit of the Q statistic
+        UCLd: float
+            Upper control limit of the D statistic
+
+        Return
+        ------
+        fired: bool
+            True if the observation has to be diagnosed
+        """
+
+        exceeded = ('Q' in self._statistics and Qst > UCLq) or ('D' in self._statistics and Dst > UCLd)
+
+        with self._lock:
+            self._history.append(bool(exceeded))
+            return bool(exceeded) and sum(self._history) >= self._k
+
+
+class DiagnosisThread(MSNMThread):
+    """
+
+    *DiagnosisThread*. Worker doing the oMEDA diagnosis of the queued observations and saving the diagnosis
+    vectors in the diagnosis store, out of the monitoring interval threads. The queue is bounded: when it
+    is full, the new observations are not diagnosed.
+
+    Attributes
+    ----------
+    _mspc: MSPC
+        MSPC instance of the worker, not shared with the monitoring
+    _store: ObservationStore
+        Store of the diagnosis vectors
+    _queue: queue.Queue
+        Observations (ts, testcs, PPt) waiting for their diagnosis
+
+    """
+
+    def __init__(self, store, maxsize=10):
+        super(DiagnosisThread,self).__init__()
+        self._mspc = MSPC()
+        self._store = store
+        self._queue = queue.Queue(maxsize)
+
+    def add(self, ts, testcs, PPt):
+        """
+        Queues an observation for its diagnosis
+
+        Parameters
+        ----------
+        ts: str
+            Timestamp of the observation
+        testcs: numpy.ndarray
+            [1xM] preprocessed observation
+        PPt: numpy.ndarray
+            [MxM] Product P*P' of the loadings of the model that monitored the observation
+
+        Return
+        ------
+        queued: bool
+            False if the queue is full and the observation is discarded
+        """
+        try:
+            self._queue.put_nowait((ts, testcs, PPt))
+        except queue.Full:
+            logging.warning("Diagnosis queue full: observation at %s will not be diagnosed.",ts)
+            return False
+
+        logging.debug("Observation at %s queued for its diagnosis.",ts)
+
+        return True
+
+    def run(self):
+
+        logging.info("Running diagnosis thread ...")
+
+        while not self._stopped_event.is_set():
+
+            try:
+                ts, testcs, PPt = self._queue.get(timeout=1)
+            except queue.Empty:
+                continue
+
+            try:
+                # Set up which observations are compared: we evaluate the observation 1
+                dummy = np.zeros((1,testcs.shape[0]))
+                dummy[0,0] = 1
+
+                # Do diagnosis (oMEDA)
+                diagnosis_vec = self._mspc.computeoMEDABatch(testcs, dummy, PPt)
+
+                # Save the diagnosis
+                self._store.append(ts, diagnosis_vec)
+
+                logging.debug("Diagnosis of the observation at %s saved.",ts)
+
+            except MSNMError as emsnme:
+                logging.error("Error in the diagnosis of the observation at %s: %s",ts,emsnme.get_msg())
+            except Exception as detail:
+                logging.error("Error in the diagnosis of the observation at %s. Type: %s, msg: %s",ts,sys.exc_info()[0],detail)
+            finally:
+                self._queue.task_done()
@@ -16,9 +16,10 @@ from watchdog.observers import Observer
 from msnm.modules.config.configure import Configure
 from msnm.exceptions.msnm_exception import DataSourceError
 from subprocess import call
+from fcparser import nfcapd
+import numpy as np
 import sys
 import logging
-import pandas as pd
 import shutil
 import os
 
@@ -29,6 +30,9 @@ class Netflow(Source):
     def __init__(self):
         super(Netflow,self).__init__()
 
+        # Flow parser, built once for all the monitoring intervals
+        self.load_parser()
+
         # Listen for new nfcapd files
         event_handler = NetFlowFileEventHandler(self)
         try:
@@ -107,28 +111,27 @@ class Netflow(Source):
 
         logging.info("Running nfdump ...")
 
-        # Call to nfdump process.
-        retcode = call("nfdump -r " + str(nfcapd_file_path) + " -q -o csv >> " + output_file_path,shell=True)
-
-        if retcode != 0:
-            raise DataSourceError(self,"Error calling nfdump", method_name)
-
-        logging.debug("New nfdump csv generated: %s",output_file_path)
-
+        # Stream the nfdump output to the csv file, without intermediate files
+        count = 0
         try:
-            # add new id column to merge in parser
-            # TODO: build a more elaborated method to do this e.g., from a dateframe utils package
-            df = pd.read_csv(output_file_path,header=None, index_col=0)
-            df.loc[:,df.shape[1]] = list(range(100000, 100000 + df.shape[0]))
-            df.to_csv(output_file_path, encoding='utf-8', header=False)
+            with open(output_file_path, 'a') as output_file:
+                for line in nfcapd.readFlows(str(nfcapd_file_path)):
+                    # replace the last column by an id to merge in parser
+                    fields = line.rstrip('\n').split(',')
+                    fields[-1] = str(100000 + count)
+                    output_file.write(','.join(fields) + '\n')
+                    count += 1
+
+        except IOError as e:
+            logging.error("Error calling nfdump: %s", e)
+            raise DataSourceError(self,"Error calling nfdump", method_name)
 
-        except ValueError:
+        if count == 0:
             # FIXME: Sometimes nfcapd generates an empty file :( I do not why :(
-            logging.warn("Nfdump file is empty, skipping ... ERROR: %s ",sys.exc_info()[0])
+            logging.warn("Nfdump file is empty, skipping ...")
             raise DataSourceError(self,"Nfdump file is empty ....", method_name)
 
-        except Exception:
-            raise DataSourceError(self,sys.exc_info()[0], method_name)
+        logging.debug("New nfdump csv generated: %s",output_file_path)
 
 
 class NetFlowFileEventHandler(FileSystemEventHandler):
@@ -156,7 +159,8 @@ class NetFlowFileEventHandler(FileSystemEventHandler):
         netflow_log_raw_folder = rootDataPath + config.get_config()['DataSources'][self._netflow_instance._type][self._netflow_instance.__class__.__name__]['raw']
         netflow_log_processed_folder = rootDataPath + config.get_config()['DataSources'][self._netflow_instance._type][self._netflow_instance.__class__.__name__]['processed']
         netflow_log_parsed_folder = rootDataPath + config.get_config()['DataSources'][self._netflow_instance._type][self._netflow_instance.__class__.__name__]['parsed']
-        netflow_flow_parser_config_file = rootDataPath + config.get_config()['DataSources'][self._netflow_instance._type][self._netflow_instance.__class__.__name__]['parserConfig']; # Parser configuration file for netflow
+        # Are the intermediate files (nfcapd copy, nfdump csv and parser output) archived?
+        archive = config.get_config()['DataSources'][self._netflow_instance._type][self._netflow_instance.__class__.__name__].get('archive', False)
 
         #TODO: to be enabled
         #staticMode = config.get_config()['DataSources'][self._netflow_instance._type][self._netflow_instance.__class__.__name__]['staticMode'];
@@ -174,32 +178,40 @@ class NetFlowFileEventHandler(FileSystemEventHandler):
 
             if not staticMode: # dynamic mode
 
-                # Get *.csv from nfcapd file
-                netflow_log_processed_file = netflow_log_processed_folder + "netflow_" + ts + ".csv"
-                self._netflow_instance.run_nfdump(event.dest_path, netflow_log_processed_file)
-
-                # Copy nfcapd file recently generated in raw folder
-                netflow_log_raw_file = netflow_log_raw_folder + "nfcapd_" + ts
-                logging.debug("Copying netflow raw file %s to %s ",event.dest_path, netflow_log_raw_file)
-                shutil.copyfile(event.dest_path, netflow_log_raw_file)
-
-                # Copy CSV file to parsed folder to be parsed by the flow parsed
-                netflow_log_parsed_file = netflow_log_parsed_folder + "netflow_" + ts + ".csv"
-                logging.debug("Copying netflow processed file %s to %s ",netflow_log_processed_file, netflow_log_parsed_file)
-                shutil.copyfile(netflow_log_processed_file, netflow_log_parsed_file)
-
-                # Flow parser
-                logging.debug("Running flow parser for %s file config.",netflow_flow_parser_config_file)
-                self._netflow_instance.launch_flow_parser(netflow_flow_parser_config_file)
-
-                # Add the *.dat output from parser to the dict of generated files
-                self._netflow_instance._files_generated[ts] = netflow_log_parsed_folder + "output-netflow_" + ts + ".dat"
-
-                logging.debug("Files generated for Netflow a ts: {0} --> {1}".format(ts, self._netflow_instance._files_generated[ts]))
-
-                # Remove CSV file once it is parsed succesfully
-                logging.debug("Deleting file %s",netflow_log_parsed_file)
-                os.remove(netflow_log_parsed_file)
+                if archive:
+                    # Get *.csv from nfcapd file
+                    netflow_log_processed_file = netflow_log_processed_folder + "netflow_" + ts + ".csv"
+                    self._netflow_instance.run_nfdump(event.dest_path, netflow_log_processed_file)
+
+                    # Copy nfcapd file recently generated in raw folder
+                    netflow_log_raw_file = netflow_log_raw_folder + "nfcapd_" + ts
+                    logging.debug("Copying netflow raw file %s to %s ",event.dest_path, netflow_log_raw_file)
+                    shutil.copyfile(event.dest_path, netflow_log_raw_file)
+
+                    # Flow parser from the archived *.csv
+                    with open(netflow_log_processed_file,'r') as records:
+                        obs = self._netflow_instance.parse_observation(records)
+                else:
+                    # Flow parser directly from the nfdump output
+                    try:
+                        obs = self._netflow_instance.parse_observation(nfcapd.readFlows(event.dest_path))
+                    except IOError as e:
+                        logging.error("Error calling nfdump: %s", e)
+                        raise DataSourceError(self,"Error calling nfdump", method_name)
+
+                if obs is None:
+                    # FIXME: Sometimes nfcapd generates an empty file :( I do not why :(
+                    raise DataSourceError(self,"Nfdump file is empty ....", method_name)
+
+                if archive:
+                    # Save the observation as the parser output
+                    netflow_log_parsed_file = netflow_log_parsed_folder + "output-netflow_" + ts + ".dat"
+                    np.savetxt(netflow_log_parsed_file, obs.reshape((1,obs.size)), fmt='%d', delimiter=",")
+
+                # Add the observation to the dict of generated files
+                self._netflow_instance._files_generated[ts] = obs
+
+                logging.debug("Observation generated for Netflow a ts: {0}".format(ts))
 
             else: # static mode
 
@@ -15,7 +15,9 @@ from collections import deque
 from datetime import datetime
 from msnm.modules.config.configure import Configure
 from msnm.exceptions.msnm_exception import DataSourceError
-from fcparser import fcparser
+from msnm.modules.source.tail import LogTail
+from fcparser import fcparser, faaclib
+import numpy as np
 import sys, traceback
 import time
 import logging
@@ -29,7 +31,12 @@ class Source(object):
     Attributes
     ----------
     _files_generated: dict
-        Contains the observation file generated (*.dat) by each data source at a specific timestamp
+        Contains the observation generated by each data source at a specific timestamp: an array, when it is
+        parsed in memory, or the observation file (*.dat)
+    _tails: dict
+        Followed log files (:class:`~msnm.modules.source.tail.LogTail`), by path
+    _parser: FCParser
+        Persistent flow parser of the data source, built once from its parser configuration (see load_parser())
     _type: str
         Data source type:
             'local': Local source e.g., netflow, iptables, IDS, syslog, etc. that is located in the host where the sensor is deployed
@@ -54,6 +61,8 @@ class Source(object):
     def __init__(self):
         # TODO: add common attributes among data sources
         self._files_generated = {}
+        self._parser = None
+        self._tails = {}
         self._type = self.TYPE_L # Local source by default
         # Configuration
         self.config = Configure()
@@ -209,9 +218,9 @@ class Source(object):
 
         return d
 
-    def get_file_to_parse_time(self,file_to_parse, timer):
+    def get_file_to_parse_time(self,file_to_parse, timer, stopped_event=None):
         """
-        Getting last lines of specific file during a certain of the iptables logs to be parsed.
+        Getting the lines written in a specific file during a certain time (e.g., the iptables logs to be parsed).
         Although this method is initially conceived to work with iptables logs it could be
         used with similar files.
 
@@ -219,42 +228,62 @@ class Source(object):
         ----------
         file_to_parse: str
             Path to the whole iptables log file
-        backups_path: str
-            Path to save the 'n' lines extracted
-        nlastlines: int
-            The 'n' last lines to be extracted
+        timer: float
+            Time in seconds to gather lines
+        stopped_event: threading.Event
+            When set, the gathering is interrupted (optional)
 
         Return
         ------
-        d:
-            A string accordingly formated.
+        log_lines: list
+            Lines written in the file during that time
+
+        See Also
+        --------
+        get_file_to_parse_until()
+
+        """
+
+        return self.get_file_to_parse_until(file_to_parse, time.time() + timer, stopped_event)
+
+    def get_file_to_parse_until(self,file_to_parse, t_end, stopped_event=None):
+        """
+        Getting the lines written in a specific file until a certain time. The file is followed
+        across calls (see :class:`~msnm.modules.source.tail.LogTail`): the lines written after ``t_end`` are
+        returned in the next call, and rotated or truncated files are followed.
+
+        Parameters
+        ----------
+        file_to_parse: str
+            Path to the whole iptables log file
+        t_end: float
+            Ending time of the lines to gather (seconds since the epoch, as time.time())
+        stopped_event: threading.Event
+            When set, the gathering is interrupted (optional)
+
+        Return
+        ------
+        log_lines: list
+            Lines written in the file until ``t_end``
 
         Example
         -------
-        >>> formatted_string = format_tcp_flags_as_netflow(['ACK','PSH','SYN'])
-        >>> print(formatted_string)
-        >>> # it should returns '.AP.S.' as nfdump formats of the TCP flags
-
+        >>> t_end = time.time()
+        >>> while True:
+        >>>     t_end = t_end + 60
+        >>>     log_lines = self.get_file_to_parse_until('/var/log/iptables.log', t_end)
+        >>>     # log_lines contains the lines of a 60 seconds interval, without gaps between intervals
 
         """
 
-        method_name = "get_file_to_parse_time()"
+        method_name = "get_file_to_parse_until()"
 
         try:
+            # The file is followed from the first call
+            if file_to_parse not in self._tails:
+                self._tails[file_to_parse] = LogTail(file_to_parse)
 
-            # Log lines gathered from the file
-            log_lines = []
-
-            # Read only the n last lines of the file
-            with open(file_to_parse,'r') as f:
-                # Goes to the end of the file
-                f.seek(0,2)
-                # Computes the ending time in seconds
-                t_end = time.time() + timer
-                while time.time() < t_end:
-                    line = f.readline()
-                    if line:
-                        log_lines.append(line)
+            log_lines = self._tails[file_to_parse].read_until(t_end, stopped_event)
 
         except Exception:
             raise DataSourceError(self,sys.exc_info()[0],method_name)
@@ -317,6 +346,83 @@ class Source(object):
             traceback.print_exc()
             raise DataSourceError(self,sys.exc_info()[1],method_name)
 
+    def load_parser(self):
+
+        """
+        Build the flow parser of the data source from its parser configuration ('parserContents').
+        The parser is built only once, and its compiled state is kept between monitoring intervals.
+
+        Return
+        ------
+        parser: FCParser
+            The flow parser of the data source
+
+        Raises
+        ------
+        DataSourceError
+
+        """
+
+        method_name = "load_parser()"
+
+        if self._parser is None:
+            try:
+                source_config = self.config.get_config()['DataSources'][self._type][self.__class__.__name__]['parserContents']
+                self._parser = fcparser.FCParser(source_config)
+            except faaclib.ConfigError as e:
+                logging.error("Error loading the flow parser: %s",e.msg)
+                raise DataSourceError(self,e.msg,method_name)
+            except Exception:
+                logging.error("Error loading the flow parser: %s",sys.exc_info()[1])
+                raise DataSourceError(self,sys.exc_info()[1],method_name)
+
+            logging.debug("Flow parser loaded with %s features.",len(self._parser.features))
+
+        return self._parser
+
+    def parse_observation(self, records, fields=False):
+
+        """
+        In-memory parsing procedure (flow parser). The records are parsed by the persistent flow parser
+        of the data source (see load_parser()), without reading or writing any file.
+
+        Parameters
+        ----------
+        records: iterable
+            Lines (structured sources) or logs (unstructured sources) to be parsed
+        fields: bool
+            The records are lines of a structured source already split in fields (lists of str),
+            which are fed directly to the feature counters
+
+        Return
+        ------
+        obs: numpy.ndarray
+            The observation of the data source, one counter per feature. None if there are no records.
+
+        Raises
+        ------
+        DataSourceError
+
+        """
+
+        method_name = "parse_observation()"
+
+        parser = self.load_parser()
+
+        try:
+            if fields:
+                obs = parser.parseFields(records)
+            else:
+                obs = parser.parse(records)
+        except Exception:
+            logging.error("Error parsing data: %s",sys.exc_info()[1])
+            raise DataSourceError(self,sys.exc_info()[1],method_name)
+
+        if obs is None:
+            return None
+
+        return np.array(obs, dtype=float)
+
     def save_file(self,log_lines,path_to_save):
 
         method_name = "save_file()"
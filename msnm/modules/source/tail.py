@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+    :mod:`tail`
+    ===========================================================================
+    :synopsis: Incremental reader of growing log files (e.g., iptables logs)
+    :author: NESG (Network Engineering & Security Group) - https://nesg.ugr.es
+    :contact: nesg@ugr.es, rmagan@ugr.es
+    :organization: University of Granada
+    :project: VERITAS - MSNM Sensor
+    :since: 0.0.1
+"""
+
+import os
+import time
+import logging
+
+
+class LogTail(object):
+    """
+
+    *LogTail*. Follows a log file as ``tail -F`` does. The reading offset and the inode of the file
+    are kept between reads, so no line is lost or read twice between two batches. Rotated
+    (renamed or removed and created again) and truncated files are detected and followed.
+
+    Attributes
+    ----------
+    path: str
+        Path to the followed log file
+    poll: float
+        Waiting time in seconds between two reads when there are no new lines
+    _file: file
+        Opened log file
+    _inode: int
+        Inode of the opened log file
+    _pending: str
+        Last line read, until it is complete (ended by a new line)
+
+    Example
+    -------
+    >>> tail = LogTail('/var/log/iptables.log')
+    >>> t_end = time.time() + 60
+    >>> log_lines = tail.read_until(t_end)
+    >>> # log_lines contains the lines written in the log during the following 60 seconds
+
+    """
+
+    def __init__(self, path, poll=1.0, from_end=True):
+        """
+        Parameters
+        ----------
+        path: str
+            Path to the log file
+        poll: float
+            Waiting time in seconds between two reads when there are no new lines
+        from_end: bool
+            Start reading from the current end of the file (True) or from its beginning (False)
+        """
+        self.path = path
+        self.poll = poll
+        self._file = None
+        self._inode = None
+        self._pending = ""
+
+        self.open(from_end)
+
+    def open(self, from_end=False):
+        """
+        Opens the log file, if it exists
+
+        Parameters
+        ----------
+        from_end: bool
+            Start reading from the current end of the file
+
+        Return
+        ------
+        opened: bool
+            True if the log file is opened
+        """
+        try:
+            f = open(self.path, 'r')
+        except IOError:
+            return False
+
+        self._file = f
+        self._inode = os.fstat(f.fileno()).st_ino
+        if from_end:
+            f.seek(0, 2)
+
+        logging.debug("Following log file %s (inode %s) from offset %s.", self.path, self._inode, f.tell())
+
+        return True
+
+    def close(self):
+        """
+        Closes the log file. A last line not complete yet is discarded.
+        """
+        if self._file:
+            self._file.close()
+            self._file = None
+            self._inode = None
+        self._pending = ""
+
+    def read(self):
+        """
+        Reads the complete lines written in the log file since the last read
+
+        Return
+        ------
+        lines: list
+            New lines of the log file
+        """
+        lines = []
+
+        if self._file is None and not self.open():
+            return lines
+
+        lines.extend(self._read_lines())
+
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            # Rotated, and not created again yet: keep the old file
+            return lines
+
+        if st.st_ino != self._inode:
+            # Rotated: the rest of the old file, then the new one from its beginning
+            logging.debug("Log file %s rotated.", self.path)
+            lines.extend(self._read_lines())
+            # The old file is not written anymore: its last line is complete even without a new line
+            if self._pending:
+                lines.append(self._pending + '\n')
+            self.close()
+            if self.open():
+                lines.extend(self._read_lines())
+
+        elif st.st_size < self._file.tell():
+            # Truncated: start again from the beginning
+            logging.debug("Log file %s truncated.", self.path)
+            self._file.seek(0)
+            self._pending = ""
+            lines.extend(self._read_lines())
+
+        return lines
+
+    def read_until(self, t_end, stopped_event=None):
+        """
+        Reads the lines written in the log file until a given time. The file is read every
+        ``poll`` seconds, and once more at ``t_end``. The lines written afterwards are kept
+        for the next call.
+
+        Parameters
+        ----------
+        t_end: float
+            Ending time of the batch of lines (seconds since the epoch, as time.time())
+        stopped_event: threading.Event
+            When set, the waiting is interrupted (optional)
+
+        Return
+        ------
+        lines: list
+            Lines written in the log file until ``t_end``
+        """
+        lines = self.read()
+
+        while True:
+            remaining = t_end - time.time()
+            if remaining <= 0:
+                break
+
+            # Blocks without consuming CPU
+            if stopped_event is not None:
+                if stopped_event.wait(min(self.poll, remaining)):
+                    break
+            else:
+                time.sleep(min(self.poll, remaining))
+
+            lines.extend(self.read())
+
+        return lines
+
+    def _read_lines(self):
+        """
+        Reads the complete lines available in the opened log file
+        """
+        data = self._file.read()
+        if not data:
+            return []
+
+        lines = (self._pending + data).split('\n')
+
+        # The last line is not complete yet (empty if the data ends with a new line)
+        self._pending = lines.pop()
+
+        return [line + '\n' for line in lines]
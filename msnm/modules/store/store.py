@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+"""
+    :mod:`store`
+    ===========================================================================
+    :synopsis: Append-only columnar store of the observations, statistics and diagnosis vectors
+    :author: NESG (Network Engineering & Security Group) - https://nesg.ugr.es
+    :contact: nesg@ugr.es, rmagan@ugr.es
+    :organization: University of Granada
+    :project: VERITAS - MSNM Sensor
+    :since: 0.0.1
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+import threading
+import numpy as np
+from msnm.exceptions.msnm_exception import MSNMError
+
+
+class ObservationStore(object):
+    """
+
+    *ObservationStore*. Append-only columnar store of the rows generated by the sensor in each monitoring
+    interval (observations, statistics or diagnosis vectors), instead of one text file per row. The rows of
+    each day are appended as float64 values to a binary segment ``<name>_<YYYYMMDD>.bin``, and their
+    timestamps as int64 values to its index ``<name>_<YYYYMMDD>.idx``. The column names are saved once
+    in ``<name>.json``. The segments are memory-mapped to be read.
+
+    Timestamps are those of the monitoring intervals (see ``tsDateFormat``), starting with the day
+    (``'%Y%m%d...'``) and made up of digits only.
+
+    Attributes
+    ----------
+    _path: str
+        Directory of the store
+    _name: str
+        Name of the store, prefix of its files
+    _columns: list
+        Column names
+    _lock: threading.Lock
+        Lock of the appends
+
+    Example
+    -------
+    >>> store = ObservationStore('data/monitoring/output/', 'output', ['Q','D','UCLq','UCLd'])
+    >>> store.append('201806011200', [12.3, 2.1, 20.5, 9.8])
+    >>> store.append('201806011201', [10.7, 1.9, 20.5, 9.8])
+    >>> ts, statistics = store.read('201806011200', '201806011259')
+    >>> print(ts)
+    ['201806011200', '201806011201']
+
+    """
+
+    def __init__(self, path, name, columns=None):
+        """
+        Parameters
+        ----------
+        path: str
+            Directory of the store
+        name: str
+            Name of the store
+        columns: list
+            Column names. Only needed to create the store: by default, those saved in the store.
+        """
+
+        method_name = "__init__()"
+
+        self._path = path
+        self._name = name
+        self._lock = threading.Lock()
+
+        manifest_file = os.path.join(path, name + ".json")
+
+        try:
+            if os.path.exists(manifest_file):
+                with open(manifest_file, 'r') as f:
+                    self._columns = json.load(f)['columns']
+
+                if columns is not None and len(columns) != len(self._columns):
+                    raise MSNMError(self, "Store %s has %s columns, not %s" % (name, len(self._columns), len(columns)), method_name)
+
+            elif columns is not None:
+                if not os.path.exists(path):
+                    os.makedirs(path)
+
+                self._columns = list(columns)
+                with open(manifest_file, 'w') as f:
+                    json.dump({'columns': self._columns}, f)
+
+            else:
+                raise MSNMError(self, "Store %s does not exist in %s" % (name, path), method_name)
+
+        except (IOError, OSError, ValueError, KeyError):
+            raise MSNMError(self, sys.exc_info()[1], method_name)
+
+    def get_columns(self):
+        return self._columns
+
+    def append(self, ts, values):
+        """
+        Appends a row to the segment of its day
+
+        Parameters
+        ----------
+        ts: str
+            Timestamp of the row
+        values: numpy.ndarray
+            Row values, as many as columns
+
+        Raises
+        ------
+        MSNMError
+        """
+
+        method_name = "append()"
+
+        row = np.ascontiguousarray(values, dtype=np.float64).ravel()
+
+        if row.size != len(self._columns):
+            raise MSNMError(self, "Row of %s values in store %s of %s columns" % (row.size, self._name, len(self._columns)), method_name)
+
+        try:
+            data_file, index_file = self._segment(ts[:8])
+
+            with self._lock:
+                # Rows written without their ts, or a ts partially written (e.g., an interrupted append),
+                # are overwritten
+                rows = os.path.getsize(index_file) // 8 if os.path.exists(index_file) else 0
+                rows = min(rows, os.path.getsize(data_file) // row.nbytes if os.path.exists(data_file) else 0)
+
+                with open(data_file, 'ab') as f:
+                    f.truncate(rows * row.nbytes)
+                    f.write(row.tobytes())
+
+                with open(index_file, 'ab') as f:
+                    f.truncate(rows * 8)
+                    f.write(np.int64(ts).tobytes())
+
+        except (IOError, OSError, ValueError):
+            raise MSNMError(self, sys.exc_info()[1], method_name)
+
+    def days(self):
+        """
+        Days ('YYYYMMDD') with rows in the store, in ascending order
+        """
+        prefix = self._name + "_"
+
+        return sorted(i[len(prefix):-4] for i in os.listdir(self._path) if i.startswith(prefix) and i.endswith(".idx"))
+
+    def read(self, ts_from=None, ts_to=None):
+        """
+        Reads the rows of a range of timestamps. Only the segments of the days of the range are read.
+
+        Parameters
+        ----------
+        ts_from: str
+            First timestamp of the range (from the first row, by default)
+        ts_to: str
+            Last timestamp of the range (until the last row, by default)
+
+        Return
+        ------
+        ts: list
+            Timestamps of the rows, in the order they were appended
+        data: numpy.ndarray
+            [NxC] rows
+        """
+
+        method_name = "read()"
+
+        ts_list = []
+        data = []
+
+        try:
+            for day in self.days():
+                if (ts_from is not None and day < ts_from[:8]) or (ts_to is not None and day > ts_to[:8]):
+                    continue
+
+                day_ts, day_data = self._read_segment(day)
+
+                mask = np.ones(day_ts.size, dtype=bool)
+                if ts_from is not None:
+                    mask &= day_ts >= int(ts_from)
+                if ts_to is not None:
+                    mask &= day_ts <= int(ts_to)
+
+                ts_list.extend(str(i) for i in day_ts[mask])
+                data.append(day_data[mask])
+
+        except (IOError, OSError, ValueError):
+            raise MSNMError(self, sys.exc_info()[1], method_name)
+
+        if data:
+            data = np.vstack(data)
+        else:
+            data = np.empty((0, len(self._columns)))
+
+        return ts_list, data
+
+    def get(self, ts):
+        """
+        Gets the last row appended with a timestamp
+
+        Return
+        ------
+        row: numpy.ndarray
+            Row values, None if there is no row with that timestamp
+        """
+        ts_list, data = self.read(ts, ts)
+
+        if not ts_list:
+            return None
+
+        return data[-1]
+
+    def _segment(self, day):
+        """
+        Data and index files of the segment of a day
+        """
+        segment = os.path.join(self._path, self._name + "_" + day)
+
+        return segment + ".bin", segment + ".idx"
+
+    def _read_segment(self, day):
+        """
+        Reads the index of a segment and memory-maps its rows
+        """
+        data_file, index_file = self._segment(day)
+        width = len(self._columns)
+
+        day_ts = np.fromfile(index_file, dtype=np.int64)
+        rows = min(day_ts.size, os.path.getsize(data_file) // (8 * width))
+        day_ts = day_ts[:rows]
+
+        if rows == 0:
+            return day_ts, np.empty((0, width))
+
+        return day_ts, np.memmap(data_file, dtype=np.float64, mode='r', shape=(rows, width))
+
+
+def export_text(store, output_path, prefix, ts_from=None, ts_to=None, fmt='%1.5f'):
+    """
+    Exports the rows of a store to the legacy text files of the sensor, one file ``<prefix><ts>.dat``
+    per row, as they were written before the columnar store:
+
+        - ``obs_``: the observation in one line, with the variable names as header
+        - ``output_``: the Q and D statistics, with their control limits as header
+        - ``diagnosis_``: the diagnosis vector, one value per line, with the variable names as header
+
+    Parameters
+    ----------
+    store: ObservationStore
+        Store to export
+    output_path: str
+        Directory of the text files
+    prefix: str
+        Prefix of the text files ('obs_', 'output_' or 'diagnosis_')
+    ts_from: str
+        First timestamp to export
+    ts_to: str
+        Last timestamp to export
+    fmt: str
+        Format of the values
+
+    Return
+    ------
+    exported: int
+        Number of files exported
+    """
+
+    method_name = "export_text()"
+
+    ts_list, data = store.read(ts_from, ts_to)
+
+    try:
+        if not os.path.exists(output_path):
+            os.makedirs(output_path)
+
+        header = str(store.get_columns())
+
+        for ts, row in zip(ts_list, data):
+            output_file = os.path.join(output_path, prefix + ts + ".dat")
+
+            if prefix == "output_":
+                header = "msnm: UCLq:" + str(row[2]) + ", UCLd:" + str(row[3])
+                np.savetxt(output_file, row[:2].reshape((1,2)), fmt=fmt, delimiter=",", newline=', ', header=header, comments=ts + ' ')
+            elif prefix == "diagnosis_":
+                np.savetxt(output_file, row.reshape((row.size,1)), fmt=fmt, delimiter=",", header=header, comments="#")
+            else:
+                np.savetxt(output_file, row.reshape((1,row.size)), fmt=fmt, delimiter=",", header=header, comments="#")
+
+    except (IOError, OSError):
+        raise MSNMError(None, sys.exc_info()[1], method_name)
+
+    logging.info("Exported %s rows of the store %s to %s.", len(ts_list), prefix, output_path)
+
+    return len(ts_list)
+
+
+# Stores of the sensor: (name, path in the Sensor configuration, prefix of the legacy text files)
+STORES = [('obs', 'observation', 'obs_'), ('output', 'output', 'output_'), ('diagnosis', 'diagnosis', 'diagnosis_')]
+
+
+def main():
+    """
+    Legacy text export of the stores of a sensor, e.g., all the observations, statistics and
+    diagnosis vectors of a day:
+
+        $ python -m msnm.modules.store.store config/sensor.yaml -s 201806010000 -e 201806012359 -o export/
+    """
+    from msnm.modules.config.configure import Configure
+
+    args = getArguments()
+
+    config = Configure()
+    config.load_config(args.config)
+    rootDataPath = config.get_config()['GeneralParams']['rootPath']
+    valuesFormat = config.get_config()['GeneralParams']['valuesFormat']
+
+    for name, path, prefix in STORES:
+        if args.stores and name not in args.stores:
+            continue
+
+        store_path = rootDataPath + config.get_config()['Sensor'][path]
+        if not os.path.exists(os.path.join(store_path, name + ".json")):
+            print("No %s store in %s" % (name, store_path))
+            continue
+
+        store = ObservationStore(store_path, name)
+        exported = export_text(store, os.path.join(args.output, path), prefix, args.start, args.end, valuesFormat)
+        print("%s: %s files exported" % (name, exported))
+
+
+def getArguments():
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     description='''Export the observations, statistics and diagnosis vectors of the sensor to text files''')
+    parser.add_argument('config', metavar='CONFIG', help='Sensor configuration File.')
+    parser.add_argument('-s', '--start', help='First timestamp to export (e.g., 201806010000)')
+    parser.add_argument('-e', '--end', help='Last timestamp to export (e.g., 201806012359)')
+    parser.add_argument('-o', '--output', default='./', help='Output directory')
+    parser.add_argument('-t', '--stores', nargs='*', choices=[i[0] for i in STORES], help='Stores to export (all by default)')
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == "__main__":
+    main()
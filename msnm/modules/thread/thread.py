@@ -17,7 +17,8 @@ class MSNMThread(threading.Thread, object):
     def __init__(self):
         threading.Thread.__init__(self)        
         self._stopped_event = threading.Event()
-        self._stopped_event.is_set = self._stopped_event.isSet
+        if not hasattr(self._stopped_event, 'is_set'):
+            self._stopped_event.is_set = self._stopped_event.isSet
     
     def run(self):
         # To be overridden
@@ -12,6 +12,7 @@
 """
 
 import sys
+import os
 from msnm.modules.ma.model import Model
 from msnm.utils import datautils as tools, datautils, dateutils
 import numpy as np
@@ -58,29 +59,15 @@ class Sensor():
 
         method_name = "do_calibration()"
 
-        # Time stamp
-        ts = dateutils.get_timestamp()
-
-        # Get configuration
-        config = Configure()
-        # Get root path for creating data files
-        rootDataPath = config.get_config()['GeneralParams']['rootPath']
-        model_backup_path = config.get_config()['Sensor']['model']
-
-        model_backup_file = rootDataPath + model_backup_path + "model_" + ts + ".json"
-
         try:
             # Model calibration init
             self._model.calibrate(self._data, **kwargs)
 
-            # Get the JSON of the model
-            json_model = datautils.model2json( self._model, ts)
-
-            # Save the model
-            datautils.save2json(json_model, model_backup_file)
+            # Save the model snapshot
+            self.save_model()
 
         except ModelError as eme:
-            raise SensorError(self,eme.msg,method_name)
+            raise SensorError(self,eme.get_msg(),method_name)
         except MSNMError as emsnm:
             raise emsnm
 
@@ -98,24 +85,13 @@ class Sensor():
 
         logging.info("Doing dynamic calibration ...")
 
-        # Time stamp
-        ts = dateutils.get_timestamp()
-
-        # Get configuration
-        config = Configure()
-        model_backup_path = config.get_config()['Sensor']['model']
-        model_backup_file = model_backup_path + "model_" + ts + ".json"
-
         try:
             # Model calibration init
             self._model.calibrate_dynamically(self._data, **kwargs)
 
-            # Get the JSON of the model
+            # Save the model snapshot
             logging.debug("Saving the current model")
-            json_model = datautils.model2json( self._model, ts)
-
-            # Save the model
-            datautils.save2json(json_model, model_backup_file)
+            self.save_model()
 
         except ModelError as me:
             logging.error("Error doing dynamic calibration: %s",me.get_msg())
@@ -126,6 +102,129 @@ class Sensor():
 
         logging.info("End of doing dynamic calibration...")
 
+    def do_streaming_calibration(self,test,**kwargs):
+        """
+        Adds a new observation ``test`` to the streaming dynamic calibration (see Model.calibrate_streaming).
+        The model is saved each time it is refreshed with a complete batch.
+
+        Return
+        ------
+        refreshed: bool
+            True if the model was refreshed
+
+        Raises
+        ------
+        SensorError, MSNMError
+
+        """
+
+        method_name = "do_streaming_calibration()"
+
+        try:
+            refreshed = self._model.calibrate_streaming(test, **kwargs)
+
+            if refreshed:
+                logging.info("Model refreshed by the dynamic calibration.")
+
+                # Save the model snapshot
+                logging.debug("Saving the current model")
+                self.save_model()
+
+        except ModelError as me:
+            logging.error("Error doing dynamic calibration: %s",me.get_msg())
+            raise SensorError(self,me.get_msg(),method_name)
+        except MSNMError as emsnm:
+            logging.error("Error doing dynamic calibration: %s",emsnm.get_msg())
+            raise emsnm
+
+        return refreshed
+
+    def save_model(self):
+        """
+        Saves a snapshot of the current model (see Model.save_snapshot) in a ``model_<ts>`` directory
+        under the ``model`` path of the sensor configuration
+
+        Return
+        ------
+        model_backup_file: str
+            Snapshot directory
+
+        Raises
+        ------
+        ModelError
+
+        """
+
+        # Time stamp
+        ts = dateutils.get_timestamp()
+
+        # Get configuration
+        config = Configure()
+        # Get root path for creating data files
+        rootDataPath = config.get_config()['GeneralParams']['rootPath']
+        model_backup_path = config.get_config()['Sensor']['model']
+        calibration_data = config.get_config()['Sensor'].get('modelCalibrationData', False)
+
+        model_backup_file = rootDataPath + model_backup_path + "model_" + ts
+
+        self._model.save_snapshot(model_backup_file, ts, calibration_data)
+
+        return model_backup_file
+
+    def load_model(self, path=None):
+        """
+        Restores a model snapshot (see Model.load_snapshot), including the state of the EWMA dynamic
+        calibration, instead of calibrating the model again. The snapshot must be of a model of the
+        variables of the configured data sources.
+
+        Parameters
+        ----------
+        path: str
+            Snapshot directory. By default, the latest snapshot saved under the ``model`` path
+            of the sensor configuration.
+
+        Return
+        ------
+        path: str
+            Snapshot directory loaded, None if there is no snapshot to load
+
+        Raises
+        ------
+        SensorError
+
+        """
+
+        method_name = "load_model()"
+
+        if path is None:
+            # Get configuration
+            config = Configure()
+            rootDataPath = config.get_config()['GeneralParams']['rootPath']
+            model_backup_path = rootDataPath + config.get_config()['Sensor']['model']
+
+            # Complete snapshots: model_<ts> directories with their manifest
+            try:
+                snapshots = sorted(i for i in os.listdir(model_backup_path)
+                                   if i.startswith("model_") and os.path.isfile(os.path.join(model_backup_path, i, "manifest.json")))
+            except OSError:
+                snapshots = []
+
+            if not snapshots:
+                logging.warning("There are no model snapshots in %s.",model_backup_path)
+                return None
+
+            path = os.path.join(model_backup_path, snapshots[-1])
+
+        try:
+            ts = self._model.load_snapshot(path, variables=len(datautils.getAllVarNames()))
+        except ModelError as eme:
+            logging.error("Model snapshot %s can not be restored: %s",path,eme.get_msg())
+            raise SensorError(self,eme.get_msg(),method_name)
+
+        logging.info("Model snapshot of %s restored from %s.",ts,path)
+
+        return path
+
     def do_monitoring(self,test):
         """
         Compute the Q and D statistics from a new observation ``test``
@@ -153,13 +252,12 @@ class Sensor():
 
         try:
             # Is the model calibrated?
-            #TODO make a method that checks if the model is complete.
-            if (self._model.get_data().shape[0] <= 1) or (self._model.get_data().shape[1] <= 1):
-                raise SensorError(self,"Data does not has [NxM] dimensions",method_name)
+            if not self._model.is_calibrated():
+                raise SensorError(self,"The model is not calibrated",method_name)
 
 
-            if test.shape[1] != self._model.get_data().shape[1]:
-                logging.error("Test and calibration data does not match. Test %s != Cal %s ", test.shape,self._model.get_data().shape)
+            if test.shape[1] != self._model.get_loadings().shape[0]:
+                logging.error("Test and calibration data does not match. Test %s != Cal %s ", test.shape,self._model.get_loadings().shape[0])
                 raise SensorError(self,"Test and calibration data does not match.",method_name)
 
         except IndexError:
@@ -169,13 +267,13 @@ class Sensor():
 
             logging.debug("Preprocessing the observation of %s.",test.shape)
             # data test autoscaled with the average and standard deviation from the original data
-            testcs = tools.preprocess2Dapp(test,self._model.get_av(),self._model.get_sd())
+            testcs = self._model.preprocess(test)
 
             logging.debug("Computing statistics ...")
-            # compute Q and D statistics
-            self._mspc.computeQst(testcs, self._model.get_pca().getLoadings())
+            # compute Q and D statistics with the matrices cached at calibration time
+            self._mspc.computeQst(testcs, self._model.get_loadings())
             logging.debug("Qst obtained: %s", self._mspc.getQst())
-            self._mspc.computeDst(testcs, self._model.get_pca().getLoadings(), self._model.get_pca().getScores())
+            self._mspc.computeDst(testcs, self._model.get_loadings(), None, self._model.get_inv_scores_cov())
             logging.debug("Dst obtained: %s", self._mspc.getDst())
 
         except MSPCError:
@@ -185,6 +283,73 @@ class Sensor():
 
         return self._mspc.getQst(), self._mspc.getDst()
 
+    def score(self, X):
+        """
+        Compute the Q and D statistics of a block of observations ``X`` at once, e.g., for replaying
+        offline observations. Unlike ``do_monitoring()``, the statistics are returned as arrays and
+        the MSPC instance is not modified.
+
+        Parameters
+        ----------
+        X: numpy.ndarray
+            [NxM] observations to score (a single observation can be given as an [M] array)
+
+        Return
+        ------
+        Qst: numpy.ndarray
+            [N] Q statistic of each observation
+        Dst: numpy.ndarray
+            [N] D statistic of each observation
+
+        Raises
+        ------
+        SensorError, MSNMError
+
+        Example
+        -------
+        >>> sensor = Sensor()
+        >>> sensor.set_data(calibration_data)
+        >>> sensor.do_calibration(phase=2, lv=3)
+        >>> Q, D = sensor.score(observations)
+        >>> anomalous = (Q > sensor.get_mspc().getUCLQ()) | (D > sensor.get_mspc().getUCLD())
+
+        """
+
+        method_name = "score()"
+
+        # Check the data type as ndarray
+        if not isinstance(X, np.ndarray):
+            raise SensorError(self,"Data is not an ndarray",method_name)
+
+        if X.ndim == 1:
+            X = X.reshape((1,X.size))
+
+        try:
+            # Is the model calibrated?
+            if not self._model.is_calibrated():
+                raise SensorError(self,"The model is not calibrated",method_name)
+
+            if X.shape[1] != self._model.get_loadings().shape[0]:
+                logging.error("Test and calibration data does not match. Test %s != Cal %s ", X.shape,self._model.get_loadings().shape[0])
+                raise SensorError(self,"Test and calibration data does not match.",method_name)
+
+        except IndexError:
+            raise SensorError(self,sys.exc_info()[0], method_name)
+
+        try:
+            # data autoscaled with the average and standard deviation from the original data
+            Xcs = self._model.preprocess(X)
+
+            # compute Q and D statistics of all the observations with the matrices cached at calibration time
+            Qst, Dst = self._mspc.computeStatistics(Xcs, self._model.get_loadings(), None, self._model.get_inv_scores_cov())
+
+        except MSPCError:
+            raise SensorError(self,sys.exc_info()[1], method_name)
+        except MSNMError as e:
+            raise e
+
+        return Qst, Dst
+
     def do_diagnosis(self, test, dummy):
         """
         Diagnosis of an anomalous observation ``test``. Right now oMEDA is the
@@ -210,20 +375,19 @@ class Sensor():
 
         try:
             # Is the model calibrated?
-            #TODO make a method that checks if the model is complete.
-            if (self._model.get_data().shape[0] <= 1) or (self._model.get_data().shape[1] <= 1):
-                raise SensorError("Data does not has [NxM] dimensions",method_name)
+            if not self._model.is_calibrated():
+                raise SensorError(self,"The model is not calibrated",method_name)
         except IndexError:
             raise SensorError(self,sys.exc_info()[0],method_name)
 
         try:
             logging.debug("Preprocessing the observation of %s.",test.shape)
             # data test autoscaled with the average and standard deviation from the original data
-            testcs = tools.preprocess2Dapp(test,self._model.get_av(),self._model.get_sd())
+            testcs = self._model.preprocess(test)
 
             logging.debug("Computing oMEDA ...")
             # Computes oMEDA
-            self._mspc.computeoMEDA(testcs, dummy, self._model.get_pca().getLoadings())
+            self._mspc.computeoMEDA(testcs, dummy, self._model.get_loadings())
 
         except MSPCError:
             raise SensorError(self,sys.exc_info()[1], method_name)
@@ -233,6 +397,83 @@ class Sensor():
         return self._mspc.getoMEDAvector()
 
 
+    def diagnose(self, X, dummy):
+        """
+        oMEDA diagnosis of several groups of observations of ``X`` at once, e.g., hundreds of anomalous
+        intervals of an incident, or groups of intervals against a baseline. Unlike ``do_diagnosis()``,
+        the oMEDA vectors are returned and the MSPC instance is not modified.
+
+        Parameters
+        ----------
+        X: numpy.ndarray
+            [NxM] observations
+        dummy: numpy.ndarray
+            [DxN] dummy matrix, one row per group of observations to diagnose: weights for the
+            observations of the group (positive) or of the baseline (negative), 0 for the rest
+
+        Return
+        ------
+        oMEDA: numpy.ndarray
+            [MxD] one oMEDA vector per column, in the order of the rows of ``dummy``
+
+        Raises
+        ------
+        SensorError, MSNMError
+
+        Example
+        -------
+        >>> # oMEDA of each one of the anomalous observations
+        >>> Q, D = sensor.score(X)
+        >>> anomalous = np.nonzero(Q > sensor.get_mspc().getUCLQ())[0]
+        >>> dummy = np.zeros((anomalous.size, X.shape[0]))
+        >>> dummy[np.arange(anomalous.size), anomalous] = 1
+        >>> oMEDAvectors = sensor.diagnose(X, dummy)
+
+        """
+
+        method_name = "diagnose()"
+
+        # Check the data type as ndarray
+        if not isinstance(X, np.ndarray):
+            raise SensorError(self,"Data is not an ndarray",method_name)
+
+        # Check dummy ndarray
+        if not isinstance(dummy, np.ndarray):
+            raise SensorError(self,"Dummy matrix is not an ndarray",method_name)
+
+        if X.ndim == 1:
+            X = X.reshape((1,X.size))
+        if dummy.ndim == 1:
+            dummy = dummy.reshape((1,dummy.size))
+
+        try:
+            # Is the model calibrated?
+            if not self._model.is_calibrated():
+                raise SensorError(self,"The model is not calibrated",method_name)
+
+            if X.shape[1] != self._model.get_loadings().shape[0]:
+                raise SensorError(self,"Test and calibration data does not match.",method_name)
+
+            if dummy.shape[1] != X.shape[0]:
+                raise SensorError(self,"Dummy matrix and data does not match.",method_name)
+
+        except IndexError:
+            raise SensorError(self,sys.exc_info()[0], method_name)
+
+        try:
+            # data autoscaled with the average and standard deviation from the original data
+            Xcs = self._model.preprocess(X)
+
+            # oMEDA of all the groups, with the P*P' cached at calibration time
+            oMEDA = self._mspc.computeoMEDABatch(Xcs, dummy, self._model.get_loadings_product())
+
+        except MSPCError:
+            raise SensorError(self,sys.exc_info()[1], method_name)
+        except MSNMError as e:
+            raise e
+
+        return oMEDA
+
     # Getter & Setter methods
     def get_model(self):
         return self._model
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+    :mod:`test_snapshot`
+    ===========================================================================
+    :synopsis: Tests of the binary snapshots of the model
+    :author: NESG (Network Engineering & Security Group) - https://nesg.ugr.es
+    :contact: nesg@ugr.es, rmagan@ugr.es
+    :organization: University of Granada
+    :project: VERITAS - MSNM Sensor
+    :since: 0.0.1
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from msnm.sensor import Sensor
+from msnm.modules.ma.model import Model
+from msnm.exceptions.msnm_exception import ModelError
+
+
+class SnapshotTest(unittest.TestCase):
+
+    M = 15
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.snapshot = os.path.join(self.path, 'model_201806011200')
+        self.rng = np.random.RandomState(1)
+
+        self.sensor = Sensor()
+        self.sensor.get_model().calibrate(self.rng.rand(100, self.M), lv=3)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def restore(self, **kwargs):
+        sensor = Sensor()
+        ts = sensor.get_model().load_snapshot(self.snapshot, **kwargs)
+        return sensor, ts
+
+    def test_round_trip(self):
+        self.sensor.get_model().save_snapshot(self.snapshot, '201806011200')
+        sensor, ts = self.restore(variables=self.M)
+
+        self.assertEqual(ts, '201806011200')
+        self.assertEqual(sensor.get_mspc().getUCLQ(), self.sensor.get_mspc().getUCLQ())
+        self.assertEqual(sensor.get_mspc().getUCLD(), self.sensor.get_mspc().getUCLD())
+
+        X = self.rng.rand(10, self.M)
+        for restored, original in zip(sensor.score(X), self.sensor.score(X)):
+            np.testing.assert_array_equal(restored, original)
+
+    def test_streaming_state(self):
+        # Snapshot in the middle of a streaming batch
+        for x in self.rng.rand(3, self.M):
+            self.sensor.get_model().calibrate_streaming(x, B=5, lv=3, lamda=0.9)
+        self.sensor.get_model().save_snapshot(self.snapshot, '201806011200')
+        sensor, ts = self.restore()
+
+        for x in self.rng.rand(2, self.M):
+            self.sensor.get_model().calibrate_streaming(x, B=5, lv=3, lamda=0.9)
+            refreshed = sensor.get_model().calibrate_streaming(x, B=5, lv=3, lamda=0.9)
+        self.assertTrue(refreshed)
+
+        X = self.rng.rand(10, self.M)
+        for restored, original in zip(sensor.score(X), self.sensor.score(X)):
+            np.testing.assert_allclose(restored, original, rtol=1e-12)
+
+    def test_variables(self):
+        self.sensor.get_model().save_snapshot(self.snapshot, '201806011200')
+
+        with open(os.path.join(self.snapshot, 'manifest.json')) as f:
+            self.assertEqual(json.load(f)['variables'], self.M)
+
+        model = Model()
+        with self.assertRaises(ModelError):
+            model.load_snapshot(self.snapshot, variables=self.M + 1)
+
+        # The model is not modified
+        self.assertFalse(model.is_calibrated())
+
+    def test_variables_without_manifest(self):
+        # Snapshots saved without the number of variables: taken from the loadings
+        self.sensor.get_model().save_snapshot(self.snapshot, '201806011200')
+        manifest_file = os.path.join(self.snapshot, 'manifest.json')
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+        del manifest['variables']
+        with open(manifest_file, 'w') as f:
+            json.dump(manifest, f)
+
+        self.restore(variables=self.M)
+        with self.assertRaises(ModelError):
+            self.restore(variables=self.M - 1)
+
+    def test_not_calibrated(self):
+        with self.assertRaises(ModelError):
+            Model().save_snapshot(self.snapshot, '201806011200')
+
+
+if __name__ == '__main__':
+    unittest.main()
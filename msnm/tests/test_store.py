@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+    :mod:`test_store`
+    ===========================================================================
+    :synopsis: Tests of the columnar store of observations, statistics and diagnosis vectors
+    :author: NESG (Network Engineering & Security Group) - https://nesg.ugr.es
+    :contact: nesg@ugr.es, rmagan@ugr.es
+    :organization: University of Granada
+    :project: VERITAS - MSNM Sensor
+    :since: 0.0.1
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from msnm.modules.store.store import ObservationStore, export_text
+from msnm.exceptions.msnm_exception import MSNMError
+
+
+class ObservationStoreTest(unittest.TestCase):
+
+    COLUMNS = ['Q', 'D', 'UCLq', 'UCLd']
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.store = ObservationStore(self.path, 'output', self.COLUMNS)
+
+        # Rows of two days
+        self.ts = ['201806012358', '201806012359', '201806020000', '201806020001']
+        self.rows = np.arange(16, dtype=float).reshape((4, 4))
+        for ts, row in zip(self.ts, self.rows):
+            self.store.append(ts, row)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_read(self):
+        self.assertEqual(self.store.days(), ['20180601', '20180602'])
+
+        ts, data = self.store.read()
+        self.assertEqual(ts, self.ts)
+        np.testing.assert_array_equal(data, self.rows)
+
+    def test_read_range(self):
+        # Across the day boundary
+        ts, data = self.store.read('201806012359', '201806020000')
+        self.assertEqual(ts, self.ts[1:3])
+        np.testing.assert_array_equal(data, self.rows[1:3])
+
+        ts, data = self.store.read('201806020000')
+        self.assertEqual(ts, self.ts[2:])
+
+        ts, data = self.store.read('201806030000')
+        self.assertEqual(ts, [])
+        self.assertEqual(data.shape, (0, len(self.COLUMNS)))
+
+    def test_get(self):
+        np.testing.assert_array_equal(self.store.get('201806020000'), self.rows[2])
+        self.assertIsNone(self.store.get('201806020002'))
+
+    def test_reopen(self):
+        store = ObservationStore(self.path, 'output')
+        self.assertEqual(store.get_columns(), self.COLUMNS)
+
+        with self.assertRaises(MSNMError):
+            ObservationStore(self.path, 'output', ['Q', 'D'])
+
+        with self.assertRaises(MSNMError):
+            ObservationStore(self.path, 'obs')
+
+    def test_row_size(self):
+        with self.assertRaises(MSNMError):
+            self.store.append('201806020002', [1.0, 2.0])
+
+    def test_interrupted_data(self):
+        # Row data written without its ts
+        with open(os.path.join(self.path, 'output_20180602.bin'), 'ab') as f:
+            f.write(b'\0' * 13)
+
+        ts, data = self.store.read()
+        self.assertEqual(ts, self.ts)
+
+        self.store.append('201806020002', self.rows[0])
+        ts, data = self.store.read('20180602')
+        self.assertEqual(ts, self.ts[2:] + ['201806020002'])
+        np.testing.assert_array_equal(data[-1], self.rows[0])
+
+    def test_truncated_index(self):
+        # ts partially written
+        index_file = os.path.join(self.path, 'output_20180602.idx')
+        with open(index_file, 'r+b') as f:
+            f.truncate(13)
+
+        ts, data = self.store.read('20180602')
+        self.assertEqual(ts, self.ts[2:3])
+        np.testing.assert_array_equal(data, self.rows[2:3])
+
+        self.store.append('201806020002', self.rows[0])
+        ts, data = self.store.read('20180602')
+        self.assertEqual(ts, [self.ts[2], '201806020002'])
+        np.testing.assert_array_equal(data, self.rows[[2, 0]])
+
+    def test_export_text(self):
+        output_path = os.path.join(self.path, 'text')
+        export_text(self.store, output_path, 'output_', '201806020000', fmt='%1.1f')
+
+        self.assertEqual(sorted(os.listdir(output_path)), ['output_201806020000.dat', 'output_201806020001.dat'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+    :mod:`test_streaming`
+    ===========================================================================
+    :synopsis: Tests of the streaming calibration of the model against the dynamic calibration
+    :author: NESG (Network Engineering & Security Group) - https://nesg.ugr.es
+    :contact: nesg@ugr.es, rmagan@ugr.es
+    :organization: University of Granada
+    :project: VERITAS - MSNM Sensor
+    :since: 0.0.1
+"""
+
+import copy
+import unittest
+import numpy as np
+from msnm.sensor import Sensor
+
+
+class StreamingCalibrationTest(unittest.TestCase):
+
+    M = 20
+    B = 10
+
+    def setUp(self):
+        self.rng = np.random.RandomState(0)
+        self.base = self.rng.rand(4, self.M)
+
+    def observations(self, n):
+        # Data of 4 latent variables and noise
+        return np.dot(self.rng.rand(n, 4), self.base) * 10 + self.rng.rand(n, self.M)
+
+    def calibrate(self, prep, lv):
+        """
+        Sensors calibrated with the same batches, the first one with ``calibrate_dynamically()`` and the
+        second one with ``calibrate_streaming()``
+        """
+        dynamic = Sensor()
+        dynamic.get_model().calibrate(self.observations(100), lv=lv, prep=prep)
+        streaming = copy.deepcopy(dynamic)
+
+        for i in range(3):
+            X = self.observations(self.B)
+            dynamic.get_model().calibrate_dynamically(X, lv=lv, lamda=0.9, prep=prep)
+            for x in X:
+                refreshed = streaming.get_model().calibrate_streaming(x, B=self.B, lv=lv, lamda=0.9, prep=prep)
+
+            # The model is refreshed with the last observation of the batch
+            self.assertTrue(refreshed)
+
+        return dynamic, streaming
+
+    def test_control_limits(self):
+        for prep in (1, 2):
+            dynamic, streaming = self.calibrate(prep, 2)
+
+            a, b = dynamic.get_model().get_mspc(), streaming.get_model().get_mspc()
+            self.assertTrue(np.isclose(a.getUCLQ(), b.getUCLQ(), rtol=1e-10, atol=0))
+            self.assertTrue(np.isclose(a.getUCLD(), b.getUCLD(), rtol=1e-10, atol=0))
+
+    def test_statistics(self):
+        for prep in (1, 2):
+            dynamic, streaming = self.calibrate(prep, 2)
+
+            X = self.observations(15)
+            Qa, Da = dynamic.score(X)
+            Qb, Db = streaming.score(X)
+            np.testing.assert_allclose(Qb, Qa, rtol=1e-10)
+            np.testing.assert_allclose(Db, Da, rtol=1e-10)
+
+    def test_pca(self):
+        dynamic, streaming = self.calibrate(2, 2)
+
+        a, b = dynamic.get_model().get_pca(), streaming.get_model().get_pca()
+        np.testing.assert_allclose(b.getEigenvalues(), a.getEigenvalues()[:2], rtol=1e-10)
+        # Loadings up to their sign
+        np.testing.assert_allclose(np.abs(b.getLoadings()), np.abs(a.getLoadings()), rtol=1e-8, atol=1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+    :mod:`test_tail`
+    ===========================================================================
+    :synopsis: Tests of the incremental reader of log files (LogTail)
+    :author: NESG (Network Engineering & Security Group) - https://nesg.ugr.es
+    :contact: nesg@ugr.es, rmagan@ugr.es
+    :organization: University of Granada
+    :project: VERITAS - MSNM Sensor
+    :since: 0.0.1
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from msnm.modules.source.tail import LogTail
+
+
+class LogTailTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.log = os.path.join(self.path, 'iptables.log')
+        self.write('old\n', 'w')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write(self, data, mode='a'):
+        with open(self.log, mode) as f:
+            f.write(data)
+
+    def test_from_end(self):
+        tail = LogTail(self.log)
+        self.assertEqual(tail.read(), [])
+
+        self.write('a\nb\n')
+        self.assertEqual(tail.read(), ['a\n', 'b\n'])
+        self.assertEqual(tail.read(), [])
+
+    def test_incomplete_line(self):
+        tail = LogTail(self.log, from_end=False)
+
+        self.write('a\npart')
+        self.assertEqual(tail.read(), ['old\n', 'a\n'])
+
+        self.write('ial\n')
+        self.assertEqual(tail.read(), ['partial\n'])
+
+    def test_rename(self):
+        tail = LogTail(self.log)
+
+        # The rotated file ends with a line without a new line
+        self.write('a\nlast')
+        os.rename(self.log, self.log + '.1')
+        self.write('first\n', 'w')
+
+        self.assertEqual(tail.read(), ['a\n', 'last\n', 'first\n'])
+
+        self.write('next\n')
+        self.assertEqual(tail.read(), ['next\n'])
+
+    def test_removed(self):
+        tail = LogTail(self.log)
+
+        self.write('a\n')
+        os.remove(self.log)
+        self.assertEqual(tail.read(), ['a\n'])
+
+        # Created again
+        self.write('b\n', 'w')
+        self.assertEqual(tail.read(), ['b\n'])
+
+    def test_truncate(self):
+        tail = LogTail(self.log, from_end=False)
+        self.assertEqual(tail.read(), ['old\n'])
+
+        self.write('partial', 'a')
+        self.assertEqual(tail.read(), [])
+
+        # Truncated with a shorter content: the incomplete line is discarded
+        self.write('new\n', 'w')
+        self.assertEqual(tail.read(), ['new\n'])
+
+    def test_close(self):
+        tail = LogTail(self.log, from_end=False)
+
+        self.write('part')
+        self.assertEqual(tail.read(), ['old\n'])
+
+        # Reopened from the beginning, without the incomplete line read before closing
+        tail.close()
+        self.assertEqual(tail.read(), ['old\n'])
+
+        self.write('\n')
+        self.assertEqual(tail.read(), ['part\n'])
+
+
+if __name__ == '__main__':
+    unittest.main()
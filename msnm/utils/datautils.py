@@ -537,8 +537,9 @@ def model2json(model,ts):
     # Add ts to the backup
     model.__dict__.update({'_ts':ts})
 
-    # Model to json
-    json_model = json.dumps(model.__dict__,cls=MSNMJsonEncoder,indent=4,sort_keys=True)
+    # Model to json (but the working buffers)
+    contents = dict((k,v) for k,v in model.__dict__.items() if k != '_dataXXbuf')
+    json_model = json.dumps(contents,cls=MSNMJsonEncoder,indent=4,sort_keys=True)
 
     return json_model
 
@@ -11,7 +11,7 @@
 """
 
 from msnm.sensor import Sensor
-from msnm.exceptions.msnm_exception import MSNMError, ConfigError
+from msnm.exceptions.msnm_exception import MSNMError, ConfigError, SensorError
 import sys, traceback
 import os
 import signal
@@ -61,21 +61,6 @@ def main(config_file):
     # Create a Sensor
     sensor = Sensor()
 
-    # Model variables and observation calibration.
-    var_names = datautils.getAllVarNames()
-    x = np.empty(0)
-
-    if sensor_config_params.get_config()['Sensor']['staticCalibration']['randomCalibration']:
-        # Random generated static calibration matix
-        nobs = sensor_config_params.get_config()['Sensor']['staticCalibration']['randomCalibrationObs']
-        x = datautils.generateRandomCalObsMatrix(nobs, len(var_names))
-    else:
-        # Get calibration matrix from a CSV file
-        # Generating fake header
-        header = ['f_' + str(i) for i in range(len(var_names))]
-        x = pd.read_csv(sensor_config_params.get_config()['Sensor']['staticCalibration']['calibrationFile'],
-                        names=header).values
-
     # Get root path for creating data files
     rootDataPath = sensor_config_params.get_config()['GeneralParams']['rootPath']
 
@@ -104,9 +89,38 @@ def main(config_file):
         prep = sensor_config_params.get_config()['Sensor']['prep']
         # Phace to compute UCLD
         phase = sensor_config_params.get_config()['Sensor']['phase']
-
-        sensor.set_data(x)
-        sensor.do_calibration(phase=phase, lv=lv, prep=prep)
+        # SVD solver of the PCA model
+        solver = sensor_config_params.get_config()['Sensor'].get('solver', 'economy')
+        # Warm restart from the last model snapshot?
+        warmStart = sensor_config_params.get_config()['Sensor']['staticCalibration'].get('warmStart', False)
+
+        warmStarted = False
+        if warmStart:
+            try:
+                warmStarted = sensor.load_model() is not None
+            except SensorError as ese:
+                logging.error("Warm restart failed, the model is calibrated again: %s", ese.get_msg())
+
+        if warmStarted:
+            logging.info("Warm restart: the model is restored from its last snapshot.")
+        else:
+            # Model variables and observation calibration.
+            var_names = datautils.getAllVarNames()
+            x = np.empty(0)
+
+            if sensor_config_params.get_config()['Sensor']['staticCalibration']['randomCalibration']:
+                # Random generated static calibration matix
+                nobs = sensor_config_params.get_config()['Sensor']['staticCalibration']['randomCalibrationObs']
+                x = datautils.generateRandomCalObsMatrix(nobs, len(var_names))
+            else:
+                # Get calibration matrix from a CSV file
+                # Generating fake header
+                header = ['f_' + str(i) for i in range(len(var_names))]
+                x = pd.read_csv(sensor_config_params.get_config()['Sensor']['staticCalibration']['calibrationFile'],
+                                names=header).values
+
+            sensor.set_data(x)
+            sensor.do_calibration(phase=phase, lv=lv, prep=prep, solver=solver)
         logging.debug("UCLd = %s", sensor.get_model().get_mspc().getUCLD())
         logging.debug("UCLq = %s", sensor.get_model().get_mspc().getUCLQ())
 
@@ -250,6 +264,14 @@ def main(config_file):
             if i is not threading.currentThread():
                 logging.debug("Waiting for %s thread ...", i.name)
                 i.join()
+
+        # Save the EWMA state of the model for a warm restart
+        if sensor_config_params.get_config()['Sensor']['dynamiCalibration']['enabled'] and sensor.get_model().is_calibrated():
+            try:
+                sensor.save_model()
+            except MSNMError as se:
+                logging.error(se.print_error())
+
         logging.info("Exiting ...")
         exit(1)
 
@@ -20,10 +20,11 @@ from datetime import datetime
 import re
 from IPy import IP
 
+from fcparser import faaclib
+from fcparser import nfcapd
 
-def main():
 
-	delete_nfcsv = None # bool variable for netflow raw data  
+def main():
 
 	startTime = time.time()
 
@@ -64,21 +65,6 @@ def main():
 			tags[source] = sources_config[source]['tag']
 			sources_files[source]['files'] = glob.glob(dataSources[source]['data'])
 
-			out_files = []
-			for file in sources_files[source]['files']:
-				if 'nfcapd' in file:
-
-					out_file = '/'.join(file.split('/')[:-1]) + '/temp_' + file.split('.')[-1] + ""
-					os.system("nfdump -r " + file + " -o csv >>"+out_file)
-					os.system('tail -n +2 '+out_file + '>>' + out_file.replace('temp',source))
-					os.system('head -n -3 ' + out_file.replace('temp',source) + ' >> ' + out_file.replace('temp',source) + '.csv')
-					out_files.append(out_file.replace('temp',source) + '.csv')
-					os.remove(out_file)
-					os.remove(out_file.replace('temp',source))
-
-					sources_files[source]['files'] = out_files
-					delete_nfcsv = out_files
-
 		except:
 			print("Configuration file load error") 
 			exit(1)
@@ -99,15 +85,15 @@ def main():
 		FEATURES[source] = {}
 		VARIABLES[source] = {}
 		structured[source] = sources_config[source]['structured']
- 		for feature in sources_config[source]['FEATURES']:
- 			try:
+		for feature in sources_config[source]['FEATURES']:
+			try:
 				FEATURES[source][feature['name']] = feature
 			except:
 				print("Cofiguration file error: missing features")
 				exit(1)
 
- 		for variable in sources_config[source]['VARIABLES']:
- 			try:
+		for variable in sources_config[source]['VARIABLES']:
+			try:
 				VARIABLES[source][variable['name']] = variable
 			except:
 				print("Cofiguration file error: missing vriables")
@@ -334,11 +320,9 @@ def main():
 				feat_appear = {}
 				for file in sourcepath:
 					feat_appear[file] = []
-					input_file = open(file,'r')
-					line = input_file.readline()
 
 					# First read to generate list of number of appearances
-					while line:
+					for line in readLines(file):
 						# try:
 						t = getStructuredTime(line,0,sources_config[source]['timestamp_format'])		
 
@@ -347,9 +331,6 @@ def main():
 							feat_appear[file].append(search_amount_features(line,features,FEATURES[source],VARIABLES[source]))
 						# except:
 						#  	print "error"
-								
-						line = input_file.readline()
-					input_file.close()
 
 
 				# Obtain number of features needed to extract the log
@@ -365,11 +346,8 @@ def main():
 				# Re-read the file
 				for file in sourcepath:
 					index = 0
-					input_file = open(file,'r')
-					input_file.seek(0)
-					line = input_file.readline()
 						
-					while line:
+					for line in readLines(file):
 						try:
 							t = getStructuredTime(line,0,sources_config[source]['timestamp_format'])		
 							if str(t).strip() in formated_timestamps:
@@ -381,9 +359,6 @@ def main():
 								index += 1
 						except:
 							pass
-						
-						line = input_file.readline()
-					input_file.close()
 				output_file.close()
 
 
@@ -397,44 +372,19 @@ def main():
 				feat_appear = {}
 				for file in sourcepath:
 					feat_appear[file] = []
-					input_file = open(file,'r')
-					line = input_file.readline()
-
 
 					# First read to generate list of number of appearances
-					if line:
-						log = "" + line 	
-						while line:
-							log += line 
-				
-							if len(log.split(sources_config[source]['separator'])) > 1:
-								logExtract = log.split(sources_config[source]['separator'])[0]
-								# For each log, extract timestamp with regular expresions and check if it is in the 
-								# input timestamps
-								try:
-									t = getUnstructuredTime(logExtract, sources_config[source]['timestamp_regexp'], sources_config[source]['timestamp_format'])														
-									if str(t).strip() in formated_timestamps:
-										# Check if features appear in the log to write in the file.
-										feat_appear[file].append(search_feature(FEATURES,VARIABLES,logExtract,features, source))
-								except:
-									pass
-									
-								log = ""
-								for n in logExtract.split(sources_config[source]['separator'])[1::]:
-									log += n
-							line = input_file.readline()
-
-						# Deal with the last log, not processed during while loop.
-						log += line
-						try:								
-							t = getUnstructuredTime(log, sources_config[source]['timestamp_regexp'], sources_config[source]['timestamp_format'])
-							if str(t) in timestamps:
-								feat_appear[file].append(search_feature(FEATURES,VARIABLES,logExtract,features, source ))
+					for logExtract in faaclib.readLogs(file, sources_config[source]['separator']):
+						# For each log, extract timestamp with regular expresions and check if it is in the 
+						# input timestamps
+						try:
+							t = getUnstructuredTime(logExtract, sources_config[source]['timestamp_regexp'], sources_config[source]['timestamp_format'])														
+							if str(t).strip() in formated_timestamps:
+								# Check if features appear in the log to write in the file.
+								feat_appear[file].append(search_feature(FEATURES,VARIABLES,logExtract,features, source))
 						except:
 							pass
 
-					input_file.close()
-
 				# Obtain number of features needed to extract the log
 				features_needed = len(features)
 				count = 0
@@ -446,35 +396,21 @@ def main():
 				# Re-read the file
 				for file in sourcepath:
 					index = 0
-					input_file = open(file,'r')
-					input_file.seek(0)
-					line = input_file.readline()
-						
-					if line:
-						log = "" + line 	
-						while line:
-							log += line 
-							if len(log.split(sources_config[source]['separator'])) > 1:
-								logExtract = log.split(sources_config[source]['separator'])[0]
-								# For each log, extract timestamp with regular expresions and check if it is in the 
-								# input timestamps
-								try:
-									t = getUnstructuredTime(logExtract, sources_config[source]['timestamp_regexp'], sources_config[source]['timestamp_format'])														
-									if str(t).strip() in formated_timestamps:
-										# Check if features appear in the log to write in the file.
-										if feat_appear[file][index] >= features_needed:
-											output_file.write(logExtract + "\n\n")
-											count_unstructured += 1	
-										index += 1
-								except:
-									pass
-
-								log = ""
-								for n in logExtract.split(sources_config[source]['separator'])[1::]:
-									log += n
-							line = input_file.readline()
-
-					input_file.close()
+
+					for logExtract in faaclib.readLogs(file, sources_config[source]['separator']):
+						# For each log, extract timestamp with regular expresions and check if it is in the 
+						# input timestamps
+						try:
+							t = getUnstructuredTime(logExtract, sources_config[source]['timestamp_regexp'], sources_config[source]['timestamp_format'])														
+							if str(t).strip() in formated_timestamps:
+								# Check if features appear in the log to write in the file.
+								if feat_appear[file][index] >= features_needed:
+									output_file.write(logExtract + "\n\n")
+									count_unstructured += 1	
+								index += 1
+						except:
+							pass
+
 				output_file.close()
 
 			print("\n---------------------------------------------------------------------------\n")
@@ -483,9 +419,18 @@ def main():
 
 	stats( count_structured, count_unstructured, OUTDIR, OUTSTATS, startTime)
 
-	if delete_nfcsv:
-		for file in delete_nfcsv:
-			os.remove(file)
+
+def readLines(fname):
+	"""Generator of the lines of a structured file.
+	Binary nfcapd files are read as the CSV lines printed by nfdump.
+	"""
+	if nfcapd.isNfcapd(fname):
+		for line in nfcapd.readFlows(fname):
+			yield line
+	else:
+		with open(fname,'r') as input_file:
+			for line in input_file:
+				yield line
 
 def stats( count_structured, count_unstructured, OUTDIR, OUTSTATS, startTime):
 
@@ -513,40 +458,17 @@ def stats( count_structured, count_unstructured, OUTDIR, OUTSTATS, startTime):
 
 
 def file_len(fname):
-    with open(fname) as f:
-        for i, l in enumerate(f):
-            pass
+    i = -1
+    for i, l in enumerate(readLines(fname)):
+        pass
     return i + 1
 
 
 def file_log_len(fname, separator):
-
-	input_file = open(fname,'r')
-	line = input_file.readline()
 	count_log = 0
-
-	if line:
-		log ="" + line
-
-		while line:
-			log += line 
-
-			if len(log.split(separator)) > 1:
-				logExtract = log.split(separator)[0]
-				count_log += 1		
-				log = ""
-
-				for n in logExtract.split(separator)[1::]:
-					log += n
-
-			line = input_file.readline()
-		log += line
-		
-		if not log == "":
-			count_log += 1 
-
-	return count_log			
-
+	for log in faaclib.readLogs(fname, separator):
+		count_log += 1
+	return count_log
 
 
 def search_feature(FEATURES,VARIABLES,logExtract,features,source):
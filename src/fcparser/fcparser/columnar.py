@@ -0,0 +1,276 @@
+"""
+
+Columnar FaaC engine -- vectorized parsing of structured (CSV) sources.
+
+Instead of building a Record and an Observation for every line, the input
+file is read in chunks of columns. Each variable column is reduced to its
+unique raw values, which are loaded and matched against the FeaturePlan
+only once. The counters of the whole chunk are then computed as a sum of
+the per-value counters, grouped by the aggregation keys.
+
+The output is the same ObservationBatch built by the record engine, so
+the rest of the parsing process (fusion, padding, outputs) is unchanged.
+
+This engine requires numpy and pandas.
+
+"""
+
+import csv
+from array import array
+
+import numpy as np
+import pandas as pd
+
+from . import faaclib
+from . import nfcapd
+
+
+#-----------------------------------------------------------------------
+# Parsing Functions
+#-----------------------------------------------------------------------
+
+def parseFile(input_path, variables, plan, keys, chunksize=100000):
+	"""Parses a structured file into a batch of observations.
+	Returns an ObservationBatch object.
+
+	input_path -- Path to the CSV file (gzip compressed if it ends with '.gz', or nfcapd).
+	variables  -- VariablePlan object, or list of variables configurations.
+	plan       -- FeaturePlan object of the source.
+	keys       -- Aggregation keys (None, single key or list of keys).
+	chunksize  -- Number of lines read at once.
+	"""
+	aggregator = ColumnarAggregator(variables, plan, keys)
+
+	# nfcapd flows are read from the output of nfdump
+	if nfcapd.isNfcapd(input_path):
+		input_path = nfcapd.FlowStream(nfcapd.readFlows(input_path))
+
+	try:
+		reader = pd.read_csv(input_path, header=None, dtype=str, na_filter=False,
+			quoting=csv.QUOTE_NONE, index_col=False, chunksize=chunksize)
+		for chunk in reader:
+			aggregator.add(chunk)
+	except pd.errors.EmptyDataError:
+		pass
+	except pd.errors.ParserError as e:
+		raise MalformedFileError(input_path, str(e).strip())
+
+	return aggregator.batch()
+
+
+class MalformedFileError(Exception):
+	"""Raised when the lines of a file do not have the same number of columns
+	(e.g., ragged or truncated lines), so it can not be read as a table.
+	Such files are parsed line by line instead (see fcparser.parseFile).
+	"""
+	def __init__(self, input_path, message=''):
+		self.input_path = input_path
+		self.message = message
+		self.msg = "Malformed CSV file '%s' (%s)" %(input_path, message)
+
+	def __reduce__(self):
+		return (self.__class__, (self.input_path, str(self.message)))
+
+
+#-----------------------------------------------------------------------
+# Columnar Classes
+#-----------------------------------------------------------------------
+
+class ColumnarAggregator(object):
+	"""Accumulates the feature counters of the chunks of a structured file.
+
+	The counters are stored as a matrix with one row per aggregation ID,
+	in order of first appearance, as ObservationBatch does.
+
+	Class Attributes:
+		plan      -- FeaturePlan object of the source.
+		variables -- VariablePlan object of the source.
+		keys      -- List of aggregation keys (empty for no aggregation).
+		multikey  -- True if the keys were configured as a list.
+		IDs       -- Dictionary of rows of the counters matrix, indexed by observation ID.
+		data      -- Counters matrix.
+		nObs      -- Number of lines aggregated in each row.
+	"""
+	def __init__(self, variables, plan, keys):
+		"""Class constructor.
+
+		variables -- VariablePlan object, or list of variables configurations.
+		plan      -- FeaturePlan object of the source.
+		keys      -- Aggregation keys (None, single key or list of keys).
+		"""
+		self.plan = plan
+		if isinstance(variables, faaclib.VariablePlan):
+			self.variables = variables
+		else:
+			self.variables = faaclib.VariablePlan(variables, True)
+
+		self.multikey = isinstance(keys, list)
+		if not keys:
+			self.keys = []
+		elif self.multikey:
+			self.keys = keys
+		else:
+			self.keys = [keys]
+
+		for key in self.keys:
+			if key not in self.variables.where:
+				raise faaclib.ConfigError(self, "KEYS: incorrect variable reference (%s)" %(key))
+
+		self.IDs  = {}
+		self.data = np.zeros((0, len(plan.label)), dtype=np.int64)
+		self.nObs = np.zeros(0, dtype=np.int64)
+		self.cache = {}    # counters of already loaded raw values, indexed by variable name
+
+	def add(self, chunk):
+		"""Adds the counters of a chunk of lines.
+
+		chunk -- DataFrame with the raw values of the lines (one column per field).
+		"""
+		groups = self.group(chunk)
+		self.nObs += np.bincount(groups, minlength=len(self.nObs))
+
+		for name in self.plan.variables:
+			if name not in self.variables.where:
+				continue
+
+			codes, uniques = pd.factorize(self.column(chunk, name))
+			indexes = np.array(self.plan.variables[name])
+			counters = self.counters(name, uniques)
+
+			if not self.keys:
+				self.data[0, indexes] += np.dot(np.bincount(codes, minlength=len(uniques)), counters)
+			else:
+				# Count each (group, value) pair once, then add its counters to the group
+				pairs, inverse = np.unique(groups.astype(np.int64) * len(uniques) + codes, return_inverse=True)
+				partial = counters[pairs % len(uniques)] * np.bincount(inverse.ravel())[:, None]
+				np.add.at(self.data, ((pairs // len(uniques))[:, None], indexes[None, :]), partial)
+
+	def group(self, chunk):
+		"""Assigns each line of a chunk to a row of the counters matrix.
+		New rows are added for the IDs not seen before.
+		Returns an array with the row of each line.
+
+		chunk -- DataFrame with the raw values of the lines.
+		"""
+		if not self.keys:
+			rows = np.zeros(len(chunk), dtype=np.intp)
+			if not self.IDs and len(chunk):
+				self.IDs[None] = 0
+				self.grow()
+			return rows
+
+		raw = self.column(chunk, self.keys[0])
+		for key in self.keys[1:]:
+			raw = raw + '\n' + self.column(chunk, key)
+		codes, uniques = pd.factorize(raw)
+
+		rows = np.empty(len(uniques), dtype=np.intp)
+		for u in range(len(uniques)):
+			ID = self.identify(uniques[u].split('\n'))
+			if ID not in self.IDs:
+				self.IDs[ID] = len(self.IDs)
+			rows[u] = self.IDs[ID]
+
+		self.grow()
+		return rows[codes]
+
+	def identify(self, raw_values):
+		"""Builds the ID of an observation, as AggregatedObservation does.
+
+		raw_values -- List of raw values of the keys.
+		"""
+		values = [self.load(self.keys[i], raw_values[i]).value for i in range(len(self.keys))]
+		if self.multikey:
+			return ', '.join([str(x) for x in values])
+		else:
+			return values[0]
+
+	def grow(self):
+		"""Adds empty rows to the counters matrix for the new IDs.
+		"""
+		missing = len(self.IDs) - self.data.shape[0]
+		if missing > 0:
+			self.data = np.vstack((self.data, np.zeros((missing, self.data.shape[1]), dtype=np.int64)))
+			self.nObs = np.concatenate((self.nObs, np.zeros(missing, dtype=np.int64)))
+
+	def column(self, chunk, name):
+		"""Returns the raw values of a variable in a chunk.
+		Two-item positions (durations) are joined by a comma.
+
+		chunk -- DataFrame with the raw values of the lines.
+		name  -- Variable name.
+		"""
+		where = self.variables.where[name]
+		try:
+			if isinstance(where, list):
+				return chunk[where[0]] + ',' + chunk[where[1]]
+			else:
+				return chunk[where]
+		except KeyError as e:
+			raise faaclib.ConfigError(self, "VARIABLES: illegal arg in '%s' (%s)" %(name, e))
+
+	def counters(self, name, uniques):
+		"""Calculates the counters of the features of a variable for each one of its values.
+		Returns a matrix with one row per value and one column per feature of the variable.
+
+		name    -- Variable name.
+		uniques -- Array of unique raw values.
+		"""
+		indexes = self.plan.variables[name]
+		cache = self.cache.setdefault(name, {})
+		data = [0] * len(self.plan.label)
+
+		rows = []
+		for raw_value in uniques:
+			try:
+				rows.append(cache[raw_value])
+			except KeyError:
+				for i in indexes:
+					data[i] = 0
+				self.plan.count(name, self.load(name, raw_value), data)
+				row = [data[i] for i in indexes]
+				cache[raw_value] = row
+				rows.append(row)
+
+		return np.array(rows, dtype=np.int64).reshape((len(uniques), len(indexes)))
+
+	def load(self, name, raw_value):
+		"""Creates a variable from its raw value, as Record does.
+
+		name      -- Variable name.
+		raw_value -- Raw value, as returned by column().
+		"""
+		if isinstance(self.variables.where[name], list):
+			raw_value = raw_value.split(',', 1)
+		return self.variables.load(name, raw_value)
+
+	def batch(self):
+		"""Builds the batch of observations from the counters matrix.
+		Returns an ObservationBatch object.
+		"""
+		obsBatch = faaclib.ObservationBatch()
+		data = self.data.tolist()
+		nObs = self.nObs.tolist()
+		for ID in self.IDs:
+			row = self.IDs[ID]
+			obsBatch.observations[ID] = ColumnarObservation(ID, self.plan.label, data[row], nObs[row])
+		return obsBatch
+
+
+class ColumnarObservation(faaclib.AggregatedObservation):
+	"""Aggregated observation built from the counters of the columnar engine.
+	"""
+	__slots__ = ()
+
+	def __init__(self, ID, label, data, nObs):
+		"""Class constructor.
+
+		ID    -- ID of the observation.
+		label -- Array of features names.
+		data  -- Array of data values.
+		nObs  -- Number of lines aggregated.
+		"""
+		self.ID = ID
+		self.label = label
+		self.data = array('l', data)
+		self.nObs = nObs
@@ -14,7 +14,9 @@ Last Modification: 29/Jul/2017
 
 from datetime import datetime, timedelta
 from IPy import IP
+from array import array
 import time
+import gzip
 import re
 
 
@@ -37,6 +39,8 @@ class Variable(object):
 	Class Attributes:
 		value -- The value of the variable.
 	"""
+	__slots__ = ('value',)
+
 	def __init__(self, raw_value):
 		"""Class constructor.
 
@@ -89,6 +93,7 @@ class Variable(object):
 class StringVariable(Variable):
 	"""Variable containing an alphanumeric value.
 	"""
+	__slots__ = ()
 	
 	def load(self, raw_value):
 		"""Converts an input raw value into a string object.
@@ -112,6 +117,7 @@ class StringVariable(Variable):
 class NumberVariable(Variable):
 	"""Variable containing a number.
 	"""
+	__slots__ = ()
 
 	def load(self, raw_value):
 		"""Converts an input raw value into an integer number.
@@ -129,6 +135,7 @@ class NumberVariable(Variable):
 class RegexpVariable(Variable):
 	"""Variable containing a regexp match.
 	"""
+	__slots__ = ()
 
 	def load(self, raw_value):
 		"""Converts an input regexp match into a string object.
@@ -152,6 +159,7 @@ class RegexpVariable(Variable):
 class IpVariable(Variable):
 	"""Variable containing an IP address.
 	"""
+	__slots__ = ()
 		
 	def equals(self, raw_value):
 		"""Compares this IP address to a given one, OR
@@ -190,6 +198,7 @@ class IpVariable(Variable):
 class TimeVariable(Variable):
 	"""Variable containing a timestamp value.
 	"""
+	__slots__ = ()
 		
 	def load(self, raw_value):
 		"""Converts an input raw value into a timestamp.
@@ -216,6 +225,8 @@ class TimedeltaVariable(TimeVariable):
 	"""Variable containing a time duration.
 	The value is a timedelta object.
 	"""
+	__slots__ = ()
+
 	def __init__(self, start_value, end_value):
 		"""Class constructor.
 
@@ -251,9 +262,25 @@ class TimedeltaVariable(TimeVariable):
 			return str(None)
 
 
+class MultipleLoader(object):
+	"""Loader of the variables of structured sources with multiple values
+	(mult option). Creates a MultipleVariable from the single variable.
+	Unlike a closure, it can be pickled with the VariablePlan.
+	"""
+	__slots__ = ('loader',)
+
+	def __init__(self, loader):
+		self.loader = loader
+
+	def __call__(self, raw_value):
+		return MultipleVariable(self.loader(raw_value))
+
+
 class MultipleVariable(object):
 	"""Multiple variable. Contains a list of variables.
 	"""
+	__slots__ = ('value',)
+
 	def __init__(self, variable):
 		"""Class constructor.
 
@@ -298,6 +325,140 @@ class MultipleVariable(object):
 # Record Classes
 #-----------------------------------------------------------------------
 
+class VariablePlan(object):
+	"""Compiled form of the variables defined in the user conf file, section VARIABLES.
+
+	The variables list is validated once. The regular expressions of
+	unstructured sources are compiled, and each variable is bound to the
+	loader of its matchtype. Thus, building a record only needs one
+	extraction and one conversion per variable.
+
+	The plan should be built once per source and shared by all its records.
+
+	Class Attributes:
+		structured -- True for structured sources.
+		names      -- Array of variables names.
+		where      -- Dictionary of variables positions (structured) or 
+		              compiled regular expressions (unstructured), indexed by name.
+	"""
+	LOADERS = {'string': StringVariable, 'number': NumberVariable, 'ip': IpVariable, 'time': TimeVariable}
+
+	def __init__(self, VARIABLES, structured):
+		"""Creates the plan from a list of variables configurations.
+		Raises ConfigError if some variable is not correctly defined.
+
+		VARIABLES  -- List of variables configurations.
+		structured -- True for structured sources.
+		"""
+		self.structured = structured
+		self.names = []
+		self.where = {}
+		self.loaders = {}
+		self.extractors = []
+
+		for v in VARIABLES:
+			try:
+				vName = v['name']
+				vWhere = v['where']
+				vType = v['matchtype']
+			except KeyError as e:
+				raise ConfigError(self, "VARIABLES: missing config key (%s)" %(e))
+			vMult = v.get('mult', False)
+
+			# Validate name
+			if vName:
+				vName = str(vName)
+			else:
+				raise ConfigError(self, "VARIABLE: empty id in variable")
+
+			# Validate arg
+			if structured:
+				if isinstance(vWhere, list):
+					if not (len(vWhere) == 2 and all(isinstance(x, int) for x in vWhere)):
+						raise ConfigError(self, "VARIABLES: illegal arg in '%s' (%s)" %(vName, vWhere))
+				elif not isinstance(vWhere, int):
+					raise ConfigError(self, "VARIABLES: illegal arg in '%s' (%s)" %(vName, vWhere))
+			else:
+				if not vWhere:
+					raise ConfigError(self, "VARIABLE: empty arg in variable; regular expresion expected")
+				try:
+					vWhere = re.compile(str(vWhere))
+				except re.error as e:
+					raise ConfigError(self, "VARIABLES: illegal regular expression in '%s' (%s)" %(vName, e))
+
+			# Validate matchtype
+			if vType in self.LOADERS:
+				loader = self.LOADERS[vType]
+			elif vType == 'duration':
+				if structured and isinstance(vWhere, list):
+					loader = self.loadDuration
+				else:
+					raise ConfigError(self, "VARIABLES: illegal arg in %s (two-item list expected)" %(vName))
+			else:
+				raise ConfigError(self, "VARIABLES: illegal matchtype in '%s' (%s)" %(vName, vType))
+
+			if vMult and structured:
+				loader = MultipleLoader(loader)
+
+			self.names.append(vName)
+			self.where[vName] = vWhere
+			self.loaders[vName] = loader
+			self.extractors.append((vName, vWhere, loader))
+
+	@staticmethod
+	def loadDuration(raw_value):
+		return TimedeltaVariable(raw_value[0], raw_value[1])
+
+	def load(self, name, raw_value):
+		"""Creates a variable from its raw value.
+
+		name      -- Variable name.
+		raw_value -- Raw value, as it is read from the input
+		             (a two-item list for durations).
+		"""
+		return self.loaders[name](raw_value)
+
+	def extract(self, line):
+		"""Extracts the variables of a line or log.
+		Returns a dictionary of variables, indexed by their name.
+
+		line -- Raw line (structured sources) or log (unstructured sources).
+		"""
+		# For structured sources
+		if self.structured:
+			return self.extractFields(line.split(','))
+
+		# For unstructured sources
+		variables = {}
+		for name, where, loader in self.extractors:
+			match = where.search(line)
+			if match:
+				variables[name] = loader(match.group())
+			else:
+				variables[name] = None
+
+		return variables
+
+	def extractFields(self, raw_values):
+		"""Extracts the variables of a line of a structured source, already split in fields.
+		Returns a dictionary of variables, indexed by their name.
+
+		raw_values -- List of raw fields of the line, in the order of the positions of VARIABLES.
+		"""
+		variables = {}
+		for name, where, loader in self.extractors:
+			try:
+				if isinstance(where, list):
+					raw_value = [raw_values[where[0]], raw_values[where[1]]]
+				else:
+					raw_value = raw_values[where]
+			except IndexError as e:
+				raise ConfigError(self, "VARIABLES: illegal arg in '%s' (%s)" %(name, e))
+			variables[name] = loader(raw_value)
+
+		return variables
+
+
 class Record(object):
 	"""Information record containing data variables.
 	
@@ -311,132 +472,288 @@ class Record(object):
 		variables -- Dictionary of variables, indexed by their name.
 		
 	"""
+	__slots__ = ('variables',)
+
 	def __init__(self, line, variables, structured):
-		self.variables = {}
+		"""Class constructor.
+
+		line       -- Raw line (structured sources) or log (unstructured sources).
+		variables  -- VariablePlan object, or list of variables configurations.
+		structured -- True for structured sources.
+		"""
+		if isinstance(variables, VariablePlan):
+			plan = variables
+		else:
+			plan = VariablePlan(variables, structured)
+
+		self.variables = plan.extract(line)
+	
+	def __repr__(self):
+		return "<%s - %d variables>" %(self.__class__.__name__, len(self.variables))
 		
-		# For structured sources
-		if structured:
-			raw_values = line.split(',')
+	def __str__(self):
+		return self.variables.__str__()
 
-			for v in variables:
-				try:
-					vType = v['matchtype']
-					vName = v['name']
-					vWhere  = v['where']
-				except KeyError as e:
-					raise ConfigError(self, "VARIABLES: missing config key (%s)" %(e.message))	
-				try:
-					vMult = v['mult']
-				except KeyError:
-					vMult = False
-				
-				# Validate name
-				if vName:
-					vName = str(vName)
-				else:
-					raise ConfigError(self, "VARIABLE: empty id in variable")
 
-				# Validate arg
-				try:
-					if isinstance(vWhere, list) and len(vWhere) == 2:
-						vValue = [raw_values[vWhere[0]], raw_values[vWhere[1]]]
-					else:
-						vValue = raw_values[vWhere]
-				except (TypeError, IndexError) as e:
-					raise ConfigError(self, "VARIABLES: illegal arg in '%s' (%s)" %(vName, e.message))
-
-				except:
-					vValue = None
-				# Validate matchtype
-				if vType == 'string':
-					variable = StringVariable(vValue)
-				elif vType == 'number':
-					variable = NumberVariable(vValue)
-				elif vType == 'ip':
-					variable = IpVariable(vValue)
-				elif vType == 'time':
-					variable = TimeVariable(vValue)
-				elif vType == 'duration':
-					if isinstance(vvalue, list) and len(vValue) == 2:
-						variable = TimedeltaVariable(vValue[0], vValue[1])
-					else:
-						raise ConfigError(self, "VARIABLES: illegal arg in %s (two-item list expected)" %(vName))
-				else:
-					raise ConfigError(self, "VARIABLES: illegal matchtype in '%s' (%s)" %(vName, vType))
-					
-				# Add variable to the record
-				if vMult:
-					self.variables[vName] = MultipleVariable(variable)
-				else:
-					self.variables[vName] = variable
+#-----------------------------------------------------------------------
+# Feature Plan Classes
+#-----------------------------------------------------------------------
 
-		# For unstructured sources
+class FeaturePlan(object):
+	"""Compiled form of the features defined in the user conf file, section FEATURES.
 
-		else:
+	The features list is validated once, and grouped by the variable they
+	are calculated from. The configured values are parsed the first time
+	each variable is found in a record, with the same loader of the variable
+	(see FeatureMatcher). Thus, building an observation only needs one
+	lookup per variable instead of interpreting the whole FEATURES list.
+
+	The plan should be built once per source and shared by all the
+	observations of that source.
+
+	Class Attributes:
+		label     -- Array of features names.
+		variable  -- Array of the variable names each feature is calculated from.
+		variables -- Dictionary of feature indexes, indexed by variable name.
+		defaults  -- Dictionary of default feature indexes, indexed by variable name.
+	"""
+	def __init__(self, FEATURES):
+		"""Creates the plan from a list of features configurations.
+		Raises ConfigError if some feature is not correctly defined.
+
+		FEATURES -- List of features configurations.
+		"""
+		self.label     = [None] * len(FEATURES)
+		self.variable  = [None] * len(FEATURES)
+		self.variables = {}
+		self.defaults  = {}
+		self.features  = {}    # features definitions, indexed by variable name
+		self.matchers  = {}    # compiled features, indexed by (variable name, variable class)
+
+		for i in range(len(FEATURES)):
+			try:
+				fName  = FEATURES[i]['name']
+				fVariable = FEATURES[i]['variable']
+				fType  = FEATURES[i]['matchtype']
+				fValue = FEATURES[i]['value']
+			except KeyError as e:
+				raise ConfigError(self, "FEATURES: missing config key (%s)" %(e))
+
+			# Validate name
+			if fName:
+				fName = str(fName)
+			else:
+				raise ConfigError(self, "FEATURES: missing variable name")
+
+			# Validate value
+			if fType == 'single' or fType == 'regexp':
+				if isinstance(fValue, list):
+					raise ConfigError(self, "FEATURES: illegal value in '%s' (single item expected)" %(fName))
+			elif fType == 'multiple':
+				if not isinstance(fValue, list):
+					raise ConfigError(self, "FEATURES: illegal value in '%s' (list of items expected)" %(fName))
+			elif fType == 'range':
+				if not (isinstance(fValue, list) and len(fValue) == 2):
+					raise ConfigError(self, "FEATURES: illegal value in '%s' (two-item list expected)" %(fName))
+			elif fType == 'default':
+				self.defaults.setdefault(fVariable, []).append(i)
+			else:
+				raise ConfigError(self, "FEATURES: illegal matchtype in '%s' (%s)" %(fName, fType))
 
-			for v in variables:
+			if fType == 'regexp':
 				try:
-					vName = v['name']
-					vWhere = v['where']
-					vMatchType = v['matchtype']
-					if isinstance(vWhere,str):
-						vType = 'regexp'
-
-				except KeyError as e:
-					raise ConfigError(self, "VARIABLES: missing config key (%s)" %(e.message))
-
-				# Validate name
-				if vName:
-					vName = str(vName)
-				else:
-					raise ConfigError(self, "VARIABLE: empty id in variable")
+					fValue = re.compile(fValue)
+				except re.error as e:
+					raise ConfigError(self, "FEATURES: illegal regexp in '%s' (%s)" %(fName, e))
 
-				# Validate name
-				if vWhere:
-					vWhere = str(vWhere)
-				else:
-					raise ConfigError(self, "VARIABLE: empty arg in variable; regular expresion expected")
+			self.label[i] = fName
+			self.variable[i] = fVariable
+			self.variables.setdefault(fVariable, []).append(i)
+			self.features.setdefault(fVariable, []).append((i, fType, fValue))
+
+	def matcher(self, name, variable):
+		"""Returns the compiled features of a variable.
+		They are compiled the first time a variable class is found.
+
+		name     -- Variable name.
+		variable -- Variable object, as it is found in the record.
+		"""
+		if isinstance(variable, MultipleVariable):
+			prototype = variable.value[0]
+		else:
+			prototype = variable
 
-				# Validate matchtype
-				if vType == 'regexp':
+		key = (name, prototype.__class__)
+		try:
+			return self.matchers[key]
+		except KeyError:
+			matcher = FeatureMatcher(self.features[name], prototype)
+			self.matchers[key] = matcher
+			return matcher
 
-					try:
-						
-						p = re.search(vWhere,line)
-						vValue = p.group()
+	def run(self, record):
+		"""Calculates the features counters for a record.
+		Returns the data array (counters).
 
-						if vMatchType == 'string':
-							variable = StringVariable(vValue)
+		record -- Record object.
+		"""
+		data = array('l', [0]) * len(self.label)
+		variables = record.variables
 
-						elif vMatchType == 'number':
-							variable = NumberVariable(vValue)
+		for name in self.variables:
+			variable = variables.get(name)
+			if variable:
+				self.count(name, variable, data)
 
-						elif vMatchType == 'ip':
-							variable = IpVariable(vValue)
+		return data
 
-						elif vMatchType == 'time':
-							variable = TimeVariable(vValue)
+	def count(self, name, variable, data):
+		"""Increases the counters of the features calculated from one variable.
 
-						elif vMatchType == 'duration':
-							if isinstance(vvalue, list) and len(vValue) == 2:
-								variable = TimedeltaVariable(vValue[0], vValue[1])
-							else:
-								raise ConfigError(self, "VARIABLES: illegal arg in %s (two-item list expected)" %(vName))
+		name     -- Variable name.
+		variable -- Variable object, as it is found in the record.
+		data     -- Data array (counters).
+		"""
+		self.matcher(name, variable).count(variable, data)
 
+		# Manage default features: only counted if no other feature
+		# of the same variable has been matched.
+		for d in self.defaults.get(name, ()):
+			assigned = False
+			for i in self.variables[name]:
+				if data[i] > 0:
+					assigned = True
+					break
+			if not assigned:
+				data[d] += 1
 
-					except:
-						variable = None
-				else:
-					raise ConfigError(self, "VARIABLES: illegal matchtype in '%s' (%s)" %(vName, vMatchType))
+	def accumulate(self, variables, data, scratch):
+		"""Adds the features counters of a record to the counters of an observation,
+		without building the Record and Observation objects of the record.
 
+		variables -- Dictionary of variables of the record (see VariablePlan.extract).
+		data      -- Data array (counters) of the observation.
+		scratch   -- Data array as long as data, used to count the variables with
+		             default features (their defaults depend on this record only).
+		"""
+		for name in self.variables:
+			variable = variables.get(name)
+			if not variable:
+				continue
+
+			if name in self.defaults:
+				indexes = self.variables[name]
+				for i in indexes:
+					scratch[i] = 0
+				self.count(name, variable, scratch)
+				for i in indexes:
+					data[i] += scratch[i]
+			else:
+				self.matcher(name, variable).count(variable, data)
 
-				self.variables[vName] = variable
-	
 	def __repr__(self):
-		return "<%s - %d variables>" %(self.__class__.__name__, len(self.variables))
-		
-	def __str__(self):
-		return self.variables.__str__()
+		return "<%s - %d features, %d variables>" %(self.__class__.__name__, len(self.label), len(self.variables))
+
+
+class FeatureMatcher(object):
+	"""Features calculated from a single variable, with their values already parsed.
+
+	Values are parsed with the loader of a prototype variable, so the 
+	comparisons are the same ones of Variable.equals() and Variable.belongs():
+	- single/multiple: dictionary of values (hash lookup).
+	- range:           list of bounds, sorted by their initial value.
+	- regexp:          list of compiled patterns.
+
+	Class Attributes:
+		values  -- Dictionary of feature indexes, indexed by parsed value.
+		iptypes -- Dictionary of feature indexes, indexed by IP type ('PRIVATE', 'PUBLIC').
+		ranges  -- Sorted list of (start, end, index) tuples. 'None' end means infinite.
+		regexps -- List of (pattern, index) tuples.
+	"""
+	def __init__(self, features, prototype):
+		"""Class constructor.
+
+		features  -- List of (index, matchtype, value) tuples.
+		prototype -- Variable object used to parse the values.
+		"""
+		self.ip      = isinstance(prototype, IpVariable)
+		self.values  = {}
+		self.iptypes = {}
+		self.ranges  = []
+		self.regexps = []
+
+		for (i, fType, fValue) in features:
+			if fType == 'single':
+				self.addValue(i, fValue, prototype)
+
+			elif fType == 'multiple':
+				for v in fValue:
+					self.addValue(i, v, prototype)
+
+			elif fType == 'range':
+				start = prototype.load(fValue[0])
+				end   = fValue[1]
+				if str(end).lower() == 'inf':
+					end = None
+				end = prototype.load(end)
+				# A range without a valid start never matches
+				if start is not None:
+					self.ranges.append((start, end, i))
+
+			elif fType == 'regexp':
+				self.regexps.append((fValue, i))
+
+		self.ranges.sort(key=lambda r: r[0])
+
+	def addValue(self, index, raw_value, prototype):
+		"""Adds a single value to the lookup dictionaries.
+		"""
+		if self.ip and raw_value in ('private', 'public'):
+			self.iptypes.setdefault(raw_value.upper(), []).append(index)
+		else:
+			self.values.setdefault(prototype.load(raw_value), []).append(index)
+
+	def match(self, value, data):
+		"""Increases the counters of the features matching a single value.
+
+		value -- Value of the variable, already loaded.
+		data  -- Data array (counters).
+		"""
+		if value is None:
+			# Only plain comparisons match an empty value (IP comparisons never do)
+			if not self.ip:
+				for i in self.values.get(None, ()):
+					data[i] += 1
+			return
+
+		for i in self.values.get(value, ()):
+			data[i] += 1
+
+		if self.iptypes:
+			for i in self.iptypes.get(value.iptype(), ()):
+				data[i] += 1
+
+		for (start, end, i) in self.ranges:
+			if start > value:
+				break
+			if end is None or value <= end:
+				data[i] += 1
+
+	def count(self, variable, data):
+		"""Increases the counters of the features matching a variable.
+
+		variable -- Variable or MultipleVariable object.
+		data     -- Data array (counters).
+		"""
+		if isinstance(variable, MultipleVariable):
+			for v in variable.value:
+				self.match(v.value, data)
+		else:
+			self.match(variable.value, data)
+
+		for (pattern, i) in self.regexps:
+			if pattern.search(str(variable)):
+				data[i] += 1
 
 
 #-----------------------------------------------------------------------
@@ -458,125 +775,53 @@ class Observation(object):
 	[0, 1, 0, 0, 2, 0, 0, 0, 3, 1, 0, ...]
 
 	Class Attributes:
-		label -- Array of features names.
-		data  -- Array of data values.
+		label -- Array of features names, shared by all the observations of a source.
+		data  -- Array of data values (array of C longs).
 
 	"""
+	__slots__ = ('label', 'data')
+
 	def __init__(self, record, FEATURES, debug=None):
 		"""Creates an observation from a record of variables.
 		record    -- Record object.
-		FEATURES -- List of features configurations.
+		FEATURES -- FeaturePlan object, or list of features configurations.
 
 		"""
-		self.label = [None] * len(FEATURES)    # List of features names
-		self.data  = [None] * len(FEATURES)    # Data array (counters)
-		defaults = []		               # tracks default features
-		
-		for i in range(len(FEATURES)):
-			try:
-				fName  = FEATURES[i]['name']
-				fVariable = FEATURES[i]['variable']
-				fType  = FEATURES[i]['matchtype']
-				fValue = FEATURES[i]['value']
-			except KeyError as e:
-				raise ConfigError(self, "FEATURES: missing config key (%s)" %(e.message))
-
-			# Validate name
-			if fName:
-				fName = str(fName)
-			else:
-				raise ConfigError(self, "FEATURES: missing variable name")
-
-			# Validate variable
-			try:				
-				variable = record.variables[fVariable]
-			except KeyError as e:
-				variable = None
+		# Compile the features configuration if it was not done before
+		if isinstance(FEATURES, FeaturePlan):
+			plan = FEATURES
+		else:
+			plan = FeaturePlan(FEATURES)
 
-			# Calculate feature 
+		# Iterate through all the variables involved in the features. For each one, check the value of the variable
+		# against the pre-parsed values of its features. If there is a match, the counters of the observations are
+		# increased. --> FaaC (Feature as a counter)
+		self.label = plan.label                # List of features names (shared)
+		self.data  = plan.run(record)          # Data array (counters)
 
-			# Iterate through all the features in the conf file. For each iteration, check the matchtype of the variable 
-			# involved. Then, check the value of the variable asociated to the feature. If there is a match, the counters
-			# of the observations are increased. --> FaaC (Feature as a counter)
+		# Show debug info
+		if debug:
+			for i in range(len(self.label)):
+				print(("%s%s %d" %(self.label[i].ljust(25), str(record.variables.get(plan.variable[i])).ljust(30), self.data[i])))
 
-			counter = 0
-			if variable:
-				if fType == 'single':
-					if isinstance(fValue, list):
-						raise ConfigError(self, "FEATURES: illegal value in '%s' (single item expected)" %(fName))
-					counter += variable.equals(fValue)
-
-				elif fType == 'multiple':
-					if isinstance(fValue, list):
-						for v in fValue:
-							counter += variable.equals(v)
-					else:
-						raise ConfigError(self, "FEATURES: illegal value in '%s' (list of items expected)" %(fName))
-
-				elif fType == 'range':
-					if isinstance(fValue, list) and len(fValue) == 2:
-						start = fValue[0]
-						end   = fValue[1]
-						if str(end).lower() == 'inf':
-							end = None
-						counter += variable.belongs(start, end)
-					else:
-						raise ConfigError(self, "FEATURES: illegal value in '%s' (two-item list expected)" %(fName))
-				
-				elif fType == 'regexp':
-					if isinstance(fValue, list):
-						raise ConfigError(self, "FEATURES: illegal value in '%s' (single item expected)" %(fName))
-					pattern = fValue
-					try:
-						matchObj = re.search(pattern, str(variable))
-					except re.error as e:
-						raise ConfigError(self, "FEATURES: illegal regexp in '%s' (%s)" %(fName, e.message))
-					if matchObj:
-						counter += 1
-						
-				elif fType == 'default':
-					defaults.append(i)
-				
-				else:
-					raise ConfigError(self, "FEATURES: illegal matchtype in '%s' (%s)" %(fName, fType))
-				
-			# Update data lists
-			self.label[i] = fName
-			self.data[i]  = counter
-
-			# Show debug info
-			if debug:
-				if vType == 'regexp':
-					print(("%s%s %d" %(fName.ljust(25), (str(variable) + " == " + str("r'" + vValue + "'")).ljust(30), counter)))
-				else:
-					print(("%s%s %d" %(fName.ljust(25), (str(variable) + " == " + str(vValue)).ljust(30), counter)))
-
-		# Manage default variables
-		for d in defaults:
-			assigned = False
-			for i in range(len(FEATURES)):
-				if FEATURES[i]['variable'] == FEATURES[d]['variable']:
-					if self.data[i] > 0:
-						assigned = True
-						break
-			if not assigned:
-				self.data[d] += 1
-			
 	def aggregate(self, obs):
 		""" Aggregates this observation with a new one.
 			obs -- Observation object to merge with.
 		"""
 		
 
-		if self.label == obs.label:
-			try:
-				for i in range(len(self.data)):
-					self.data[i] += obs.data[i]
-			except IndexError as e:
-				raise AggregateError (self, "Unable to aggregate data arrays (%s)" %(e.message))
+		if self.label is obs.label or self.label == obs.label:
+			if len(obs.data) < len(self.data):
+				raise AggregateError (self, "Unable to aggregate data arrays (%d < %d values)" %(len(obs.data), len(self.data)))
+			# Added in place: the counters of a single record are mostly zeros, so they are skipped
+			data = self.data
+			values = obs.data if len(obs.data) == len(data) else obs.data[:len(data)]
+			for i, v in enumerate(values):
+				if v:
+					data[i] += v
 
 		else:
-			self.label += obs.label
+			self.label = self.label + obs.label
 			self.data += obs.data
 
 	def formatCSV(self):
@@ -639,11 +884,16 @@ class AggregatedObservation(Observation):
 		data  -- Array of data values.
 		nObs  -- Number of observations aggregated.
 	"""
+	__slots__ = ('ID', 'nObs')
+
+	# Positions of the features of a label in the padded arrays (see zeroPadding)
+	paddings = {}
+
 	def __init__(self, record, FEATURES, keys):
 		"""Creates an aggregated observation from a record of variables.
 		
 		record    -- Record object.
-		FEATURES -- List of variable configurations.
+		FEATURES -- FeaturePlan object, or list of features configurations.
 		keys -- List of keys configurations.
 		"""
 		try:
@@ -670,7 +920,7 @@ class AggregatedObservation(Observation):
 		"""
 		if self.ID == aggr_obs.ID:
 			super(AggregatedObservation, self).aggregate(aggr_obs)      # Python3: super().aggregate()
-			self.nObs += 1
+			self.nObs += aggr_obs.nObs
 		else:
 			raise AggregateError(self, "Observation IDs don't match.")
 
@@ -679,17 +929,46 @@ class AggregatedObservation(Observation):
 
 
 	def zeroPadding(self, features):
+		"""Rearranges the data array as the given list of features.
+		Features not calculated in this observation are filled with zeros.
 
-		all_data = [0] * len(features)
-		all_labels = features
-		for feature in features:
-			if feature in self.label:
-				all_data[all_labels.index(feature)] = self.data[self.label.index(feature)]
-			else:
-				all_data[all_labels.index(feature)] = 0
+		features -- List of features names.
+		"""
+		positions = self.paddingPositions(self.label, features)
+		data = self.data
+		self.data = array('l', [data[i] if i >= 0 else 0 for i in positions])
+		self.label = features
+
+	@classmethod
+	def paddingPositions(cls, label, features):
+		"""Returns, for each one of the given features, its position in a label
+		or -1 if it is not in the label. Repeated features are only placed once.
+		The positions are computed once for each pair of label and features lists.
+
+		label    -- Array of features names of an observation.
+		features -- List of features names.
+		"""
+		key = (id(label), id(features))
+		cached = cls.paddings.get(key)
+		if cached is None or cached[0] is not label or cached[1] is not features:
+			index = {}
+			for i in range(len(label)):
+				index.setdefault(label[i], i)
+			positions = []
+			placed = set()
+			for feature in features:
+				if feature in placed:
+					positions.append(-1)
+				else:
+					placed.add(feature)
+					positions.append(index.get(feature, -1))
 
-		self.data = all_data
-		self.label = all_labels
+			if len(cls.paddings) > 1024:
+				cls.paddings.clear()
+			cached = (label, features, positions)
+			cls.paddings[key] = cached
+
+		return cached[2]
 
 
 	
@@ -720,6 +999,16 @@ class ObservationBatch(object):
 		else:
 			self.observations[obs.ID] = obs
 
+	def merge(self, obsBatch):
+		"""Merges the observations of another batch into this one,
+		keeping the order of appearance of their IDs.
+
+		obsBatch -- ObservationBatch object to merge with.
+		"""
+
+		for obs in obsBatch.observations.values():
+			self.add(obs)
+
 	def __str__(self):
 		"""Prints nice representation of the batch
 		"""
@@ -742,6 +1031,47 @@ class ObservationBatch(object):
 
 
 
+#-----------------------------------------------------------------------
+# Reading Functions
+#-----------------------------------------------------------------------
+
+def readLogs(input_path, separator, blocksize=65536):
+	"""Generator of the logs of an unstructured file, without their separator.
+
+	The file is read in blocks, and the separator is only searched in the
+	new data of each block, so every log is scanned once whatever its size.
+	Empty logs between two consecutive separators are also generated, but
+	not the empty remainder after the last separator.
+
+	input_path -- Path to the input file (gzip compressed if it ends with '.gz').
+	separator  -- Logs separator.
+	blocksize  -- Number of characters read at once.
+	"""
+	if input_path.endswith('.gz'):
+		input_file = gzip.open(input_path,'rt')
+	else:
+		input_file = open(input_path,'r')
+
+	with input_file:
+		buff = ""
+		block = input_file.read(blocksize)
+		while block:
+			# A separator may start at the end of the previous block
+			search = max(len(buff) - len(separator) + 1, 0)
+			buff += block
+			start = 0
+			end = buff.find(separator, search)
+			while end != -1:
+				yield buff[start:end]
+				start = end + len(separator)
+				end = buff.find(separator, start)
+			buff = buff[start:]
+			block = input_file.read(blocksize)
+
+		if buff:
+			yield buff
+
+
 #-----------------------------------------------------------------------
 # Exception and Error Classes
 #-----------------------------------------------------------------------
@@ -752,6 +1082,10 @@ class ConfigError(Exception):
 		self.message = message
 		self.msg = "ERROR - Config File - %s" %(message)
 
+	def __reduce__(self):
+		# Errors raised in parsing processes are sent back without the object
+		return (self.__class__, (None, self.message))
+
 class AggregateError(Exception):
 	def __init__(self, obj, message=''):
 		self.obj = obj
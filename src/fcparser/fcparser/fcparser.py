@@ -21,9 +21,15 @@ import time
 import gzip
 import shutil
 import yaml
-import subprocess
+import multiprocessing
+from array import array
 
 from . import faaclib
+from . import nfcapd
+from . import splitData
+
+# Minimum size of the byte ranges of a file parsed in parallel
+RANGE_SIZE = 16 * 1024 * 1024
 
 def main(call='external',configfile=''):
 	
@@ -35,8 +41,6 @@ def main(call='external',configfile=''):
 		configfile = args.config
 		
 
-	delete_nfcsv = None # variable for netflow raw data  	
-
 	try:
 		parserConfig = getConfiguration(configfile)
 	except IOError:
@@ -97,6 +101,34 @@ def main(call='external',configfile=''):
 	except KeyError as e:
 		Keys = None 
 
+	# Parsing settings
+	try:
+		ENGINE = parserConfig['Parsing']['engine']
+	except (KeyError, TypeError):
+		ENGINE = None
+	if not ENGINE:
+		ENGINE = 'records'
+	try:
+		CHUNKSIZE = int(parserConfig['Parsing']['chunksize'])
+	except (KeyError, TypeError, ValueError):
+		CHUNKSIZE = 100000
+	try:
+		WORKERS = int(parserConfig['Parsing']['workers'])
+	except (KeyError, TypeError, ValueError):
+		WORKERS = 1
+	if WORKERS < 1:
+		WORKERS = multiprocessing.cpu_count()
+
+	if ENGINE == 'columnar':
+		try:
+			from . import columnar
+		except ImportError as e:
+			print(("The columnar engine requires numpy and pandas (%s)" %(e)))
+			exit(1)
+	elif ENGINE != 'records':
+		print(("Unknown parsing engine '%s'. Supported engines: records, columnar" %(ENGINE)))
+		exit(1)
+
 	FEATURES = {}
 	STRUCTURED = {}
 	SEPARATOR = {}
@@ -113,35 +145,25 @@ def main(call='external',configfile=''):
 		print(("Missing config key: %s" %(e.message)))
 		exit(1)
 
-	# Preprocessing nfcapd files to obtain csv files.
-	for source in dataSources:
-		out_files = []
-		for file in SOURCES[source]['FILES']:
-			if 'nfcapd' in file:
-
-				out_file = '/'.join(file.split('/')[:-1]) + '/temp_' + file.split('.')[-1] + ""
-				os.system("nfdump -r " + file + " -o csv >>"+out_file)
-				os.system('tail -n +2 '+out_file + '>>' + out_file.replace('temp',source))
-				os.system('head -n -3 ' + out_file.replace('temp',source) + ' >> ' + out_file.replace('temp',source) + '.csv')
-				out_files.append(out_file.replace('temp',source) + '.csv')
-				os.remove(out_file)
-				os.remove(out_file.replace('temp',source))
-		
-				SOURCES[source]['FILES'] = out_files
-				delete_nfcsv = out_files
-
-
-
+	# Compile the variables and features of each source once, to be shared by all its records and observations
+	VPLANS = {}
+	PLANS = {}
+	try:
+		for source in SOURCES:
+			VPLANS[source] = faaclib.VariablePlan(SOURCES[source]['CONFIG']['VARIABLES'], STRUCTURED[source])
+			PLANS[source] = faaclib.FeaturePlan(FEATURES[source])
+	except faaclib.ConfigError as e:
+		print((e.msg))
+		exit(1)
 
 	# If there are split parameters, perform split procedure
 	if not (parserConfig['SPLIT']['Time']['window'] == None or parserConfig['SPLIT']['Time']['start'] == None or parserConfig['SPLIT']['Time']['end'] == None):
 		
 		print("\n\nSPLITTING DATA\n\n")
-		retcode = subprocess.call("python "+ os.path.dirname(__file__) +"/splitData.py "+ configfile, shell=True)
-
-		if retcode == 0:
-			pass  # No exception, all is good!
-		else:
+		try:
+			splitData.split(parserConfig, workers=WORKERS)
+		except faaclib.ConfigError as e:
+			print((e.msg))
 			print("Error splitting data")
 			exit(1)
 		
@@ -211,28 +233,9 @@ def main(call='external',configfile=''):
 	weightsStream.write(', '.join(weigthts) + '\n')
 	weightsStream.close()
 
-	# Count lines of datasources, for stats purposes.
-	lines = {}
-	for source in SOURCES:
-		lines[source] = 0
-		
-		for file in SOURCES[source]['FILES']:
-			if STRUCTURED[source]:
-				lines[source] += file_len(file)
-
-			else:
-				lines[source] += file_log_len(file,SEPARATOR[source])
-	
-	# Sum lines from all datasources to obtain tota lines.
-	total_lines = 0
-
-	stats['lines'] = {}
-	for source in lines:
-		total_lines += lines[source]
-		stats['lines'][source] = lines[source]
-
 	# Get a dictionary with all de var names 
 	# to check if sources are unused due to choosen key
+	unused_sources = []
 	if Keys:
 		var_names = {}
 		for source in SOURCES:
@@ -241,59 +244,28 @@ def main(call='external',configfile=''):
 				var_names[source].append(SOURCES[source]['CONFIG']['VARIABLES'][variable]['name'])
 
 	# Count in witch source the key does not appear
-		unused_sources=[]
 		for source in var_names:
 			if isinstance(Keys,list):
 				if not all(x in var_names[source] for x in Keys):
-					SOURCES.pop(source, None)
 					unused_sources.append(source)
 			else:
 				if Keys not in var_names[source]:
-					SOURCES.pop(source, None)
 					unused_sources.append(source)
 
-	# Count unused lines from all unused sources
+	# Lines of datasources, for stats purposes.
+	# Parsed sources are counted while parsing; unused sources are only read here,
 	# in order to calculate a percentage of used entries.
-		unused_lines = 0 
-		for source in unused_sources:
-			if source in list(lines.keys()):				
-				unused_lines += lines[source]
-
-
-
-		if unused_sources:
-			print("\n\n###################################################################################################")
-			print("                                                                                                       ")
-			print("                   WARNING: DATASOURCES UNUSED DUE TO CHOOSEN KEY                                      ")
-			print(("                   UNUSED DATASOURCES:     " +str(unused_sources) +"                                   "))
-			print(("                   PERCENTAGE OF USED ENRIES: " +str(float(total_lines - unused_lines)*100/total_lines))) 
-			print("                                                                                                       ")
-			print("###################################################################################################\n\n")
-			
-
-			statsLine = "#------------------------------------------------\n"
-			statsStream.write(statsLine)
-			statsLine = "WARNING: DATASOURCES UNUSED DUE TO CHOOSEN KEY\n"
-			statsStream.write(statsLine)
-			statsLine = "UNUSED DATASOURCES:     " +str(unused_sources) +"\n"
-			statsStream.write(statsLine)
-			statsLine = "PERCENTAGE USED ENRIES: " +str(float(total_lines - unused_lines)*100/total_lines) +"\n"
-			statsStream.write(statsLine)
-			statsLine = "#------------------------------------------------\n\n"
-			statsStream.write(statsLine)
-
-	
-	# Extracting stats info, used and unused lines:
-
-	stats['unused_lines'] = {}
-
+	lines = {}
 	for source in SOURCES:
-		stats['unused_lines'][source] = 0
+		lines[source] = 0
 
-	if Keys:
-		if unused_sources:
-			for unused_source in unused_sources:
-				stats['unused_lines'][unused_source] = lines[unused_source]
+	for source in unused_sources:
+		for file in SOURCES[source]['FILES']:
+			if STRUCTURED[source]:
+				lines[source] += file_len(file)
+			else:
+				lines[source] += file_log_len(file,SEPARATOR[source])
+		SOURCES.pop(source, None)
 
 	# Process files
 	# ==============
@@ -301,137 +273,69 @@ def main(call='external',configfile=''):
 	OBSERVATIONS = {}
 	count_total = 0
 
-	# Iterate through datasources.
+	# Build the parsing jobs: one per file, or one per byte range of large structured files.
+	jobs = []
 	for source in SOURCES:
-		count = 0
 		OBSERVATIONS[source] = {}
-
-		currentTime = time.time()
-
-		print("\n-----------------------------------------------------------------------\n")
-		print(("Elapsed: %s \n" %(prettyTime(currentTime - startTime))))	
-
-		# Iterate through files.
-
-
-		for i in range(len(SOURCES[source]['FILES'])):
-			input_path = SOURCES[source]['FILES'][i]
+		for input_path in SOURCES[source]['FILES']:
 			if input_path:
-				
-				count += 1
-				count_total += 1
-				tag = getTag(input_path)
-
-				# Print some progress stats
-				print(("%s  #%s / %s  %s" %(source, str(count), str(len(SOURCES[source]['FILES'])), tag)))	
-				
-				# Loop for structured sources
-				if STRUCTURED[source]:
-
-					# Start reading the file		
-					if input_path.endswith('.gz'):
-		    				input_file = gzip.open(input_path,'r')
-					else:
-						input_file = open(input_path,'r')
-
-					line = input_file.readline()
-
-
-					# Create observation batch
-					try:
-						obsBatch = faaclib.ObservationBatch()
-					except faaclib.ConfigError as e:
-						print((e.msg))
-						exit(1)
-
-					while line:
-						#Extract one record from each line of the file
-						record = faaclib.Record(line,SOURCES[source]['CONFIG']['VARIABLES'], STRUCTURED[source])
-				
-						# Generate and aggregate observation
-						obs = faaclib.AggregatedObservation(record, FEATURES[source], Keys)
-						obsBatch.add(obs)
-						line = input_file.readline()
-
-				# Loop for unstructured sources
+				if STRUCTURED[source] and ENGINE == 'records':
+					ranges = fileRanges(input_path, WORKERS)
 				else:
+					ranges = [(0, None)]
+
+				for start, end in ranges:
+					jobs.append((source, input_path, VPLANS[source], PLANS[source], 
+						STRUCTURED[source], SEPARATOR.get(source), Keys, ENGINE, CHUNKSIZE, start, end))
+
+	# Parse the jobs in a pool of processes, or serially in this one.
+	# Results are returned in order, so partial batches are merged as if they were parsed serially.
+	pool = None
+	if WORKERS > 1 and len(jobs) > 1:
+		pool = multiprocessing.Pool(min(WORKERS, len(jobs)))
+		results = pool.imap(parseJob, jobs)
+	else:
+		results = map(parseJob, jobs)
 
-					# Start reading the file
-					if input_path.endswith('.gz'):
-		    				input_file = gzip.open(input_path,'r')
-					else:
-						input_file = open(input_path,'r')
-
-					line = input_file.readline()
-
-
-					if line:
-						# Create observation batch
-						try:
-							obsBatch = faaclib.ObservationBatch()
-						except faaclib.ConfigError as e:
-							print((e.msg))
-							exit(1)
-
-						# Now, reading logs instead of lines, read until separator		
-						log ="" + line
-
-						while line:
-
-							# Add lines to log until separator is reached.
-							log += line 
-
-							if len(log.split(SEPARATOR[source])) > 1:
-
-								# for each log generate one record and convert into observation
-								logExtract = log.split(SEPARATOR[source])[0]
-								record = faaclib.Record(logExtract,SOURCES[source]['CONFIG']['VARIABLES'], STRUCTURED[source])
-								aggregate_bool = True
-								
-								if Keys:
-									if not isinstance(Keys,list):
-										Keys = [Keys]
-									for key in Keys:
-										if (record.variables[key] == None): 
-											aggregate_bool = False
-
-								if aggregate_bool:
-
-									# Generate and aggregate observation
-									obs = faaclib.AggregatedObservation(record, FEATURES[source], Keys)
-									obsBatch.add(obs)
-
-
-								log = ""
-								for n in logExtract.split(SEPARATOR[source])[1::]:
-									log += n
-
-							line = input_file.readline()
-
-						
-						# Add the last log after the last separator.
-						log += line
-						record = faaclib.Record(log,SOURCES[source]['CONFIG']['VARIABLES'], STRUCTURED[source])
-						
-						aggregate_bool = True
-
-						if Keys:
-							if not isinstance(Keys,list):
-								Keys = [Keys]
-							for key in Keys:
-								if (record.variables[key] == None): 
-									aggregate_bool = False
-
-						if aggregate_bool:
+	current = None
+	parseTime = time.time()
+	parsedLines = 0
+	try:
+		for job, (obsBatch, nLines) in zip(jobs, results):
+			source, input_path, start = job[0], job[1], job[9]
+			tag = getTag(input_path)
+			lines[source] += nLines
+			parsedLines += nLines
+
+			if source != current:
+				current = source
+				count = 0
+				print("\n-----------------------------------------------------------------------\n")
+				print(("Elapsed: %s \n" %(prettyTime(time.time() - startTime))))
+
+			if start == 0:
+				count += 1
+				count_total += 1
 
-							# Generate and aggregate observation
-							obs = faaclib.AggregatedObservation(record, FEATURES[source], Keys)
-							obsBatch.add(obs)
+				# Save output in a dictionary of dictionaries
+				OBSERVATIONS[source][tag] = obsBatch
+			else:
+				# Merge the batch of a byte range with the previous ranges of the same file
+				OBSERVATIONS[source][tag].merge(obsBatch)
 
+			# Print some progress stats (only the lines parsed, not those of the unused sources)
+			elapsed = time.time() - parseTime
+			print(("%s  #%s / %s  %s  %s lines  (total %s lines, %d lines/sec)" %(source, str(count), str(len(SOURCES[source]['FILES'])), 
+				tag, str(nLines), str(parsedLines), parsedLines / max(elapsed, 1e-6))))
 
-			# Save output in a dictionary of dictionaries
-			OBSERVATIONS[source][tag] = obsBatch
+	except faaclib.ConfigError as e:
+		print((e.msg))
+		exit(1)
 
+	finally:
+		if pool:
+			pool.terminate()
+			pool.join()
 
 
 	# Fuse output observation from all datasources
@@ -500,9 +404,6 @@ def main(call='external',configfile=''):
 		print("\n\n\nRemoving temporal files...")
 		shutil.rmtree(parserConfig['SPLIT']['Output'], ignore_errors=True)
 	
-	if delete_nfcsv:
-		for file in delete_nfcsv:
-			os.remove(file)
 
 	# Write outputs
 	# ==============
@@ -561,6 +462,40 @@ def main(call='external',configfile=''):
 
 	print("Writing stats...\n")
 
+	# Extracting stats info, used and unused lines:
+	stats['lines'] = lines
+	stats['unused_lines'] = {}
+	for source in SOURCES:
+		stats['unused_lines'][source] = 0
+
+	if unused_sources:
+		total_lines = 0
+		unused_lines = 0
+		for source in lines:
+			total_lines += lines[source]
+			if source in unused_sources:
+				unused_lines += lines[source]
+
+		print("\n\n###################################################################################################")
+		print("                                                                                                       ")
+		print("                   WARNING: DATASOURCES UNUSED DUE TO CHOOSEN KEY                                      ")
+		print(("                   UNUSED DATASOURCES:     " +str(unused_sources) +"                                   "))
+		print(("                   PERCENTAGE OF USED ENRIES: " +str(float(total_lines - unused_lines)*100/total_lines))) 
+		print("                                                                                                       ")
+		print("###################################################################################################\n\n")
+		
+
+		statsLine = "#------------------------------------------------\n"
+		statsStream.write(statsLine)
+		statsLine = "WARNING: DATASOURCES UNUSED DUE TO CHOOSEN KEY\n"
+		statsStream.write(statsLine)
+		statsLine = "UNUSED DATASOURCES:     " +str(unused_sources) +"\n"
+		statsStream.write(statsLine)
+		statsLine = "PERCENTAGE USED ENRIES: " +str(float(total_lines - unused_lines)*100/total_lines) +"\n"
+		statsStream.write(statsLine)
+		statsLine = "#------------------------------------------------\n\n"
+		statsStream.write(statsLine)
+
 	total_lines = 0
 	total_unused_lines = 0
 	total_files = 0
@@ -585,41 +520,282 @@ def main(call='external',configfile=''):
 
 
 	
-def getTag(filename):
-	tagSearch = re.search("(\w*)\.\w*$", filename)
-	if tagSearch:
-		return tagSearch.group(1)
+def parseJob(job):
+	"""Parses a job of the pool of processes (see parseFile).
+	"""
+	return parseFile(*job)
+
+
+def parseFile(source, input_path, variables, plan, structured, separator, Keys, engine, chunksize, start=0, end=None):
+	"""Parses a file, or a byte range of it, into a batch of observations.
+	Returns an ObservationBatch object and the number of lines (or logs) parsed.
+
+	source     -- Datasource name.
+	input_path -- Path to the input file.
+	variables  -- VariablePlan object of the source.
+	plan       -- FeaturePlan object of the source.
+	structured -- True for structured sources.
+	separator  -- Logs separator of unstructured sources.
+	Keys       -- Aggregation keys.
+	engine     -- Parsing engine of structured sources ('records' or 'columnar').
+	chunksize  -- Number of lines read at once by the columnar engine.
+	start, end -- Byte range of the lines to parse (structured sources only).
+	"""
+	# Vectorized parsing of structured sources
+	# Malformed files (ragged or truncated lines) are parsed line by line, as the records engine does.
+	if structured and engine == 'columnar':
+		from . import columnar
+		try:
+			obsBatch = columnar.parseFile(input_path, variables, plan, Keys, chunksize)
+			return obsBatch, sum(obs.nObs for obs in obsBatch.observations.values())
+		except columnar.MalformedFileError as e:
+			print("WARNING - %s: parsed with the records engine" %(e.msg))
+
+	if structured:
+		return parseRecords(readLines(input_path, start, end), variables, plan, structured, Keys)
 	else:
-		return None
+		return parseRecords(faaclib.readLogs(input_path, separator), variables, plan, structured, Keys)
 
 
-def file_log_len(fname, separator):
+def parseRecords(records, variables, plan, structured, Keys):
+	"""Parses the lines (or logs) of a source into a batch of observations.
+	Returns an ObservationBatch object and the number of lines (or logs) parsed.
 
-	input_file = open(fname,'r')
-	line = input_file.readline()
-	count_log = 0
+	records    -- Iterable of lines (structured sources) or logs (unstructured sources).
+	variables  -- VariablePlan object of the source.
+	plan       -- FeaturePlan object of the source.
+	structured -- True for structured sources.
+	Keys       -- Aggregation keys.
+	"""
+	# Create observation batch
+	obsBatch = faaclib.ObservationBatch()
+	nLines = 0
 
-	if line:
-		log ="" + line
+	# Loop for structured sources
+	if structured:
 
-		while line:
-			log += line 
+		for line in records:
+			nLines += 1
 
-			if len(log.split(separator)) > 1:
-				logExtract = log.split(separator)[0]
-				count_log += 1		
-				log = ""
+			#Extract one record from each line of the file
+			record = faaclib.Record(line, variables, structured)
+	
+			# Generate and aggregate observation
+			obs = faaclib.AggregatedObservation(record, plan, Keys)
+			obsBatch.add(obs)
 
-				for n in logExtract.split(separator)[1::]:
-					log += n
+	# Loop for unstructured sources
+	else:
+
+		if Keys and not isinstance(Keys,list):
+			Keys = [Keys]
+
+		# for each log generate one record and convert into observation
+		for log in records:
+			nLines += 1
+			record = faaclib.Record(log, variables, structured)
+
+			aggregate_bool = True
+
+			if Keys:
+				for key in Keys:
+					if (record.variables[key] == None): 
+						aggregate_bool = False
+
+			if aggregate_bool:
+
+				# Generate and aggregate observation
+				obs = faaclib.AggregatedObservation(record, plan, Keys)
+				obsBatch.add(obs)
+
+	return obsBatch, nLines
 
-			line = input_file.readline()
-		log += line
-		
-		if not log == "":
-			count_log += 1 
 
-	return count_log			
+def parseObservation(records, config):
+	"""Parses the lines (or logs) of a source into a single observation, in memory
+	(see FCParser.parse).
+
+	records -- Iterable of lines (structured sources) or logs (unstructured sources).
+	config  -- Dictionary of the source configuration (see getConfiguration).
+	"""
+	return FCParser(config).parse(records)
+
+
+class FCParser(object):
+	"""Persistent parser of a data source.
+
+	The source configuration is loaded and compiled once, when the parser is
+	created, and shared by all the observations it parses afterwards. No
+	output files are written.
+
+	The counters of the records are added directly to the counters of the
+	observation (see FeaturePlan.accumulate), without building a Record and
+	an Observation object for each one of them.
+
+	Class Attributes:
+		config     -- Dictionary of the source configuration.
+		structured -- True for structured sources.
+		separator  -- Logs separator of unstructured sources.
+		variables  -- VariablePlan object of the source.
+		plan       -- FeaturePlan object of the source.
+		features   -- List of features names, in the order of the configuration.
+	"""
+	def __init__(self, config):
+		"""Class constructor. Raises ConfigError if the configuration is not correct.
+
+		config -- Dictionary of the source configuration, or path to its configuration file.
+		"""
+		if not isinstance(config, dict):
+			try:
+				config = getConfiguration(config)
+			except IOError:
+				raise faaclib.ConfigError(self, "No such config file '%s'" %(config))
+			except yaml.YAMLError as e:
+				raise faaclib.ConfigError(self, "Incorrect config file '%s' (%s)" %(config, e))
+		self.config = config
+
+		try:
+			self.structured = config['structured']
+			self.separator = None if self.structured else config['separator']
+			self.variables = faaclib.VariablePlan(config['VARIABLES'], self.structured)
+			self.plan = faaclib.FeaturePlan(config['FEATURES'])
+			self.features = [feature['name'] for feature in config['FEATURES']]
+		except KeyError as e:
+			raise faaclib.ConfigError(self, "Missing config key (%s)" %(e))
+
+	def parse(self, files_or_records):
+		"""Parses files, or lines (or logs), of the source into a single observation.
+		Returns the list of counters of the features of the source, in the order of
+		its configuration; None if there are no records.
+
+		files_or_records -- Path (or glob pattern) of the input files, or iterable
+		                    of lines (structured sources) or logs (unstructured sources).
+		"""
+		if isinstance(files_or_records, str):
+			records = self.readFiles(sorted(glob.glob(files_or_records)))
+		else:
+			records = files_or_records
+
+		return self.count(records, self.variables.extract)
+
+	def parseFields(self, rows):
+		"""Parses lines of a structured source, already split in fields, into a single
+		observation. The fields are not joined and split again as CSV lines.
+		Returns the list of counters of the features of the source, as parse() does;
+		None if there are no rows.
+
+		rows -- Iterable of lists of raw fields, in the order of the positions of VARIABLES.
+		"""
+		if not self.structured:
+			raise faaclib.ConfigError(self, "Fields can only be parsed for structured sources")
+
+		return self.count(rows, self.variables.extractFields)
+
+	def count(self, records, extract):
+		"""Adds the features counters of all the records into a single data array.
+		Returns the list of counters in the order of the configuration; None if there are no records.
+
+		records -- Iterable of records.
+		extract -- Function returning the dictionary of variables of a record.
+		"""
+		data = array('l', [0]) * len(self.plan.label)
+		scratch = array('l', [0]) * len(self.plan.label)
+		nRecords = 0
+
+		for record in records:
+			nRecords += 1
+			self.plan.accumulate(extract(record), data, scratch)
+
+		if not nRecords:
+			return None
+
+		positions = faaclib.AggregatedObservation.paddingPositions(self.plan.label, self.features)
+		return [data[i] if i >= 0 else 0 for i in positions]
+
+	def readFiles(self, paths):
+		"""Generator of the lines (or logs) of the input files.
+
+		paths -- List of paths to the input files.
+		"""
+		for input_path in paths:
+			if self.structured:
+				for line in readLines(input_path):
+					yield line
+			else:
+				for log in faaclib.readLogs(input_path, self.separator):
+					yield log
+
+
+def readLines(input_path, start=0, end=None):
+	"""Generator of the lines of a file, or of the lines starting in a byte range of it.
+
+	input_path -- Path to the input file (gzip compressed if it ends with '.gz', or nfcapd).
+	start, end -- Byte range. The whole file if end is None.
+
+	Binary nfcapd files are read as the CSV lines printed by nfdump.
+	"""
+	if nfcapd.isNfcapd(input_path):
+		for line in nfcapd.readFlows(input_path):
+			yield line
+	elif end is None:
+		if input_path.endswith('.gz'):
+			input_file = gzip.open(input_path,'rt')
+		else:
+			input_file = open(input_path,'r')
+		with input_file:
+			for line in input_file:
+				yield line
+	else:
+		with open(input_path,'rb') as input_file:
+			input_file.seek(start)
+			position = start
+			while position < end:
+				line = input_file.readline()
+				if not line:
+					break
+				position += len(line)
+				yield line.decode()
+
+
+def fileRanges(input_path, workers):
+	"""Splits a file in byte ranges, aligned to the beginning of lines, to be parsed in parallel.
+	Returns a list of (start, end) tuples; [(0, None)] for the whole file.
+
+	input_path -- Path to the input file.
+	workers    -- Number of processes parsing files.
+	"""
+	if workers <= 1 or input_path.endswith('.gz') or nfcapd.isNfcapd(input_path):
+		return [(0, None)]
+
+	size = os.path.getsize(input_path)
+	pieces = min(workers, size // RANGE_SIZE)
+	if pieces <= 1:
+		return [(0, None)]
+
+	offsets = [0]
+	with open(input_path,'rb') as input_file:
+		for i in range(1, pieces):
+			input_file.seek(max(size * i // pieces, offsets[-1]))
+			input_file.readline()
+			offsets.append(input_file.tell())
+	offsets.append(size)
+
+	return [(offsets[i], offsets[i+1]) for i in range(pieces) if offsets[i] < offsets[i+1]]
+
+
+def getTag(filename):
+	tagSearch = re.search("(\w*)\.\w*$", filename)
+	if tagSearch:
+		return tagSearch.group(1)
+	else:
+		return None
+
+
+def file_log_len(fname, separator):
+	count_log = 0
+	for log in faaclib.readLogs(fname, separator):
+		count_log += 1
+	return count_log
 
 	
 def prettyTime(elapsed):
@@ -641,9 +817,9 @@ def getConfiguration(config_file):
 	return conf
 
 def file_len(fname):
-    with open(fname) as f:
-        for i, l in enumerate(f):
-            pass
+    i = -1
+    for i, l in enumerate(readLines(fname)):
+        pass
     return i + 1
 
 def getArguments():
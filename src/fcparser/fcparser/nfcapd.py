@@ -0,0 +1,408 @@
+"""
+
+nfcapd -- Streaming readers of binary netflow (nfcapd) files.
+
+The flows of an nfcapd file are read as the CSV lines printed by
+'nfdump -o csv', so they can be parsed as any other structured source.
+nfdump runs as a child process whose output is read while it is written,
+without intermediate files. nfdump is required to read nfcapd files.
+
+A pure Python reader of uncompressed nfcapd files (nfdump 1.6 layout) is
+also provided for testing. It is never used instead of nfdump; it can be
+run, and checked against nfdump, as a program:
+
+	python -m fcparser.nfcapd [--check] NFCAPD_FILE
+
+"""
+
+import os
+import sys
+import shutil
+import struct
+import subprocess
+import time
+import argparse
+import ipaddress
+
+
+# nfcapd file layout (nfdump 1.6)
+MAGIC         = 0xA50C
+LAYOUT        = 1
+FILE_HEADER   = 140     # magic, version, flags, NumBlocks, ident[128]
+STAT_RECORD   = 136
+BLOCK_HEADER  = 12      # NumRecords, size, id, flags
+DATA_BLOCK    = 2
+COMPRESSED    = 0x1 | 0x8 | 0x10    # LZO, BZ2, LZ4
+
+# record types
+COMMON_RECORD_V0 = 1
+EXTENSION_MAP    = 2
+COMMON_RECORD    = 10
+
+# common record flags
+FLAG_IPV6_ADDR = 0x1
+FLAG_PKG_64    = 0x2
+FLAG_BYTES_64  = 0x4
+
+PROTOCOLS = {1: 'ICMP', 2: 'IGMP', 4: 'IPIP', 6: 'TCP', 17: 'UDP', 41: 'IPv6',
+	47: 'GRE', 50: 'ESP', 51: 'AH', 58: 'ICMP6', 89: 'OSPF', 132: 'SCTP'}
+
+# Extensions of the records (nfdump 1.6), following the addresses and the counters:
+# ID: (size, decoded fields)
+EXTENSIONS = {
+	4:  (4,  ('H', 'in', 'H', 'out')),
+	5:  (8,  ('I', 'in', 'I', 'out')),
+	6:  (4,  ('H', 'sas', 'H', 'das')),
+	7:  (8,  ('I', 'sas', 'I', 'das')),
+	8:  (4,  ('B', 'dtos', 'B', 'dir', 'B', 'smk', 'B', 'dmk')),
+	9:  (4,  ('4', 'nh')),
+	10: (16, ('16', 'nh')),
+	11: (4,  ('4', 'nhb')),
+	12: (16, ('16', 'nhb')),
+	13: (4,  ('H', 'svln', 'H', 'dvln')),
+	14: (4,  ('I', 'opkt')),
+	15: (8,  ('Q', 'opkt')),
+	16: (4,  ('I', 'obyt')),
+	17: (8,  ('Q', 'obyt')),
+	18: (4,  ()),
+	19: (8,  ()),
+	20: (16, ()),
+	21: (16, ()),
+	22: (40, ()),
+	23: (4,  ('4', 'ra')),
+	24: (16, ('16', 'ra')),
+	25: (4,  ()),
+	26: (8,  ()),
+	27: (8,  ()),
+}
+
+# Fields of the extensions, as printed by nfdump when they are missing
+EXTENSION_FIELDS = [('opkt', '0'), ('obyt', '0'), ('in', '0'), ('out', '0'), ('sas', '0'), ('das', '0'),
+	('smk', '0'), ('dmk', '0'), ('dtos', '0'), ('dir', '0'), ('nh', '0.0.0.0'), ('nhb', '0.0.0.0'),
+	('svln', '0'), ('dvln', '0')]
+
+# Fields never decoded, as printed by nfdump when they are missing:
+# ismc, odmc, idmc, osmc, mpls1-10, cl, sl, al
+EMPTY_FIELDS = ['00:00:00:00:00:00'] * 4 + ['0-0-0'] * 10 + ['0.000'] * 3
+
+
+#-----------------------------------------------------------------------
+# Reading Functions
+#-----------------------------------------------------------------------
+
+def isNfcapd(input_path):
+	"""Returns True if a data file is a binary nfcapd file.
+
+	input_path -- Path to the data file.
+	"""
+	return 'nfcapd' in os.path.basename(input_path)
+
+
+def readFlows(input_path):
+	"""Generator of the flows of an nfcapd file, as nfdump CSV lines.
+	Raises IOError if nfdump is not installed.
+
+	input_path -- Path to the nfcapd file.
+	"""
+	if not shutil.which('nfdump'):
+		raise IOError("nfdump is not installed: it is needed to read '%s'" %(input_path))
+
+	return readNfdump(input_path)
+
+
+def readNfdump(input_path):
+	"""Generator of the CSV lines printed by nfdump for an nfcapd file.
+	The header and summary lines are skipped. Raises IOError if nfdump fails.
+
+	input_path -- Path to the nfcapd file.
+	"""
+	process = subprocess.Popen(['nfdump', '-r', input_path, '-q', '-o', 'csv'],
+		stdout=subprocess.PIPE, universal_newlines=True)
+	complete = False
+	try:
+		for line in process.stdout:
+			# Flows start with their timestamp (YYYY-mm-dd)
+			if line[4:5] == '-':
+				yield line
+		complete = True
+	finally:
+		process.stdout.close()
+		if not complete:
+			process.kill()
+		process.wait()
+
+	if process.returncode != 0:
+		raise IOError("nfdump error reading '%s' (exit code %d)" %(input_path, process.returncode))
+
+
+#-----------------------------------------------------------------------
+# Reading Classes
+#-----------------------------------------------------------------------
+
+class FlowStream(object):
+	"""File-like object over a generator of lines, to be read by pandas.
+
+	Class Attributes:
+		lines  -- Iterator of lines.
+		buffer -- Characters read and not returned yet.
+	"""
+	def __init__(self, lines):
+		self.lines = iter(lines)
+		self.buffer = ''
+
+	def read(self, size=-1):
+		"""Returns up to size characters; all the remaining ones if size is negative.
+		"""
+		chunks = [self.buffer]
+		length = len(self.buffer)
+		for line in self.lines:
+			chunks.append(line)
+			length += len(line)
+			if size >= 0 and length >= size:
+				break
+		data = ''.join(chunks)
+		if size < 0:
+			size = len(data)
+		self.buffer = data[size:]
+		return data[:size]
+
+	def readline(self):
+		"""Returns the next line; an empty string at the end.
+		"""
+		position = self.buffer.find('\n')
+		if position < 0:
+			line = self.buffer + next(self.lines, '')
+			self.buffer = ''
+			return line
+		line = self.buffer[:position + 1]
+		self.buffer = self.buffer[position + 1:]
+		return line
+
+	def __iter__(self):
+		line = self.readline()
+		while line:
+			yield line
+			line = self.readline()
+
+
+class NfcapdFile(object):
+	"""Pure Python reader of uncompressed nfcapd files (nfdump 1.6 layout).
+
+	The common records (V0 and V1 layouts) are decoded with the extensions
+	listed in EXTENSIONS; the rest of fields are printed with their empty
+	value. Other records and blocks are skipped.
+
+	Class Attributes:
+		path   -- Path to the nfcapd file.
+		endian -- Byte order of the file ('<' or '>').
+		blocks -- Number of data blocks.
+	"""
+	def __init__(self, path):
+		"""Class constructor. Raises IOError if the file is not supported.
+
+		path -- Path to the nfcapd file.
+		"""
+		self.path = path
+
+		with open(path, 'rb') as f:
+			header = f.read(FILE_HEADER)
+		if len(header) < FILE_HEADER:
+			raise IOError("Not an nfcapd file: '%s'" %(path))
+
+		for endian in ('<', '>'):
+			magic, version, flags, blocks = struct.unpack(endian + 'HHII', header[:12])
+			if magic == MAGIC:
+				break
+		else:
+			raise IOError("Not an nfcapd file: '%s'" %(path))
+
+		if version != LAYOUT:
+			raise IOError("Unsupported nfcapd layout version %d: '%s'" %(version, path))
+		if flags & COMPRESSED:
+			raise IOError("Compressed nfcapd files are not supported: '%s'" %(path))
+
+		self.endian = endian
+		self.blocks = blocks
+
+	def records(self):
+		"""Generator of the common records of the file, as tuples of
+		(first, msec_first, last, msec_last, src, dst, srcport, dstport, prot,
+		tcp_flags, fwd_status, tos, packets, bytes, exporter, extensions),
+		where extensions is a dictionary of the decoded extension fields.
+		"""
+		endian = self.endian
+		blockHeader = struct.Struct(endian + 'IIHH')
+		recordHeader = struct.Struct(endian + 'HH')
+		mapHeader = struct.Struct(endian + 'HH')
+		commons = {COMMON_RECORD: struct.Struct(endian + 'HHHHIIBBBBHHHBB'),
+			COMMON_RECORD_V0: struct.Struct(endian + 'BBHHHIIBBBBHH')}
+		ipv4 = struct.Struct(endian + 'II')
+		ipv6 = struct.Struct(endian + 'QQQQ')
+		maps = {}
+
+		with open(self.path, 'rb') as f:
+			f.seek(FILE_HEADER + STAT_RECORD)
+			for b in range(self.blocks):
+				header = f.read(BLOCK_HEADER)
+				if len(header) < BLOCK_HEADER:
+					break
+				numRecords, size, blockId, blockFlags = blockHeader.unpack(header)
+				block = f.read(size)
+				if blockId != DATA_BLOCK:
+					continue
+
+				offset = 0
+				for r in range(numRecords):
+					if offset + 4 > len(block):
+						break
+					recordType, recordSize = recordHeader.unpack_from(block, offset)
+					if recordSize == 0:
+						break
+					if recordType in commons:
+						yield self.decode(block, offset + 4, recordType, commons[recordType], ipv4, ipv6, maps)
+					elif recordType == EXTENSION_MAP:
+						# map_id, extension_size, and the list of extension IDs ended by 0
+						mapId = mapHeader.unpack_from(block, offset + 4)[0]
+						ids = struct.unpack_from(endian + '%dH' %((recordSize - 8) // 2), block, offset + 8)
+						maps[mapId] = ids[:ids.index(0)] if 0 in ids else ids
+					offset += recordSize
+
+	def decode(self, block, offset, recordType, common, ipv4, ipv6, maps):
+		"""Decodes a common record (see records).
+		"""
+		if recordType == COMMON_RECORD:
+			(flags, ext_map, msec_first, msec_last, first, last, fwd_status, tcp_flags,
+				prot, tos, srcport, dstport, exporter, biFlowDir, flowEndReason) = common.unpack_from(block, offset)
+		else:
+			# V0 layout: 8-bit flags and exporter, and the forwarding status in the direction field
+			(flags, exporter, ext_map, msec_first, msec_last, first, last, fwd_status, tcp_flags,
+				prot, tos, srcport, dstport) = common.unpack_from(block, offset)
+		offset += common.size
+
+		if flags & FLAG_IPV6_ADDR:
+			s0, s1, d0, d1 = ipv6.unpack_from(block, offset)
+			src = ipaddress.IPv6Address(s0 << 64 | s1)
+			dst = ipaddress.IPv6Address(d0 << 64 | d1)
+			offset += ipv6.size
+		else:
+			s, d = ipv4.unpack_from(block, offset)
+			src = ipaddress.IPv4Address(s)
+			dst = ipaddress.IPv4Address(d)
+			offset += ipv4.size
+
+		counter = self.endian + ('Q' if flags & FLAG_PKG_64 else 'I')
+		packets = struct.unpack_from(counter, block, offset)[0]
+		offset += struct.calcsize(counter)
+
+		counter = self.endian + ('Q' if flags & FLAG_BYTES_64 else 'I')
+		nbytes = struct.unpack_from(counter, block, offset)[0]
+		offset += struct.calcsize(counter)
+
+		extensions = self.decodeExtensions(block, offset, maps.get(ext_map, ()))
+
+		return (first, msec_first, last, msec_last, src, dst, srcport, dstport, prot,
+			tcp_flags, fwd_status, tos, packets, nbytes, exporter, extensions)
+
+	def decodeExtensions(self, block, offset, ids):
+		"""Decodes the extensions of a record, in the order of its extension map.
+		Decoding stops at the first unknown extension.
+		Returns a dictionary of the decoded fields (see EXTENSIONS).
+		"""
+		extensions = {}
+		for extension in ids:
+			if extension not in EXTENSIONS:
+				break
+			size, fields = EXTENSIONS[extension]
+			position = offset
+			for i in range(0, len(fields), 2):
+				fmt, name = fields[i], fields[i + 1]
+				if fmt == '4':
+					extensions[name] = str(ipaddress.IPv4Address(struct.unpack_from(self.endian + 'I', block, position)[0]))
+					position += 4
+				elif fmt == '16':
+					high, low = struct.unpack_from(self.endian + 'QQ', block, position)
+					extensions[name] = str(ipaddress.IPv6Address(high << 64 | low))
+					position += 16
+				else:
+					extensions[name] = struct.unpack_from(self.endian + fmt, block, position)[0]
+					position += struct.calcsize(fmt)
+			offset += size
+		return extensions
+
+	def lines(self):
+		"""Generator of the flows of the file, as the CSV lines printed by 'nfdump -o csv'.
+		"""
+		for (first, msec_first, last, msec_last, src, dst, srcport, dstport, prot,
+			tcp_flags, fwd_status, tos, packets, nbytes, exporter, extensions) in self.records():
+
+			duration = ((last * 1000 + msec_last) - (first * 1000 + msec_first)) / 1000.0
+			if prot in (1, 58):
+				# ICMP type and code are stored in the destination port
+				srcport, dstport = 0, '%d.%d' %(dstport >> 8, dstport & 0xFF)
+
+			ext = [str(extensions.get(name, empty)) for name, empty in EXTENSION_FIELDS]
+
+			fields = [formatTime(first), formatTime(last), '%.3f' %(duration), str(src), str(dst),
+				str(srcport), str(dstport), PROTOCOLS.get(prot, str(prot)), formatFlags(tcp_flags),
+				str(fwd_status), str(tos), str(packets), str(nbytes)] + ext \
+				+ EMPTY_FIELDS + [extensions.get('ra', '0.0.0.0'), '0/0', str(exporter), formatTime(0) + '.000']
+
+			yield ','.join(fields) + '\n'
+
+
+def formatTime(seconds):
+	return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(seconds))
+
+def formatFlags(tcp_flags):
+	return ''.join([c if tcp_flags & (1 << (5 - i)) else '.' for i, c in enumerate('UAPRSF')])
+
+
+def check(input_path):
+	"""Compares the flows decoded by NfcapdFile with the output of 'nfdump -o csv'.
+	Prints the differing flows and returns their number.
+
+	input_path -- Path to the nfcapd file.
+	"""
+	differences = 0
+	expected = list(readFlows(input_path))
+	decoded = list(NfcapdFile(input_path).lines())
+
+	if len(expected) != len(decoded):
+		print("nfdump: %d flows, NfcapdFile: %d flows" %(len(expected), len(decoded)))
+		differences += 1
+
+	for n, (line, other) in enumerate(zip(expected, decoded)):
+		if line.strip() != other.strip():
+			print("Flow %d:\n  nfdump:     %s\n  NfcapdFile: %s" %(n, line.strip(), other.strip()))
+			differences += 1
+
+	return differences
+
+
+def main():
+	args = getArguments()
+
+	if args.check:
+		try:
+			differences = check(args.nfcapd_file)
+		except IOError as e:
+			print("ERROR - %s" %(e))
+			sys.exit(2)
+		print("%s: %d differences with nfdump" %(args.nfcapd_file, differences))
+		sys.exit(1 if differences else 0)
+
+	for line in NfcapdFile(args.nfcapd_file).lines():
+		sys.stdout.write(line)
+
+
+def getArguments():
+	parser = argparse.ArgumentParser(description='''Decodes an nfcapd file without nfdump (testing reader),
+					printing its flows as nfdump CSV lines.''')
+	parser.add_argument('nfcapd_file', metavar='NFCAPD_FILE', help='Path to the nfcapd file.')
+	parser.add_argument('-c', '--check', action='store_true', help='Compare the decoded flows with the output of nfdump.')
+	args = parser.parse_args()
+	return args
+
+
+if __name__ == "__main__":
+	main()
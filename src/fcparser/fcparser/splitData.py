@@ -1,5 +1,12 @@
 #!/usr/bin/env python
 
+"""
+splitData -- Splits the data files of the sources in time windows,
+writing one file per source and window. It can be run as a program, or
+called from the parser with split().
+
+"""
+
 import argparse
 import glob
 import sys
@@ -7,15 +14,27 @@ import re
 import gzip
 import os
 import time
+import shutil
 import yaml
+import multiprocessing
+from contextlib import closing
 from datetime import (datetime, timedelta)
-from bisect import (bisect_left, bisect_right)
+
+try:
+	from . import faaclib
+	from . import nfcapd
+except ImportError:
+	# Run as a script
+	import faaclib
+	import nfcapd
+
+# Characters buffered for all the windows of a file before they are written
+BUFFER_SIZE = 4 * 1024 * 1024
 
 
 def main():
-	init = time.time()
 	args = getArguments()
-	
+
 	# Check input arguments
 	try:
 		parserConfig = getConfiguration(args.config)
@@ -23,60 +42,72 @@ def main():
 		print("No such config file '%s'" %(args.config))
 		exit(1)
 	except yaml.scanner.ScannerError as e:
-		print("Incorrect config file '%s' (%s)" %(args.config, e.message))
+		print("Incorrect config file '%s' (%s)" %(args.config, e))
+		exit(1)
+
+	try:
+		split(parserConfig, args.verbose)
+	except faaclib.ConfigError as e:
+		print(e.msg)
 		exit(1)
+
+
+def split(parserConfig, verbose=False, workers=1):
+	"""Splits the data files of the sources in time windows.
+	The lines (or logs) of each window are appended to a file named after
+	the prefix of the source and the start of the window, in the output
+	directory of the SPLIT section.
+	Raises ConfigError if the configuration is not correct.
+
+	parserConfig -- Dictionary of the parser configuration.
+	verbose      -- Show the files created.
+	workers      -- Number of processes splitting files in parallel.
+	"""
+	init = time.time()
+
 	try:
 		timeWindow = timedelta(seconds=int(parserConfig['SPLIT']['Time']['window']))
 		startTime  = parserConfig['SPLIT']['Time']['start']
 		endTime    = parserConfig['SPLIT']['Time']['end']
-
-
+		outputDir  = str(parserConfig['SPLIT']['Output'])
 	except KeyError as e:
-		print("Missing config key (%s)" %(e.message))
-		exit(1)
-	except ValueError as e:
-		print("Incorrect value (%s)" %(e.message))
-		exit(1)
+		raise faaclib.ConfigError(parserConfig, "Missing config key (%s)" %(e))
+	except (TypeError, ValueError) as e:
+		raise faaclib.ConfigError(parserConfig, "Incorrect value (%s)" %(e))
 	if not isinstance(startTime, datetime):
-		print("Incorrect time format: '%s'" %(startTime))
-		exit(1)
+		raise faaclib.ConfigError(parserConfig, "Incorrect time format: '%s'" %(startTime))
 	if not isinstance(endTime, datetime):
-		print("Incorrect time format: '%s'" %(endTime))
-		exit(1)
-	
+		raise faaclib.ConfigError(parserConfig, "Incorrect time format: '%s'" %(endTime))
+
 	data = {}
-	SEPARATOR = {}
 
 	for source in parserConfig['DataSources']:
 		data[source] = {}
 		print(source)
-		
+
 		try:
 			config = getConfiguration(parserConfig['DataSources'][source]['config'])
 			data[source]['input'] = parserConfig['DataSources'][source]['data']
-			data[source]['output'] = str(parserConfig['SPLIT']['Output'])
 			data[source]['tag'] = config['tag']
 			data[source]['timestamp_format'] = config['timestamp_format']
 			data[source]['struc'] = config['structured']
-			
+
 			if not data[source]['struc']:
-				SEPARATOR[source] = config['separator']
+				data[source]['separator'] = config['separator']
 				data[source]['timestamp_regexp'] = config['timestamp_regexp']
-			
+
 			else:
 				data[source]['col'] = config['timearg']
 
 		except KeyError as e:
-			print("Missing config key in %s (%s)" %(source, e.message))
-			exit(1)
+			raise faaclib.ConfigError(parserConfig, "Missing config key in %s (%s)" %(source, e))
 		except ValueError as e:
-			print("Incorrect value in %s (%s)" %(source, e.message))
-			exit(1)
+			raise faaclib.ConfigError(parserConfig, "Incorrect value in %s (%s)" %(source, e))
 		try:
 			data[source]['prefix'] = parserConfig['DataSources'][source]['prefix']
 		except KeyError:
 			data[source]['prefix'] = source
-	
+
 
 	print("-----------------------------------------------------------------------")
 	print(" Start:  %s" %(startTime))
@@ -84,189 +115,266 @@ def main():
 	print(" Window: %s" %(timeWindow))
 	print("-----------------------------------------------------------------------")
 
-	
+
 	# Create time bins
-	if startTime and endTime:
-		timeBins = [startTime]
-		while timeBins[-1] < endTime:
-			timeBins.append(timeBins[-1] + timeWindow)
-	
+	timeBins = TimeBins(startTime, endTime, timeWindow)
 
-	outputDir = data[source]['output']
 	if not outputDir.endswith('/'):
 		outputDir = outputDir + '/'
 	if not os.path.exists(outputDir):
-		#os.mkdir(outputDir)
 		os.makedirs(outputDir)
-		if args.verbose:
+		if verbose:
 			print("** creating directory %s" %(outputDir))
 
 	# Split data
 	inputFiles = {}
-	prefix = {}
 	for source in data:
 		print("SOURCE: %s" %(source))
-	
+
 		try:
 			inputFiles[source] = glob.glob(data[source]['input'])
-			
-			# If the input data is in binary nfcapd, the data is preprocessed in the parsing process to obtain csv files.
-			# so change input file pointer to new csv files.
-			if 'nfcapd' in inputFiles[source][0]:
-				new_input = "/".join(data[source]['input'].split('/')[:-1]) + '/netflow*' 
-				inputFiles[source] = glob.glob(new_input)
-
-			prefix[source] = data[source]['prefix']
-		
 		except:
 			pass
-		
+
 	for source in inputFiles:
 		if inputFiles[source] == []:
-			data.pop(source)		
+			data.pop(source)
 
 	print(startTime)
-	current_year = startTime.year
-	# Process of splitting 
 
+	# Process of splitting: one job per file.
+	# With several processes, each file is split in its own part files,
+	# which are appended afterwards in the order of the files.
+	parallel = workers > 1
+	jobs = []
 	for source in data:
-
-		print(source + ":")
-
-		filecount = 0
+		data[source]['name'] = source
+		data[source]['files'] = len(inputFiles[source])
 		for path in inputFiles[source]:
-			if path.endswith('.gz'):
-		    		instream = gzip.open(path,'r')
-			else:
-				instream = open(path,'r')
-
-			filecount += 1
-			print("# %s/%s << %s" %(filecount, len(inputFiles[source]), os.path.split(path)[1]))
-
-			if data[source]['struc']:
-				linecount = 0
-				openedStreams = {}
-				order = []
-				line = instream.readline()
-
-				while line:
-					if not line.startswith('#') and line.strip():
-						t = getRecordTime(line, data[source]['col'], data[source]['timestamp_format'])
-						pos = searchBin(timeBins, t)
-
-						if pos is not None:
-							if pos not in openedStreams:
-								outputFile = outputDir + prefix[source] + timeBins[pos].strftime('-%Y%m%dt%H%M.csv')
-								openedStreams[pos] = open(outputFile, 'a')
-								order.append(pos)
-								if args.verbose:
-									print("   >> %s" %(os.path.split(outputFile)[1]))
-								if len(openedStreams) > 500:
-									old = order[0]
-									openedStreams[old].close()
-									del openedStreams[old]
-									del order[0]
-
-							openedStreams[pos].write(line)
-							linecount += 1
-					line = instream.readline()
-
-
-				print("   Exported %d lines" %(linecount))
-				print("   Elapsed: %s" %(prettyTime(time.time() - init)))
-
-			else:
-
-				logcount = 0
-				openedStreams = {}
-				order = []
-
-				line = instream.readline()
-				if line:
-					log = ""
-
-					while line:
-
-						log += line 
-
-						if len(log.split(SEPARATOR[source])) > 1:							
-							logExtract = log.split(SEPARATOR[source])[0] 
-
-							try:
-								t = getUnstructuredTime(logExtract,data[source]['timestamp_regexp'],data[source]['timestamp_format'], current_year )
-								pos = searchBin(timeBins,t)
-							except:
-								pos = None
+			jobs.append((path, data[source], timeBins, outputDir, len(jobs) if parallel else None))
 
-							if pos is not None:
-								if pos not in openedStreams:
-									outputFile = outputDir + prefix[source] + timeBins[pos].strftime('-%Y%m%dt%H%M.csv')
-									openedStreams[pos] = open(outputFile, 'a')
-									order.append(pos)
+	pool = None
+	if parallel and len(jobs) > 1:
+		pool = multiprocessing.Pool(min(workers, len(jobs)))
+		results = pool.imap(splitJob, jobs)
+	else:
+		results = map(splitJob, jobs)
 
-									if args.verbose:
-										print("   >> %s" %(os.path.split(outputFile)[1]))
-									if len(openedStreams) > 500:
-										old = order[0]
-										openedStreams[old].close()
-										del openedStreams[old]
-										del order[0]
-
-								openedStreams[pos].write(log)
-								logcount += 1
-
-							log = ""
-							for n in log.split(SEPARATOR[source])[1::]:
-								log += n
-
-						line = instream.readline()
-
-			    # Process last log:
-				try:
-					t = getUnstructuredTime(log,data[source]['timestamp_regexp'],data[source]['timestamp_format'], current_year)
-					pos = searchBin(timeBins,t)
+	try:
+		current = None
+		created = set()
+		for job, (count, outputs) in zip(jobs, results):
+			path, options, part = job[0], job[1], job[4]
 
-				except:
-					pos = None
+			if options is not current:
+				current = options
+				filecount = 0
+				print(options['name'] + ":")
 
-				if pos is not None:
-					if pos not in openedStreams:
-						outputFile = outputDir + prefix[source] + timeBins[pos].strftime('-%Y%m%dt%H%M.csv')
-						openedStreams[pos] = open(outputFile, 'a')
-						order.append(pos)
+			filecount += 1
+			print("# %s/%s << %s" %(filecount, options['files'], os.path.split(path)[1]))
 
-					openedStreams[pos].write(log)
-					logcount += 1
+			for outputFile in outputs:
+				if part is not None:
+					appendFile(outputFile + '.part%d' %(part), outputFile)
+				if verbose and outputFile not in created:
+					print("   >> %s" %(os.path.split(outputFile)[1]))
+				created.add(outputFile)
 
-				print("   Exported %d logs" %(logcount))
-				print("   Elapsed: %s" %(prettyTime(time.time() - init)))
+			if options['struc']:
+				print("   Exported %d lines" %(count))
+			else:
+				print("   Exported %d logs" %(count))
+			print("   Elapsed: %s" %(prettyTime(time.time() - init)))
+
+	finally:
+		if pool:
+			pool.terminate()
+			pool.join()
+
+
+def splitJob(job):
+	"""Splits a job of the pool of processes (see splitFile).
+	"""
+	return splitFile(*job)
+
+
+def splitFile(path, options, timeBins, outputDir, part=None):
+	"""Splits a data file in time windows.
+	The lines (or logs) are buffered by window, and appended to the window
+	files in bulk.
+	Returns the number of lines (or logs) exported and the list of window files.
+
+	path      -- Path to the data file (gzip compressed if it ends with '.gz', or nfcapd).
+	options   -- Dictionary of the split options of the source.
+	timeBins  -- TimeBins object.
+	outputDir -- Output directory.
+	part      -- Number of the part files to write instead of the window files.
+	"""
+	if options['struc']:
+		parser = TimeParser(options['timestamp_format'])
+	else:
+		parser = TimeParser(options['timestamp_format'], timeBins.start.year)
+
+	outputs = {}
+	buffers = {}
+	buffered = [0]
+	count = 0
+
+	def write(pos, text):
+		if pos not in buffers:
+			buffers[pos] = []
+			if pos not in outputs:
+				outputs[pos] = outputDir + options['prefix'] + timeBins.name(pos)
+		buffers[pos].append(text)
+		buffered[0] += len(text)
+		if buffered[0] > BUFFER_SIZE:
+			flush()
+
+	def flush():
+		for pos in buffers:
+			outputFile = outputs[pos]
+			if part is not None:
+				outputFile = outputFile + '.part%d' %(part)
+			with open(outputFile, 'a') as outstream:
+				outstream.writelines(buffers[pos])
+		buffers.clear()
+		buffered[0] = 0
+
+	if options['struc']:
+		if nfcapd.isNfcapd(path):
+			instream = closing(nfcapd.readFlows(path))
+		elif path.endswith('.gz'):
+			instream = gzip.open(path,'rt')
+		else:
+			instream = open(path,'r')
+
+		with instream as lines:
+			for line in lines:
+				if not line.startswith('#') and line.strip():
+					t = getRecordTime(line, options['col'], parser)
+					pos = timeBins.index(t)
+
+					if pos is not None:
+						write(pos, line)
+						count += 1
+
+	else:
+		pattern = re.compile(options['timestamp_regexp'])
+		separator = options['separator']
+
+		for log in faaclib.readLogs(path, separator):
+			try:
+				t = getUnstructuredTime(log, pattern, parser)
+				pos = timeBins.index(t)
+			except:
+				pos = None
+
+			if pos is not None:
+				write(pos, log + separator)
+				count += 1
+
+	flush()
+
+	# Windows shorter than a minute share their files
+	files = []
+	for pos in sorted(outputs):
+		if outputs[pos] not in files:
+			files.append(outputs[pos])
+
+	return count, files
+
+
+def appendFile(partFile, outputFile):
+	"""Appends a part file to its window file, and removes it.
+	"""
+	with open(partFile, 'r') as instream:
+		with open(outputFile, 'a') as outstream:
+			shutil.copyfileobj(instream, outstream)
+	os.remove(partFile)
+
+
+class TimeBins(object):
+	"""Time windows of the split.
+
+	The windows start every 'window' from the start time, until the first
+	one that is not earlier than the end time. The window of a timestamp is
+	computed arithmetically from the start time.
+
+	Class Attributes:
+		start  -- Start time of the first window.
+		end    -- Start time of the last window.
+		window -- Duration of each window (timedelta).
+	"""
+	def __init__(self, start, end, window):
+		self.start = start
+		self.window = window
+		self.end = start
+		while self.end < end:
+			self.end += window
+
+	def index(self, t):
+		"""Returns the number of the window of a timestamp;
+		None, if it is out of the split interval.
+		"""
+		if t < self.start or t > self.end:
+			return None
+		return (t - self.start) // self.window
+
+	def name(self, pos):
+		"""Returns the suffix of the file of a window.
+		"""
+		return (self.start + pos * self.window).strftime('-%Y%m%dt%H%M.csv')
+
+
+class TimeParser(object):
+	"""Cached parser of the timestamps of a source.
+
+	Consecutive records usually share their timestamps, so each distinct
+	timestamp is only parsed once. The '%Y-%m-%d %H:%M:%S' format (nfdump)
+	is parsed by position instead of with strptime.
+
+	Class Attributes:
+		dateFormat -- Timestamp format (see datetime.strptime).
+		year       -- Year of the timestamps without year.
+	"""
+	def __init__(self, dateFormat, year=None):
+		self.dateFormat = dateFormat
+		self.year = year
+		self.fast = (dateFormat == '%Y-%m-%d %H:%M:%S')
+		self.cache = {}
+
+	def parse(self, date_string):
+		"""Converts a timestamp into a datetime object.
+		Raises ValueError if it does not follow the format.
+		"""
+		try:
+			return self.cache[date_string]
+		except KeyError:
+			pass
 
-		for s in openedStreams:
-			openedStreams[s].close()
-			
+		s = date_string
+		if self.fast and len(s) == 19 and s[4] == '-' and s[7] == '-' and s[10] == ' ' and s[13] == ':' and s[16] == ':':
+			d = datetime(int(s[0:4]), int(s[5:7]), int(s[8:10]), int(s[11:13]), int(s[14:16]), int(s[17:19]))
+		else:
+			d = datetime.strptime(s, self.dateFormat)
+			if d.year == 1900 and self.year:
+				d = d.replace(year = self.year)
 
+		if len(self.cache) > 100000:
+			self.cache.clear()
+		self.cache[date_string] = d
+		return d
 
-def searchBin(bins, t):
-	pos = bisect_right(bins, t) - 1
-	return pos if t >= bins[0] and t<=bins[-1] else None
 
-def getRecordTime(line, col, dateFormat):
+def getRecordTime(line, col, parser):
 	valueList = line.split(',')
 	rawTime = valueList[col].split('.')[0]
-	time = datetime.strptime(rawTime, dateFormat)
-	return time
-
-def getUnstructuredTime (log, patern, dateFormat, current_year):
-
-	p = re.search(patern,log)
-	date_string = p.group(0)
-
-	d = datetime.strptime(date_string,dateFormat)
-	if d.year == 1900:
-	# 	d = d.replace(year = datetime.now().year)
-		d = d.replace(year = current_year)
+	return parser.parse(rawTime)
 
-	return d
+def getUnstructuredTime (log, patern, parser):
+	p = patern.search(log)
+	return parser.parse(p.group(0))
 
 def prettyTime(elapsed):
 	hours = int(elapsed // 3600)
@@ -280,7 +388,7 @@ def prettyTime(elapsed):
 	return pretty
 
 def getConfiguration(config_file):
-	stream = file(config_file, 'r')
+	stream = open(config_file, 'r')
 	conf = yaml.load(stream)
 	stream.close()
 	return conf
@@ -13,4 +13,7 @@ setup(name='fcparser',
       install_requires=[
           'IPy', 'pyyaml'
       ],
+      extras_require={
+          'columnar': ['numpy', 'pandas']
+      },
       zip_safe=False)
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the columnar parsing engine: it must produce the same observations
+as the records engine (parseRecords).
+
+Run from src/fcparser: python -m pytest tests
+"""
+
+import os
+import sys
+import random
+import shutil
+import tempfile
+import unittest
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fcparser import fcparser, faaclib
+
+try:
+	from fcparser import columnar
+except ImportError:
+	columnar = None
+
+CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Example', 'config', 'netflow.yaml')
+
+
+def netflowLines(n, seed=0):
+	"""Lines of nfdump CSV output, with some values out of the features of the configuration.
+	"""
+	rnd = random.Random(seed)
+	ips = ['192.168.1.2', '192.168.1.11', '10.0.0.1', '8.8.8.8', '147.156.1.1', 'bad']
+	lines = []
+	for i in range(n):
+		fields = ['2017-01-01 10:00:%02d' %(i % 60), '2017-01-01 10:01:00', '%.3f' %(rnd.random()),
+			rnd.choice(ips), rnd.choice(ips), str(rnd.choice([0, 22, 53, 80, 443, 8080, 49641])),
+			str(rnd.choice([21, 25, 53, 80, 161, 443, 3389])), rnd.choice(['TCP', 'UDP', 'ICMP', 'GRE']),
+			rnd.choice(['.AP.S.', '....S.', '...R..', '......']), '0', str(rnd.choice([0, 16, 32])),
+			str(rnd.randint(1, 100)), str(rnd.randint(40, 100000)), '0', '0',
+			str(rnd.randint(0, 3)), str(rnd.randint(0, 3))] + ['0'] * 30 + [str(100000 + i)]
+		lines.append(','.join(fields) + '\n')
+	return lines
+
+
+def observations(obsBatch):
+	return dict((key, (list(obs.data), obs.nObs)) for key, obs in obsBatch.observations.items())
+
+
+@unittest.skipIf(columnar is None, "The columnar engine requires numpy and pandas")
+class ColumnarTest(unittest.TestCase):
+
+	def setUp(self):
+		with open(CONFIG) as f:
+			config = yaml.safe_load(f)
+		self.parser = fcparser.FCParser(config)
+		self.path = tempfile.mkdtemp()
+		self.input_path = os.path.join(self.path, 'netflow.csv')
+		self.lines = netflowLines(500)
+		with open(self.input_path, 'w') as f:
+			f.writelines(self.lines)
+
+	def tearDown(self):
+		shutil.rmtree(self.path)
+
+	def parse(self, engine, keys, chunksize=64):
+		return fcparser.parseFile('netflow', self.input_path, self.parser.variables, self.parser.plan,
+			True, None, keys, engine, chunksize)
+
+	def test_same_observations(self):
+		for keys in (None, 'src_ip', ['src_ip', 'dst_port']):
+			records, nRecords = fcparser.parseRecords(self.lines, self.parser.variables, self.parser.plan, True, keys)
+			columns, nColumns = self.parse('columnar', keys)
+			self.assertEqual(nRecords, nColumns)
+			self.assertEqual(observations(records), observations(columns))
+
+	def test_malformed_file(self):
+		# Extra columns: parsed with the records engine
+		with open(self.input_path, 'a') as f:
+			f.write(self.lines[0].rstrip('\n') + ',x,y\n')
+
+		records, nRecords = self.parse('records', 'src_ip')
+		columns, nColumns = self.parse('columnar', 'src_ip')
+		self.assertEqual(nRecords, nColumns)
+		self.assertEqual(observations(records), observations(columns))
+
+	def test_malformed_error(self):
+		error = columnar.MalformedFileError(self.input_path, 'Expected 48 fields')
+		self.assertIn(self.input_path, error.msg)
+
+
+if __name__ == '__main__':
+	unittest.main()